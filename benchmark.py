@@ -0,0 +1,736 @@
+#!/usr/bin/env python3
+"""
+Meme Generator Agent - Benchmarks
+
+Measures the cost of the meme pipeline and of the optimizations around it.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --only template-selection
+"""
+
+import argparse
+import random
+import time
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.template_selector import TemplateSelector, TemplateStatsStore
+from src.structured_logging import configure_logging
+
+
+def print_header(title: str):
+    """Print a benchmark section header"""
+    print("\n" + "=" * 60)
+    print(title)
+    print("=" * 60)
+
+
+def benchmark_template_selection(num_requests: int = 2000, retry_limit: int = 3, seed: int = 0):
+    """
+    Simulate the retry loop to compare LLM calls per accepted meme
+
+    Each simulated template has a hidden probability of reaching the humor
+    threshold. An attempt costs one description expansion, one to three
+    caption generations and one scoring call, like MemeAgent.generate_meme.
+    """
+    print_header("Template selection: LLM calls per accepted meme")
+
+    acceptance = [0.05, 0.10, 0.45, 0.20, 0.60, 0.08, 0.30, 0.15]
+    candidates = [{"id": str(i), "name": f"Template {i}"} for i in range(len(acceptance))]
+    keywords = ["cat", "dog", "monday", "coffee"]
+
+    def simulate(strategy: str):
+        rng = random.Random(seed)
+        selector = None
+        if strategy != "first-match":
+            selector = TemplateSelector(TemplateStatsStore(), strategy=strategy, rng=random.Random(seed))
+
+        calls = accepted = 0
+        for _ in range(num_requests):
+            keyword = rng.choice(keywords)
+            for _ in range(retry_limit):
+                template = selector.select(keyword, candidates) if selector else candidates[0]
+
+                attempt_calls = 1
+                caption_ok = False
+                for _ in range(3):
+                    attempt_calls += 1
+                    if rng.random() < 0.7:
+                        caption_ok = True
+                        break
+
+                passed = False
+                if caption_ok:
+                    attempt_calls += 1
+                    passed = rng.random() < acceptance[int(template["id"])]
+
+                calls += attempt_calls
+                if selector:
+                    selector.record(keyword, template, passed, attempt_calls)
+                if passed:
+                    accepted += 1
+                    break
+        return calls, accepted
+
+    baseline = None
+    print(f"{'strategy':<14}{'accepted':>10}{'llm calls':>12}{'calls/accept':>14}{'reduction':>11}")
+    for strategy in ("first-match", "thompson", "ucb"):
+        calls, accepted = simulate(strategy)
+        per_accept = calls / max(accepted, 1)
+        baseline = baseline or per_accept
+        reduction = 1 - per_accept / baseline
+        print(f"{strategy:<14}{accepted:>10}{calls:>12}{per_accept:>14.2f}{reduction:>10.0%}")
+
+
+BENCHMARK_PROMPTS = [
+    "You are a witty meme creator. Make it sarcastic.\nWrite ONE funny meme about 'cat'.\nTop text:",
+    "You are a witty meme creator. Make it absurd.\nWrite ONE funny meme about 'monday'.\nTop text:",
+    "Short image caption: \"a man looking at another woman\"\nRewrite this into a detailed scene description.",
+    "Short image caption: \"a dog sitting in a burning room\"\nRewrite this into a detailed scene description.",
+]
+
+
+def benchmark_speculative_decoding(rounds: int = 2):
+    """
+    Compare plain and draft-assisted decoding of the text model
+
+    Greedy outputs must match exactly; sampled runs report tokens/sec and
+    the fraction of draft tokens accepted by the target model.
+    """
+    print_header("Speculative decoding: tokens/sec and draft acceptance")
+
+    from src.config import Config
+    from src.models import ModelManager
+
+    Config.SPECULATIVE_DECODING = True
+    manager = ModelManager()
+    manager.initialize()
+
+    # call_site "benchmark" is not in SPECULATIVE_CALL_SITES, so it uses the plain decoder
+    identical = sum(
+        manager.generate(prompt, call_site="benchmark") == manager.generate(prompt, call_site="caption")
+        for prompt in BENCHMARK_PROMPTS
+    )
+    print(f"Greedy outputs identical: {identical}/{len(BENCHMARK_PROMPTS)}")
+
+    manager.reset_generation_stats()
+    for _ in range(rounds):
+        for prompt in BENCHMARK_PROMPTS:
+            for call_site in ("benchmark", "caption"):
+                manager.generate(prompt, call_site=call_site, temperature=0.95, top_p=0.95)
+
+    stats = manager.generation_stats()
+    print(f"{'mode':<14}{'calls':>8}{'tokens':>10}{'tokens/sec':>12}{'acceptance':>12}")
+    for mode, mode_stats in stats.items():
+        acceptance = f"{mode_stats['acceptance_rate']:.0%}" if "acceptance_rate" in mode_stats else "-"
+        print(f"{mode:<14}{mode_stats['calls']:>8}{mode_stats['new_tokens']:>10}"
+              f"{mode_stats['tokens_per_sec']:>12.1f}{acceptance:>12}")
+
+
+def benchmark_description_modes(num_templates: int = 5, keyword: str = "monday"):
+    """
+    Compare the LLM and fast image description modes
+
+    Each template is described in both modes; the description then feeds
+    the normal caption and scoring steps so quality can be compared too.
+    """
+    print_header("Image description modes: latency and downstream humor score")
+
+    from src.meme_agent import MemeAgent
+
+    agent = MemeAgent()
+    templates = agent.list_templates()[:num_templates]
+    if not templates:
+        print("No templates available (Imgflip unreachable?)")
+        return
+
+    print(f"{'mode':<8}{'describe s':>12}{'mean score':>12}{'captioned':>11}")
+    for mode in ("llm", "fast"):
+        latencies, scores = [], []
+        for template in templates:
+            start = time.perf_counter()
+            description = agent.image_processor.describe_image(template["url"], mode)
+            latencies.append(time.perf_counter() - start)
+
+            prompt = agent.caption_generator.generate_meme_prompt(keyword, description, template["name"])
+            top, bottom = agent.caption_generator.generate_clean_captions(prompt)
+            if top and bottom:
+                scores.append(agent.caption_generator.score_humor(top, bottom, keyword))
+
+        mean_score = sum(scores) / len(scores) if scores else 0.0
+        print(f"{mode:<8}{sum(latencies) / len(latencies):>12.2f}{mean_score:>12.2f}"
+              f"{len(scores):>6}/{len(templates)}")
+
+
+def benchmark_cold_start(snapshot_dir: str = None):
+    """
+    Compare model start-up time from the hub cache and from a local snapshot
+    """
+    print_header("Cold start: hub vs snapshot")
+
+    import tempfile
+    from src.config import Config
+    from src.models import ModelManager
+
+    Config.MODEL_SNAPSHOT_DIR = None
+    manager = ModelManager()
+    manager.initialize()
+    hub_times = dict(manager.load_times)
+
+    snapshot_dir = snapshot_dir or Config.MODEL_SNAPSHOT_DIR or tempfile.mkdtemp(prefix="meme-snapshot-")
+    manager.save_snapshot(snapshot_dir)
+    del manager
+
+    Config.MODEL_SNAPSHOT_DIR = snapshot_dir
+    manager = ModelManager()
+    manager.initialize()
+    snapshot_times = manager.load_times
+
+    print(f"{'model':<8}{'hub s':>10}{'snapshot s':>12}")
+    for name in hub_times:
+        print(f"{name:<8}{hub_times[name]:>10.2f}{snapshot_times.get(name, 0.0):>12.2f}")
+
+
+def benchmark_prompt_budget(num_templates: int = 5, keyword: str = "monday", budgets=(None, 320, 192)):
+    """
+    Compare caption prompts built with and without a token budget
+
+    Each template is described once; the description then feeds prompts
+    built under each budget, reporting prompt tokens, caption latency and
+    the downstream humor score.
+    """
+    print_header("Prompt token budget: prompt tokens, caption latency and humor score")
+
+    from src.meme_agent import MemeAgent
+
+    agent = MemeAgent()
+    templates = agent.list_templates()[:num_templates]
+    if not templates:
+        print("No templates available (Imgflip unreachable?)")
+        return
+    descriptions = [(t, agent.image_processor.describe_image(t["url"])) for t in templates]
+
+    generator = agent.caption_generator
+    print(f"{'budget':<8}{'prompt tok':>12}{'caption s':>11}{'mean score':>12}{'captioned':>11}")
+    for budget in budgets:
+        generator.prompt_builder.token_budget = budget
+        tokens, latencies, scores = [], [], []
+        for template, description in descriptions:
+            prompt = generator.generate_meme_prompt(keyword, description, template["name"])
+            tokens.append(generator.prompt_builder.count_tokens(prompt))
+
+            start = time.perf_counter()
+            top, bottom = generator.generate_clean_captions(prompt)
+            latencies.append(time.perf_counter() - start)
+            if top and bottom:
+                scores.append(generator.score_humor(top, bottom, keyword))
+
+        mean_score = sum(scores) / len(scores) if scores else 0.0
+        print(f"{str(budget or 'none'):<8}{sum(tokens) / len(tokens):>12.0f}"
+              f"{sum(latencies) / len(latencies):>11.2f}{mean_score:>12.2f}"
+              f"{len(scores):>6}/{len(descriptions)}")
+
+
+def benchmark_blip_backends(num_images: int = 8, rounds: int = 2):
+    """
+    Compare BLIP vision encoder backends on synthetic images
+
+    Reports images/sec of the vision encoder alone and of full captioning
+    (encoder plus text decoder) for each backend against eager PyTorch.
+    """
+    print_header("BLIP backends: images/sec vs eager")
+
+    import torch
+    from PIL import Image
+    from src.blip_backend import BlipVisionEncoder
+    from src.image_processor import ImageProcessor
+    from src.models import ModelManager
+
+    manager = ModelManager()
+    processor = ImageProcessor(manager)
+    rng = random.Random(0)
+    pixel_values = [
+        processor._pixel_values(Image.new("RGB", (500, 400), tuple(rng.randrange(256) for _ in range(3))))
+        for _ in range(num_images)
+    ]
+
+    baseline = None
+    print(f"{'backend':<10}{'running':<10}{'encoder img/s':>15}{'caption img/s':>15}{'speedup':>10}")
+    for backend in BlipVisionEncoder.BACKENDS:
+        encoder = BlipVisionEncoder(manager, backend)
+        manager.blip_vision = encoder
+        encoder(pixel_values[0])  # setup, export/compile and the check against eager
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for values in pixel_values:
+                encoder(values)
+        encode_rate = rounds * num_images / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for values in pixel_values:
+                processor._decode_captions(encoder(values), [""])
+        caption_rate = num_images / (time.perf_counter() - start)
+
+        baseline = baseline or caption_rate
+        print(f"{backend:<10}{encoder.backend:<10}{encode_rate:>15.2f}{caption_rate:>15.2f}"
+              f"{caption_rate / baseline:>9.2f}x")
+
+
+def benchmark_tournament(num_requests: int = 4, keyword: str = "monday", k: int = 4, retry_limit: int = 3):
+    """
+    Compare sequential retries with tournament rounds
+
+    Reports wall time, LLM calls and acceptance per request for the normal
+    retry loop and for tournaments of k templates.
+    """
+    print_header("Tournament mode: latency per accepted meme")
+
+    from src.meme_agent import MemeAgent
+
+    agent = MemeAgent()
+    if not agent.list_templates():
+        print("No templates available (Imgflip unreachable?)")
+        return
+
+    original_size = agent.config.TOURNAMENT_SIZE
+    print(f"{'mode':<14}{'accepted':>10}{'llm calls':>11}{'s/request':>11}{'s/accept':>10}")
+    for mode, size in (("sequential", 1), (f"tournament-{k}", k)):
+        agent.config.TOURNAMENT_SIZE = size
+        calls_before = agent.model_manager.total_llm_calls
+        accepted = 0
+        start = time.perf_counter()
+        for _ in range(num_requests):
+            if agent.generate_meme_result(keyword, retry_limit):
+                accepted += 1
+        elapsed = time.perf_counter() - start
+        calls = agent.model_manager.total_llm_calls - calls_before
+        per_accept = f"{elapsed / accepted:.1f}" if accepted else "-"
+        print(f"{mode:<14}{accepted:>10}{calls:>11}{elapsed / num_requests:>11.1f}{per_accept:>10}")
+    agent.config.TOURNAMENT_SIZE = original_size
+
+
+def benchmark_single_flight(concurrency: int = 8, num_templates: int = 2):
+    """
+    Compare concurrent requests for the same templates with and without single-flight
+
+    Each round sends `concurrency` simultaneous describe_image calls for
+    every template, starting from an empty description cache.
+    """
+    print_header("Single-flight: concurrent requests for popular templates")
+
+    from concurrent.futures import ThreadPoolExecutor
+    from src.image_processor import ImageProcessor
+    from src.imgflip_api import ImgflipAPI
+
+    processor = ImageProcessor()
+    templates = ImgflipAPI().get_all_templates()[:num_templates]
+    if not templates:
+        print("No templates available (Imgflip unreachable?)")
+        return
+
+    flights = (processor.download_flight, processor.describe_flight, processor.model_manager.generation_flight)
+    print(f"{'single-flight':<15}{'wall s':>8}{'llm calls':>11}{'downloads':>11}{'coalesced':>11}")
+    for enabled in (False, True):
+        for flight in flights:
+            flight.enabled = enabled
+        processor._descriptions.clear()
+        calls_before = processor.model_manager.total_llm_calls
+        before = [flight.stats() for flight in flights]
+        urls = [t["url"] for t in templates for _ in range(concurrency)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            list(pool.map(processor.describe_image, urls))
+        elapsed = time.perf_counter() - start
+
+        after = [flight.stats() for flight in flights]
+        downloads = after[0]["executed"] - before[0]["executed"]
+        coalesced = sum(a["coalesced"] - b["coalesced"] for a, b in zip(after, before))
+        calls = processor.model_manager.total_llm_calls - calls_before
+        print(f"{'on' if enabled else 'off':<15}{elapsed:>8.1f}{calls:>11}{downloads:>11}{coalesced:>11}")
+
+
+def benchmark_logging(records_per_thread: int = 2000, threads: int = 8):
+    """
+    Measure what logging a model output costs the calling thread
+
+    Compares synchronous print() with the structured logger's queued writer
+    (DEBUG enabled, sampled, and disabled at the default INFO level), once
+    writing to a file and once to a slow sink standing in for a terminal or
+    log pipeline. "caller us" is the time the generating threads spend per
+    record; "dropped" counts records the full queue refused.
+    """
+    print_header("Logging: per-record overhead under concurrency")
+
+    import io
+    import logging
+    import tempfile
+    import threading
+    from src.structured_logging import shutdown_logging, dropped_records
+
+    output = "Top text: When the build passes on the first try\nBottom text: " + "and nobody believes you " * 20
+    logger = logging.getLogger("src.benchmark")
+
+    class SlowSink(io.StringIO):
+        def write(self, text):
+            time.sleep(0.0001)
+            return len(text)
+
+    def run(emit):
+        def work():
+            for i in range(records_per_thread):
+                emit(i)
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return (time.perf_counter() - start) / (records_per_thread * threads) * 1e6
+
+    lock = threading.Lock()
+
+    def emit_print(i):
+        with lock:  # concurrent print() calls interleave their lines without it
+            print(f"Model Output (Attempt {i + 1}): {output}", flush=True)
+
+    print(f"{threads} threads x {records_per_thread} records of {len(output)} chars")
+    print(f"{'sink':<15}{'mode':<24}{'caller us':>11}{'dropped':>9}")
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        for sink_name in ("file", "slow terminal"):
+            for mode, verbose, rate in (("print (sync)", None, None), ("logger debug", True, 1.0),
+                                        ("logger debug 10%", True, 0.1), ("logger debug disabled", False, 1.0)):
+                if sink_name == "file":
+                    sink = open(os.path.join(tmp, f"{mode}.log"), "w", encoding="utf-8")
+                else:
+                    sink = SlowSink()
+                try:
+                    sys.stdout = sink
+                    if verbose is None:
+                        caller, dropped = run(emit_print), 0
+                    else:
+                        configure_logging(verbose=verbose, json_path="", sample_rate=rate)
+                        caller = run(lambda i: logger.debug("Model output (attempt %d): %s", i + 1, output))
+                        dropped = dropped_records()
+                        shutdown_logging()
+                finally:
+                    sys.stdout = stdout
+                    sink.close()
+                print(f"{sink_name:<15}{mode:<24}{caller:>11.1f}{dropped:>9}")
+    configure_logging()
+
+
+class _SleepAgent:
+    """Stand-in agent whose memes take a fixed time, to measure queue overhead alone"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def generate_meme_result(self, keyword, retry_limit=3, deadline=None):
+        time.sleep(self.seconds)
+        return {"url": f"https://example.invalid/{keyword}", "keyword": keyword}
+
+
+def _fleet_worker(path: str, seconds: float, ready, start):
+    from src.fleet import FleetWorker
+    from src.job_queue import SQLiteJobQueue
+
+    worker = FleetWorker(_SleepAgent(seconds), SQLiteJobQueue(path))
+    ready.release()
+    start.wait()
+    worker.run()
+
+
+def benchmark_fleet(num_jobs: int = 120, seconds: float = 0.05, worker_counts=(1, 2, 4)):
+    """
+    Measure fleet throughput as worker processes are added
+
+    Each worker leases jobs from one SQLite queue and "generates" a meme by
+    sleeping, so the result shows how close the queue gets to linear
+    scaling and how much per-job overhead leasing adds.
+    """
+    print_header("Fleet mode: shared SQLite queue scaling")
+
+    import tempfile
+    import multiprocessing
+    import contextlib
+    import io
+    from src.job_queue import SQLiteJobQueue
+
+    print(f"{num_jobs} jobs of {seconds * 1000:.0f} ms each")
+    print(f"{'workers':<10}{'jobs/s':>10}{'scaling':>10}{'overhead/job':>14}")
+    baseline = None
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fleet.db")
+            queue = SQLiteJobQueue(path)
+            queue.enqueue(f"keyword {i}" for i in range(num_jobs))
+
+            # Timing starts once every worker has imported its modules
+            ready, go = multiprocessing.Semaphore(0), multiprocessing.Event()
+            with contextlib.redirect_stdout(io.StringIO()):
+                processes = [multiprocessing.Process(target=_fleet_worker, args=(path, seconds, ready, go))
+                             for _ in range(workers)]
+                for process in processes:
+                    process.start()
+                for _ in processes:
+                    ready.acquire()
+                start = time.perf_counter()
+                go.set()
+                # Idle workers poll every FLEET_POLL_INTERVAL before exiting, so time the drain instead
+                while not queue.is_drained():
+                    time.sleep(0.01)
+                elapsed = time.perf_counter() - start
+                for process in processes:
+                    process.join()
+
+            done = queue.counts()["done"]
+            queue.close()
+        rate = done / elapsed
+        baseline = baseline or rate
+        overhead = elapsed * workers / max(done, 1) - seconds
+        print(f"{workers:<10}{rate:>10.1f}{rate / baseline:>9.2f}x{overhead * 1000:>11.1f} ms")
+
+
+def benchmark_core_partition(num_requests: int = 6, keyword: str = "monday", concurrency: int = 2):
+    """
+    Compare the serial layout with BLIP and the text model on partitioned cores
+
+    Serial runs one request at a time with both models on every core;
+    pipelined runs `concurrency` requests at once, with each model on its
+    own cores and executor, so one request's image description overlaps
+    another's caption generation. Description and LLM caches are cleared
+    before each mode.
+    """
+    print_header("Core partitioning: serial vs pipelined BLIP and text model")
+
+    from concurrent.futures import ThreadPoolExecutor
+    from src.core_partition import PartitionedExecutors
+    from src.meme_agent import MemeAgent
+
+    agent = MemeAgent()
+    if not agent.list_templates():
+        print("No templates available (Imgflip unreachable?)")
+        return
+    agent.model_manager.initialize()
+    agent.model_manager.cache = None
+
+    print(f"{'layout':<12}{'memes/s':>9}{'wall s':>8}{'vision s':>10}{'text s':>8}{'overlap s':>11}")
+    for layout, workers, executors in (("serial", 1, None), ("pipelined", concurrency, PartitionedExecutors())):
+        agent.model_manager.executors = executors
+        agent.image_processor._descriptions.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda _: agent.generate_meme_result(keyword, 1), range(num_requests)))
+        elapsed = time.perf_counter() - start
+        memes = sum(result is not None for result in results)
+        stats = executors.stats() if executors else None
+        busy = (f"{stats['vision']['busy_seconds']:>10.1f}{stats['text']['busy_seconds']:>8.1f}"
+                f"{stats['overlap_seconds']:>11.1f}" if stats else f"{'-':>10}{'-':>8}{'-':>11}")
+        print(f"{layout:<12}{num_requests / elapsed:>9.2f}{elapsed:>8.1f}{busy}")
+        if executors:
+            print(f"  (vision cores {stats['vision']['cores']}, text cores {stats['text']['cores']}; "
+                  f"{memes}/{num_requests} memes accepted)")
+            executors.shutdown()
+    agent.model_manager.executors = None
+
+
+def benchmark_continuous_batching(num_requests: int = 24, concurrency: int = 8):
+    """
+    Compare per-request generate() calls with the continuous batching engine under mixed load
+
+    `concurrency` threads issue a mix of short scoring replies and long
+    description expansions, as concurrent requests do. Reports generated
+    tokens per second over the whole run and the median latency of the
+    short scoring calls.
+    """
+    print_header("Continuous batching: tokens/sec under mixed load")
+
+    from concurrent.futures import ThreadPoolExecutor
+    import numpy as np
+    from src.models import ModelManager
+
+    manager = ModelManager()
+    manager.cache = None
+    tokenizer, model = manager.tokenizer, manager._text_model
+    scoring = ("scoring", BENCHMARK_PROMPTS[0], 8)
+    expansion = ("expansion", BENCHMARK_PROMPTS[2], manager.config.MAX_NEW_TOKENS)
+    jobs = [scoring if i % 2 == 0 else expansion for i in range(num_requests)]
+
+    def run(job):
+        call_site, prompt, max_new_tokens = job
+        start = time.perf_counter()
+        manager.generate(prompt, call_site=call_site, max_new_tokens=max_new_tokens)
+        return call_site, time.perf_counter() - start, manager.last_token_counts[0][1]
+
+    print(f"{'mode':<12}{'tokens':>8}{'wall s':>8}{'tokens/s':>10}{'scoring p50 s':>15}{'mean batch':>12}")
+    for mode in ("generate", "continuous"):
+        manager._engine = manager._build_engine(tokenizer, model) if mode == "continuous" else None
+        run(scoring)  # Warm up; the engine sizes its KV cache on the first prefill
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(run, jobs))
+        elapsed = time.perf_counter() - start
+        tokens = sum(max(new, 0) for _, _, new in results)
+        short_p50 = np.median([latency for site, latency, _ in results if site == "scoring"])
+        batch = f"{manager.engine_stats()['mean_batch']:.1f}" if manager._engine else "-"
+        print(f"{mode:<12}{tokens:>8}{elapsed:>8.1f}{tokens / elapsed:>10.1f}{short_p50:>15.2f}{batch:>12}")
+    manager._engine = None
+
+
+def benchmark_export(num_memes: int = 1000, latency: float = 0.02, num_templates: int = 200):
+    """
+    Compare fetching rendered memes one by one with the concurrent exporter
+
+    Memes are rendered on a local Imgflip stand-in whose downloads take
+    `latency` seconds each, roughly a CDN round trip. The serial baseline
+    opens a connection per image, as a plain requests.get() loop does; the
+    exporter streams the same images into a tar with a manifest, then a
+    rerun shows what resuming a finished export costs.
+    """
+    print_header("Bulk export: serial downloads vs pooled concurrent export")
+
+    import tempfile
+    import requests
+    from src.local_imgflip import LocalImgflipServer
+    from src.meme_export import MemeExporter
+
+    with LocalImgflipServer(num_templates=num_templates, latency=latency) as server:
+        records = []
+        for i in range(num_memes):
+            template_id = str(100000 + i % num_templates)
+            url = requests.post(f"{server.url}/caption_image", data={"template_id": template_id}).json()["data"]["url"]
+            records.append({"keyword": f"keyword {i}", "url": url, "template_id": template_id,
+                            "template_name": f"Template {template_id}", "top_text": "top", "bottom_text": "bottom",
+                            "score": 8})
+
+        for template in server.templates():
+            requests.get(template["url"])  # Render every image once so neither mode pays for it
+        print(f"{num_memes} memes, {latency * 1000:.0f} ms per download, {num_templates} distinct images")
+        print(f"{'mode':<22}{'seconds':>9}{'memes/s':>10}{'stored':>8}")
+        sample = records[:max(num_memes // 10, 1)]
+        start = time.perf_counter()
+        for record in sample:
+            requests.get(record["url"]).content
+        serial = (time.perf_counter() - start) * num_memes / len(sample)
+        print(f"{'serial (extrapolated)':<22}{serial:>9.1f}{num_memes / serial:>10.1f}{'-':>8}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            exporter = MemeExporter(os.path.join(tmp, "memes.tar"))
+            for mode in ("export", "resume"):
+                summary = exporter.export(records)
+                stored = summary["exported"] - summary["duplicates"]
+                print(f"{mode:<22}{summary['seconds']:>9.2f}{num_memes / summary['seconds']:>10.1f}{stored:>8}")
+
+
+def benchmark_candidate_log(rows: int = 50000, threads: int = 4, chunk_rows: int = 4096):
+    """
+    Measure what logging a candidate costs the generating thread and the disk
+
+    Threads record caption and score candidates as fast as they can, with
+    chunks encoded and compressed on the log's writer thread. Compares the
+    JSON-lines humor score log, which appends under a lock per record.
+    """
+    print_header("Candidate log: hot-path cost and size per candidate")
+
+    import json
+    import tempfile
+    import threading
+    from src.config import Config
+    from src.candidate_log import CandidateLog, read_candidate_log, acceptance_rates
+
+    output = "\nTop text: When the build passes on the first try\nBottom text: And nobody believes you"
+    templates = [f"Template {i}" for i in range(50)]
+
+    def run(record):
+        def work(worker):
+            for i in range(worker, rows, threads):
+                record(i)
+        workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return (time.perf_counter() - start) / rows * 1e6
+
+    print(f"{rows} candidates from {threads} threads")
+    print(f"{'format':<22}{'caller us':>11}{'bytes/row':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        log = CandidateLog(os.path.join(tmp, "candidates"), chunk_rows=chunk_rows)
+        caller = run(lambda i: log.record(
+            "caption" if i % 2 else "score", "monday", templates[i % 50], Config.STYLE_HINTS[i % 5], output,
+            "ok" if i % 2 else "llm", "When the build passes", "And nobody believes you",
+            None if i % 2 else i % 10 + 1, True, 0.8, 220, 18,
+        ))
+        log.close()
+        size = sum(os.path.getsize(os.path.join(tmp, "candidates", f)) for f in os.listdir(os.path.join(tmp, "candidates")))
+        print(f"{'columnar chunks':<22}{caller:>11.1f}{size / rows:>11.1f}")
+
+        path, lock = os.path.join(tmp, "scores.jsonl"), threading.Lock()
+
+        def record_jsonl(i):
+            line = json.dumps({"keyword": "monday", "template": templates[i % 50], "raw_output": output,
+                               "top_text": "When the build passes", "bottom_text": "And nobody believes you",
+                               "score": i % 10 + 1}) + "\n"
+            with lock, open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+        caller = run(record_jsonl)
+        print(f"{'jsonl append':<22}{caller:>11.1f}{os.path.getsize(path) / rows:>11.1f}")
+
+        start = time.perf_counter()
+        columns = read_candidate_log(os.path.join(tmp, "candidates"))
+        groups = acceptance_rates(columns)
+        print(f"Query: {len(columns['stage'])} rows into {len(groups)} template/style groups "
+              f"in {time.perf_counter() - start:.2f}s")
+
+
+BENCHMARKS = {
+    "template-selection": benchmark_template_selection,
+    "speculative-decoding": benchmark_speculative_decoding,
+    "description-modes": benchmark_description_modes,
+    "cold-start": benchmark_cold_start,
+    "prompt-budget": benchmark_prompt_budget,
+    "blip-backends": benchmark_blip_backends,
+    "tournament": benchmark_tournament,
+    "fleet": benchmark_fleet,
+    "single-flight": benchmark_single_flight,
+    "logging": benchmark_logging,
+    "core-partition": benchmark_core_partition,
+    "continuous-batching": benchmark_continuous_batching,
+    "export": benchmark_export,
+    "candidate-log": benchmark_candidate_log,
+}
+
+
+def main():
+    """Run the selected benchmarks"""
+    parser = argparse.ArgumentParser(description="Meme Generator Agent benchmarks")
+    parser.add_argument(
+        "--only",
+        choices=sorted(BENCHMARKS),
+        action="append",
+        help="Run only the given benchmark (can be repeated)"
+    )
+    args = parser.parse_args()
+    configure_logging()
+
+    for name in args.only or BENCHMARKS:
+        start = time.perf_counter()
+        try:
+            BENCHMARKS[name]()
+        except ImportError as e:
+            print(f"Skipped {name}: missing dependency ({e})")
+            continue
+        print(f"({name} took {time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Report caption and humor acceptance rates from the candidate log
+
+Set CANDIDATE_LOG_DIR while generating memes to collect candidates, then:
+    python candidate_report.py --log candidates/
+    python candidate_report.py --log candidates/ --by style_hint --threshold 6
+    python candidate_report.py --log candidates/ --by template --min-scored 10
+"""
+
+import argparse
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import numpy as np
+
+from src.config import Config
+from src.candidate_log import CATEGORY_COLUMNS, acceptance_rates, format_acceptance_report, read_candidate_log
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Report acceptance rates from the candidate log")
+    parser.add_argument("--log", default=Config.CANDIDATE_LOG_DIR, help="Candidate log directory")
+    parser.add_argument("--by", default="template,style_hint",
+                        help=f"Comma-separated columns to group by, of {', '.join(CATEGORY_COLUMNS)} "
+                             "(default: %(default)s)")
+    parser.add_argument("--threshold", type=int, default=Config.HUMOR_SCORE_THRESHOLD,
+                        help="Score counted as accepted (default: %(default)s)")
+    parser.add_argument("--min-scored", type=int, default=1,
+                        help="Hide groups with fewer scored captions (default: 1)")
+    args = parser.parse_args()
+    if not args.log:
+        parser.error("--log is required when CANDIDATE_LOG_DIR is not set")
+    by = [name.strip() for name in args.by.split(",") if name.strip()]
+    unknown = set(by) - set(CATEGORY_COLUMNS)
+    if unknown:
+        parser.error(f"cannot group by {', '.join(sorted(unknown))}")
+
+    columns = read_candidate_log(args.log)
+    captions = columns["stage"] == "caption"
+    scores = (columns["stage"] == "score") & (columns["parse_result"] != "error")
+    print(f"Loaded {len(columns['stage'])} candidates: {captions.sum()} captions, {scores.sum()} scores")
+    if not scores.any():
+        return
+
+    # How the acceptance rate moves with the threshold, to see what a change would cost
+    for threshold in range(max(args.threshold - 2, 1), min(args.threshold + 2, 10) + 1):
+        rate = (columns["score"][scores] >= threshold).mean()
+        marker = "  <- current" if threshold == Config.HUMOR_SCORE_THRESHOLD else ""
+        print(f"  threshold {threshold:>2}: {rate:.1%} accepted{marker}")
+    outcomes, counts = np.unique(columns["parse_result"][captions], return_counts=True)
+    print("Caption outcomes: " + ", ".join(f"{o} {c / captions.sum():.0%}" for o, c in zip(outcomes, counts)))
+    print()
+    print(format_acceptance_report(acceptance_rates(columns, by, args.threshold), by, args.min_scored))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.meme_agent import MemeAgent
 from src.config import Config
+from src.structured_logging import configure_logging
 
 def example_single_meme():
     """Example: Generate a single meme"""
@@ -124,6 +125,7 @@ def example_error_handling():
 
 def main():
     """Run all examples"""
+    configure_logging()
     print("MEME GENERATOR AGENT - EXAMPLES")
     print("This script demonstrates various usage patterns.")
     print()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Load test the meme pipeline at stepped concurrency and arrival rates
+
+By default the models are stubs with fixed latencies and Imgflip is a local
+stand-in, so the test measures the pipeline's own queueing and overheads:
+    python loadtest.py --concurrency 1,2,4,8 --duration 20
+    python loadtest.py --concurrency 4 --rates 2,4,8,16 --stub-slots 2
+    python loadtest.py --real --concurrency 1,2 --duration 120 --report load_report.json
+
+Soak mode runs one pipeline after another and fails (exit status 1) when
+RSS keeps growing after warmup:
+    python loadtest.py --soak 5000 --max-growth-mb 50
+    python loadtest.py --soak 2000 --trace-frames 5   # also name the growing source lines
+"""
+
+import argparse
+import json
+import logging
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.config import Config
+from src.local_imgflip import LocalImgflipServer
+from src.load_test import LoadTest, format_report
+from src.memory_profiler import soak_test, format_soak_report
+from src.structured_logging import configure_logging, shutdown_logging
+
+
+def _numbers(text: str, cast):
+    return [cast(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Load test the meme pipeline")
+    models = parser.add_mutually_exclusive_group()
+    models.add_argument("--stub", dest="real", action="store_false", help="Use stub models (default)")
+    models.add_argument("--real", dest="real", action="store_true", help="Use the real models")
+    parser.set_defaults(real=False)
+    parser.add_argument("--live-imgflip", action="store_true",
+                        help="Call api.imgflip.com instead of a local stand-in (needs credentials)")
+    parser.add_argument("--imgflip-latency", type=float, default=0.0,
+                        help="Seconds added to each local Imgflip call (default: 0)")
+    parser.add_argument("--imgflip-error-rate", type=float, default=0.0,
+                        help="Fraction of local caption_image calls that fail (default: 0)")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="Comma-separated worker counts to step through (default: %(default)s)")
+    parser.add_argument("--rates", default=None,
+                        help="Comma-separated arrival rates per second; every concurrency is run at "
+                             "every rate (default: closed-loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per step (default: 30)")
+    parser.add_argument("--keywords", default="monday,coffee,cats,deadline,weekend",
+                        help="Comma-separated keywords requests cycle through (default: %(default)s)")
+    parser.add_argument("--retry-limit", type=int, default=3, help="Retry attempts per meme (default: 3)")
+    parser.add_argument("--deadline", type=float, default=None, help="Per-request deadline in seconds")
+    parser.add_argument("--p99-slo", type=float, default=Config.LOAD_TEST_P99_SLO,
+                        help="p99 latency target in seconds (default: %(default)s)")
+    parser.add_argument("--soak", type=int, metavar="N", default=None,
+                        help="Run N pipelines one after another and check memory growth instead of stepping load")
+    parser.add_argument("--max-growth-mb", type=float, default=Config.SOAK_MAX_GROWTH_MB,
+                        help="RSS growth after warmup that fails the soak test (default: %(default)s)")
+    parser.add_argument("--trace-frames", type=int, default=Config.MEMORY_TRACE_FRAMES,
+                        help="tracemalloc frames per allocation during a soak test; 0 is off (default: %(default)s)")
+    parser.add_argument("--stub-llm-ms", type=float, default=None,
+                        help="Stub text generation latency (default: 50, 0 when soaking)")
+    parser.add_argument("--stub-blip-ms", type=float, default=None,
+                        help="Stub BLIP latency (default: 50, 0 when soaking)")
+    parser.add_argument("--stub-slots", type=int, default=1, help="Stub model calls that run at once (default: 1)")
+    parser.add_argument("--accept-rate", type=float, default=0.5,
+                        help="Share of stub humor scores that pass the threshold (default: 0.5)")
+    parser.add_argument("--partition-cores", action="store_true",
+                        help="Run the vision and text models on separate cores and executors")
+    parser.add_argument("--report", default=None, help="Write the full report as JSON to this path")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Show the pipeline's own logging")
+    args = parser.parse_args()
+
+    configure_logging(verbose=args.verbose, level=None if args.verbose else "WARNING")
+    for name in ("src.load_test", "src.memory_profiler"):
+        logging.getLogger(name).setLevel(logging.INFO)
+    if args.deadline is not None:
+        Config.REQUEST_DEADLINE = args.deadline
+    if args.partition_cores:
+        Config.CORE_PARTITIONING = True
+    if args.soak:
+        Config.MEMORY_PROFILING = True
+        Config.MEMORY_TRACE_FRAMES = args.trace_frames
+    default_latency = 0.0 if args.soak else 50.0
+    llm_ms = args.stub_llm_ms if args.stub_llm_ms is not None else default_latency
+    blip_ms = args.stub_blip_ms if args.stub_blip_ms is not None else default_latency
+
+    server = None
+    if not args.live_imgflip:
+        server = LocalImgflipServer(latency=args.imgflip_latency, error_rate=args.imgflip_error_rate).start()
+        Config.IMGFLIP_API_URL = server.url
+
+    try:
+        if args.real:
+            from src.meme_agent import MemeAgent
+            agent = MemeAgent()
+        else:
+            from src.stub_models import build_stub_agent
+            agent = build_stub_agent(llm_ms / 1000, blip_ms / 1000, args.stub_slots, args.accept_rate, seed=0)
+        keywords = _numbers(args.keywords, str)
+
+        if args.soak:
+            report = soak_test(
+                lambda i: agent.generate_meme_result(keywords[i % len(keywords)], args.retry_limit),
+                args.soak, max_growth_bytes=int(args.max_growth_mb * 2**20), profiler=agent.memory_profiler,
+            )
+            format_fn = format_soak_report
+        else:
+            report = _run_load(agent, keywords, args)
+            format_fn = format_report
+        if server is not None:
+            report["imgflip_requests"] = dict(server.requests)
+    finally:
+        if server is not None:
+            server.stop()
+        shutdown_logging()
+
+    print()
+    print(format_fn(report))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.report}")
+    if args.soak and not report["passed"]:
+        sys.exit(1)
+
+
+def _run_load(agent, keywords, args):
+    """Step through the requested concurrency levels and arrival rates"""
+    concurrency = _numbers(args.concurrency, int)
+    rates = _numbers(args.rates, float) if args.rates else [None]
+    steps = [(c, r) for c in concurrency for r in rates]
+
+    load_test = LoadTest(agent, keywords, retry_limit=args.retry_limit)
+    return load_test.run(steps, duration=args.duration, p99_slo=args.p99_slo)
+
+
+if __name__ == "__main__":
+    main()
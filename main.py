@@ -12,9 +12,14 @@ Usage:
     python main.py --keyword "cat" --count 5
     python main.py --keyword "programming" --single
     python main.py --list-templates
+    python main.py --keywords-file keywords.txt --output memes.jsonl
+    python main.py --queue shared/fleet.db --keywords-file keywords.txt
+    python main.py --queue shared/fleet.db --fleet-worker
+    python main.py --output memes.jsonl --export memes.tar
 """
 
 import argparse
+import json
 import sys
 import os
 from typing import List
@@ -22,7 +27,14 @@ from typing import List
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
+from src.config import Config
+from src.structured_logging import configure_logging, dropped_records
 from src.meme_agent import MemeAgent
+from src.worker_pool import WorkerPool
+from src.batch_runner import BatchRunner, read_keywords_file
+from src.job_queue import SQLiteJobQueue
+from src.fleet import FleetWorker, attach_shared_caches
+from src.meme_export import MemeExporter, read_results_file
 
 def print_banner():
     """Print application banner"""
@@ -36,6 +48,82 @@ def print_banner():
     """
     print(banner)
 
+def print_stats(agent: MemeAgent):
+    """Print a short summary of the agent's runtime statistics"""
+    stats = agent.get_stats()
+    prefilter = stats["prefilter"]
+    if prefilter["evaluated"]:
+        print(f" Humor pre-filter settled {prefilter['llm_calls_avoided']:.0%} "
+              f"of {prefilter['evaluated']} scores without the LLM")
+    for call_site, cache in stats["llm"]["cache"].items():
+        print(f" LLM cache hit rate ({call_site}): {cache['hit_rate']:.0%}")
+    for name, flight in stats["single_flight"].items():
+        if flight["coalesced"]:
+            print(f" Single-flight ({name}): {flight['coalesced']} calls shared "
+                  f"{flight['executed']} computations")
+    if dropped_records():
+        print(f" Log writer fell behind; {dropped_records()} records dropped")
+    for name, model in stats["models"].items():
+        if model["unloads"]:
+            print(f" {name} model: resident {model['resident_seconds']:.0f}s, "
+                  f"{model['unloads']} unloads, {model['reloads']} reloads")
+    if stats["executors"]:
+        executors = stats["executors"]
+        print(f" Core partitioning: vision busy {executors['vision']['busy_seconds']:.0f}s, "
+              f"text busy {executors['text']['busy_seconds']:.0f}s, overlapped {executors['overlap_seconds']:.0f}s")
+    engine = stats["llm"]["engine"]
+    if engine.get("steps"):
+        print(f" Continuous batching: {engine['tokens_per_sec']:.1f} tokens/s, "
+              f"mean batch {engine['mean_batch']:.1f} over {engine['steps']} steps")
+    if stats["candidate_log"]:
+        log = stats["candidate_log"]
+        print(f" Candidate log: {log['rows'] + log['buffered']} candidates, "
+              f"{log['chunks']} chunks ({log['bytes'] / 1024:.0f} KiB) written")
+    if stats["memory"]:
+        print(f" Memory: RSS {stats['memory']['rss_bytes'] / 2**20:.0f} MiB")
+        for name, stage in stats["memory"]["stages"].items():
+            print(f"  {name}: {stage['rss_growth_bytes'] / 2**20:+.1f} MiB over {stage['calls']} calls "
+                  f"(largest {stage['max_rss_delta_bytes'] / 2**20:+.1f} MiB)")
+
+# Results file of batch mode when --output is not given
+DEFAULT_OUTPUT = "memes.jsonl"
+
+def run_export(records: List[dict], output: str):
+    """Download accepted memes into an archive or directory and print a summary"""
+    print(f"\n Exporting memes to {output}...")
+    summary = MemeExporter(output).export(records)
+    print(f" Exported {summary['exported']} memes ({summary['duplicates']} duplicate images, "
+          f"{summary['bytes'] / 2**20:.1f} MiB) in {summary['seconds']:.1f}s; {summary['skipped']} already exported, "
+          f"{summary['rejected']} not accepted, {summary['failed']} failed")
+
+def run_queue_command(args):
+    """Enqueue keywords into the fleet queue, or report its status and write or export finished results"""
+    queue = SQLiteJobQueue(args.queue)
+    if args.keywords_file:
+        added = queue.enqueue(read_keywords_file(args.keywords_file))
+        print(f" Enqueued {added} keywords into {args.queue}")
+    
+    counts = queue.counts()
+    print(f" Queue {args.queue}: {counts['pending']} pending, {counts['leased']} in progress, "
+          f"{counts['done']} done, {counts['failed']} failed")
+    
+    if args.keywords_file:
+        return
+    # A plain status check writes nothing; results are only written where asked
+    if args.output:
+        if os.path.exists(args.output) and not args.overwrite:
+            print(f" Error: {args.output} already exists; pass --overwrite to replace it")
+            sys.exit(1)
+        written = 0
+        with open(args.output, "w", encoding="utf-8") as f:
+            for record in queue.results():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+        print(f" Wrote {written} finished results to {args.output}")
+    if args.export:
+        records = read_results_file(args.output) if args.output else list(queue.results())
+        run_export(records, args.export)
+
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(
@@ -47,6 +135,12 @@ Examples:
   python main.py --keyword "programming" --single
   python main.py --list-templates
   python main.py --keyword "coffee" --count 1 --retry-limit 5
+  python main.py --keyword "cat" --count 16 --workers 8
+  python main.py --keywords-file keywords.txt --output memes.jsonl --concurrency 4
+  python main.py --save-snapshot ./snapshot
+  python main.py --queue shared/fleet.db --keywords-file keywords.txt
+  python main.py --queue shared/fleet.db --fleet-worker
+  python main.py --output memes.jsonl --export memes.tar
         """
     )
     
@@ -56,6 +150,60 @@ Examples:
         help="Keyword/topic for meme generation"
     )
     
+    parser.add_argument(
+        "--keywords-file", 
+        type=str, 
+        help="File with one keyword per line; generates one meme per keyword"
+    )
+    
+    parser.add_argument(
+        "--output", 
+        type=str, 
+        help=f"JSONL results file for --keywords-file (default: {DEFAULT_OUTPUT}); "
+             "with --queue, where to write the finished results"
+    )
+    
+    parser.add_argument(
+        "--overwrite", 
+        action="store_true",
+        help="Let --queue replace an existing --output file"
+    )
+    
+    parser.add_argument(
+        "--checkpoint", 
+        type=str, 
+        help="Checkpoint file used to resume --keywords-file runs (default: <output>.checkpoint)"
+    )
+    
+    parser.add_argument(
+        "--concurrency", 
+        type=int, 
+        default=1,
+        help="Keywords processed concurrently by the shared agent (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--queue", 
+        type=str, 
+        metavar="DB",
+        help="Shared SQLite job queue for fleet mode: enqueues --keywords-file, runs jobs with "
+             "--fleet-worker, otherwise prints the queue status and writes finished results to --output, if given"
+    )
+    
+    parser.add_argument(
+        "--fleet-worker", 
+        action="store_true",
+        help="Process jobs from --queue with a warm agent until the queue is drained"
+    )
+    
+    parser.add_argument(
+        "--export", 
+        type=str, 
+        metavar="PATH",
+        help="Download the accepted memes into PATH (.tar, .zip or a directory) with a JSON manifest; "
+             "without --keyword or --keywords-file, exports the results already in --output"
+    )
+    
     parser.add_argument(
         "--count", 
         type=int, 
@@ -76,23 +224,111 @@ Examples:
         help="Maximum retry attempts per meme (default: 3)"
     )
     
+    parser.add_argument(
+        "--workers", 
+        type=int, 
+        default=1,
+        help="Worker processes sharing one copy of the models; near-duplicate captions "
+             "are only rejected within each worker (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--description-mode", 
+        choices=["llm", "fast"],
+        help="Template description: LLM-rewritten BLIP caption or fast guided BLIP captions "
+             "(default: Config.DESCRIPTION_MODE)"
+    )
+    
+    parser.add_argument(
+        "--tournament", 
+        type=int, 
+        metavar="K",
+        help="Let K templates compete per round: captions and scores are batched and only the winner is rendered"
+    )
+    
+    parser.add_argument(
+        "--deadline", 
+        type=float, 
+        metavar="SECONDS",
+        help="Time limit per meme; when it runs out the best meme so far is returned "
+             "(default: Config.REQUEST_DEADLINE, no limit)"
+    )
+    
+    parser.add_argument(
+        "--save-snapshot", 
+        type=str, 
+        metavar="DIR",
+        help="Save the prepared models to DIR for fast restarts (set MODEL_SNAPSHOT_DIR=DIR to use it)"
+    )
+    
     parser.add_argument(
         "--list-templates", 
         action="store_true",
         help="List all available meme templates"
     )
     
+    parser.add_argument(
+        "--partition-cores", 
+        action="store_true",
+        help="Run BLIP and the text model on separate cores so concurrent requests overlap them "
+             "(batch mode with --concurrency 2 or more)"
+    )
+    
+    parser.add_argument(
+        "--continuous-batching", 
+        action="store_true",
+        help="Decode concurrent LLM calls together in one continuously refilled batch"
+    )
+    
+    parser.add_argument(
+        "--memory-profile", 
+        action="store_true",
+        help="Report how much memory each pipeline stage keeps (RSS growth per stage)"
+    )
+    
     parser.add_argument(
         "--verbose", 
         action="store_true",
-        help="Enable verbose output"
+        help="Log raw model outputs, captions and scores (DEBUG level, sampled by LOG_DEBUG_SAMPLE_RATE)"
+    )
+    
+    parser.add_argument(
+        "--log-json", 
+        type=str, 
+        metavar="FILE",
+        help="Also append every log record to FILE as JSON lines"
     )
     
     args = parser.parse_args()
+    configure_logging(verbose=args.verbose, json_path=args.log_json)
     
     # Print banner
     print_banner()
     
+    if args.description_mode:
+        Config.DESCRIPTION_MODE = args.description_mode
+    if args.deadline:
+        Config.REQUEST_DEADLINE = args.deadline
+    if args.tournament:
+        Config.TOURNAMENT_SIZE = args.tournament
+    if args.memory_profile:
+        Config.MEMORY_PROFILING = True
+    if args.partition_cores:
+        Config.CORE_PARTITIONING = True
+    if args.continuous_batching:
+        Config.CONTINUOUS_BATCHING = True
+    
+    if args.queue and not args.fleet_worker:
+        run_queue_command(args)
+        return
+    
+    if args.output is None:
+        args.output = DEFAULT_OUTPUT
+    
+    if args.export and not (args.keyword or args.keywords_file or args.fleet_worker):
+        run_export(read_results_file(args.output), args.export)
+        return
+    
     # Initialize the meme agent
     print("Initializing Meme Generator Agent...")
     try:
@@ -103,6 +339,10 @@ Examples:
         sys.exit(1)
     
     # Handle different commands
+    if args.save_snapshot:
+        agent.model_manager.save_snapshot(args.save_snapshot)
+        return
+    
     if args.list_templates:
         print("\n Fetching available meme templates...")
         templates = agent.list_templates()
@@ -113,6 +353,43 @@ Examples:
             print(f"  ... and {len(templates) - 10} more templates")
         return
     
+    if args.fleet_worker:
+        if not args.queue:
+            print(" Error: --fleet-worker needs --queue")
+            sys.exit(1)
+        attach_shared_caches(agent, args.queue)
+        worker = FleetWorker(agent, SQLiteJobQueue(args.queue), retry_limit=args.retry_limit)
+        try:
+            summary = worker.run()
+        except KeyboardInterrupt:
+            print("\n Worker stopped; its leased job will be retried by another worker")
+            sys.exit(0)
+        
+        print_stats(agent)
+        print(f"\n Worker finished: {summary['completed']} completed, {summary['failed']} failed, "
+              f"{summary['lost']} lost to other workers")
+        return
+    
+    if args.keywords_file:
+        keywords = read_keywords_file(args.keywords_file)
+        print(f"\n Starting batch run for {len(keywords)} keywords from '{args.keywords_file}'")
+        print(f" Results: {args.output}")
+        print("=" * 60)
+        
+        runner = BatchRunner(agent, args.output, args.checkpoint, args.concurrency, args.retry_limit)
+        try:
+            summary = runner.run(keywords)
+        except KeyboardInterrupt:
+            print("\n Batch interrupted by user; rerun the same command to resume")
+            sys.exit(0)
+        
+        print_stats(agent)
+        print(f"\n Batch finished: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+              f"{summary['skipped']} already done")
+        if args.export:
+            run_export(read_results_file(args.output), args.export)
+        return
+    
     if not args.keyword:
         print(" Error: Please provide a keyword using --keyword")
         print(" Example: python main.py --keyword 'cat'")
@@ -130,21 +407,34 @@ Examples:
     try:
         if count == 1:
             # Generate single meme
-            meme_url = agent.generate_meme(keyword, args.retry_limit)
-            if meme_url:
+            result = agent.generate_meme_result(keyword, args.retry_limit)
+            print_stats(agent)
+            if result:
                 print(f"\n SUCCESS! Your meme is ready:")
-                print(f"{meme_url}")
+                print(f"{result['url']}")
+                if args.export:
+                    run_export([result], args.export)
             else:
                 print("\n Failed to generate a meme. Try again with different settings.")
                 sys.exit(1)
         else:
             # Generate multiple memes
-            meme_urls = agent.generate_multiple_memes(keyword, count, args.retry_limit)
+            if args.workers > 1:
+                pool = WorkerPool(num_workers=args.workers, agent=agent)
+                results = pool.generate_memes([keyword] * count, args.retry_limit)
+                # Workers return only URLs, so these are exported without scores
+                results = [{"keyword": keyword, "url": url} for _, url in results if url]
+            else:
+                results = agent.generate_multiple_meme_results(keyword, count, args.retry_limit)
+            meme_urls = [result["url"] for result in results]
+            print_stats(agent)
             
             if meme_urls:
                 print(f"\n SUCCESS! Generated {len(meme_urls)} memes:")
                 for i, url in enumerate(meme_urls, 1):
                     print(f"  {i}. {url}")
+                if args.export:
+                    run_export(results, args.export)
             else:
                 print("\n Failed to generate any memes. Try again with different settings.")
                 sys.exit(1)
@@ -0,0 +1,241 @@
+"""
+Bulk keyword batch mode with streaming JSONL output and resume
+"""
+import logging
+import os
+import json
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+from .config import Config
+from .deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+def read_keywords_file(path: str) -> List[str]:
+    """
+    Read keywords from a text file
+
+    Args:
+        path: File with one keyword per line; blank lines and # comments are skipped
+
+    Returns:
+        List of keywords in file order
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _format_duration(seconds: float) -> str:
+    """Format seconds as H:MM:SS"""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+class JsonlWriter:
+    """Thread-safe JSONL writer that flushes every record"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        """Append one record and flush it to disk"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """Close the underlying file"""
+        with self._lock:
+            self._file.close()
+
+
+class BatchCheckpoint:
+    """
+    Append-only record of completed keywords
+
+    Keywords are recorded by value rather than by line number, so lines
+    added, removed or reordered in the keywords file between runs do not
+    shift which keywords count as done. A keyword listed n times is done
+    once it has been recorded n times.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Counter = Counter()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.done[json.loads(line)] += 1
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash mid-write
+                        continue
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def pending(self, keywords: List[str]) -> List[int]:
+        """
+        Positions of the keywords not yet done
+
+        Args:
+            keywords: Keywords of the batch, in file order
+
+        Returns:
+            Positions in keywords, skipping as many occurrences of each
+            keyword as the checkpoint records
+        """
+        skip = Counter(self.done)
+        positions = []
+        for index, keyword in enumerate(keywords):
+            if skip[keyword] > 0:
+                skip[keyword] -= 1
+            else:
+                positions.append(index)
+        return positions
+
+    def mark_done(self, keyword: str):
+        """Record that one occurrence of a keyword is finished"""
+        with self._lock:
+            self.done[keyword] += 1
+            self._file.write(json.dumps(keyword, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Close the underlying file"""
+        with self._lock:
+            self._file.close()
+
+
+class BatchRunner:
+    """Runs a single warm MemeAgent over a keyword list"""
+
+    def __init__(self, agent, output_path: str, checkpoint_path: Optional[str] = None,
+                 concurrency: Optional[int] = None, retry_limit: int = 3):
+        """
+        Args:
+            agent: Initialized MemeAgent shared by all requests
+            output_path: JSONL file receiving one record per keyword
+            checkpoint_path: Checkpoint file (output_path + ".checkpoint" if omitted)
+            concurrency: Keywords processed at the same time (Config.BATCH_CONCURRENCY if omitted)
+            retry_limit: Maximum retry attempts per meme
+        """
+        self.config = Config()
+        self.agent = agent
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.concurrency = concurrency or self.config.BATCH_CONCURRENCY
+        self.retry_limit = retry_limit
+
+    def _process(self, index: int, keyword: str, deadline: Deadline) -> Dict:
+        """Generate the meme for one keyword and build its output record"""
+        start = time.perf_counter()
+        record = {"index": index, "keyword": keyword, "url": None}
+        try:
+            result = self.agent.generate_meme_result(keyword, self.retry_limit, deadline=deadline)
+            if result:
+                record.update(result)
+        except Exception as e:
+            record["error"] = str(e)
+        record["elapsed_s"] = round(time.perf_counter() - start, 3)
+        return record
+
+    def run(self, keywords: List[str]) -> Dict[str, int]:
+        """
+        Process every keyword not already recorded in the checkpoint
+
+        Results are written as they complete, so the output is in completion
+        order. A record is written before its checkpoint entry, so a crash in
+        between can at worst repeat that keyword on resume. On
+        KeyboardInterrupt, queued keywords are cancelled, running ones are
+        stopped through their deadlines at the next token, and results that
+        had already finished are written and checkpointed before it
+        propagates; keywords that were still generating are redone on resume.
+
+        Args:
+            keywords: Keywords to generate one meme each for
+
+        Returns:
+            Dict with total, skipped, succeeded and failed counts
+        """
+        checkpoint = BatchCheckpoint(self.checkpoint_path)
+        writer = JsonlWriter(self.output_path)
+        pending = [(i, keywords[i]) for i in checkpoint.pending(keywords)]
+        summary = {"total": len(keywords), "skipped": len(keywords) - len(pending), "succeeded": 0, "failed": 0}
+
+        if summary["skipped"]:
+            logger.info("Resuming: %d of %d keywords already done", summary["skipped"], len(keywords))
+
+        start = time.perf_counter()
+        last_report = start
+        completed = 0
+        jobs = iter(pending)
+
+        def save(future):
+            record = future.result()
+            writer.write(record)
+            checkpoint.mark_done(record["keyword"])
+            summary["succeeded" if record["url"] else "failed"] += 1
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # Future of each submitted keyword and the deadline that can stop it
+        in_flight: Dict = {}
+        try:
+            while True:
+                # Keep a bounded window of submitted keywords instead of queueing the whole file
+                while len(in_flight) < self.concurrency * 2:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    deadline = Deadline(self.config.REQUEST_DEADLINE)
+                    in_flight[executor.submit(self._process, *job, deadline)] = deadline
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del in_flight[future]
+                    save(future)
+                    completed += 1
+
+                now = time.perf_counter()
+                if now - last_report >= self.config.BATCH_PROGRESS_INTERVAL or completed == len(pending):
+                    self._report_progress(completed, len(pending), now - start)
+                    last_report = now
+            executor.shutdown()
+        except KeyboardInterrupt:
+            # Results finished before the interrupt are kept; ones cut short by the cancel below are not,
+            # so their keywords stay pending
+            finished = [future for future in in_flight if future.done()]
+            for future, deadline in in_flight.items():
+                # Queued keywords are dropped, like shutdown(cancel_futures=True) (Python 3.9+), and
+                # running ones stop at their next check, so the executor's threads exit promptly
+                future.cancel()
+                deadline.cancel()
+            executor.shutdown(wait=False)
+            for future in finished:
+                save(future)
+            raise
+        finally:
+            writer.close()
+            checkpoint.close()
+
+        return summary
+
+    @staticmethod
+    def _report_progress(completed: int, total: int, elapsed: float):
+        """Log completed count, throughput and ETA"""
+        rate = completed / elapsed if elapsed > 0 else 0.0
+        eta = (total - completed) / rate if rate > 0 else 0.0
+        logger.info("[%d/%d] %.1f memes/min, elapsed %s, ETA %s",
+                    completed, total, rate * 60, _format_duration(elapsed), _format_duration(eta))
@@ -0,0 +1,181 @@
+"""
+Accelerated backends for the BLIP vision encoder
+"""
+import logging
+import os
+import re
+import inspect
+import threading
+from typing import Optional
+import torch
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BlipVisionEncoder:
+    """
+    Runs the BLIP vision encoder with ONNX Runtime, torch.compile or eager PyTorch
+
+    The vision transformer is the bulk of a captioning call (hundreds of
+    image patches against a handful of decoded tokens), so it is the part
+    that is accelerated; the autoregressive text decoder stays in PyTorch
+    and consumes the encoder output unchanged. An accelerated backend is
+    checked against eager output on its first call, and any failure there
+    or while setting it up falls back to eager for good.
+    """
+
+    BACKENDS = ("eager", "compile", "onnx")
+
+    def __init__(self, model_manager, backend: Optional[str] = None):
+        """
+        Args:
+            model_manager: ModelManager owning the BLIP model
+            backend: "eager", "compile" or "onnx" (Config.BLIP_BACKEND if omitted)
+        """
+        self.model_manager = model_manager
+        self.config = Config()
+        self.requested = backend or self.config.BLIP_BACKEND
+        if self.requested not in self.BACKENDS:
+            raise ValueError(f"Unknown BLIP backend: {self.requested}")
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop the accelerated runner, e.g. after the BLIP model was unloaded"""
+        self.backend = self.requested
+        self._runner = None
+        self._verified = self.requested == "eager"
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Encode images
+
+        Args:
+            pixel_values: Normalized images of shape (batch, 3, size, size)
+
+        Returns:
+            Image embeddings for the BLIP text decoder
+        """
+        model = self.model_manager.blip_model
+        with self._lock:
+            if self._runner is None:
+                self._runner = self._build(model)
+            runner, verified = self._runner, self._verified
+
+        if verified:
+            return runner(pixel_values)
+
+        try:
+            embeds = runner(pixel_values)
+            reference = self._eager(model)(pixel_values)
+            error = (embeds - reference).abs().max().item()
+            if error > self.config.BLIP_BACKEND_TOLERANCE:
+                raise ValueError(f"output differs from eager by {error:.2e}")
+        except Exception as e:
+            return self._fall_back(model, e)(pixel_values)
+
+        with self._lock:
+            self._verified = True
+        logger.info("BLIP vision encoder running on %s", self.backend)
+        return embeds
+
+    def _build(self, model):
+        """Set up the runner of the requested backend"""
+        try:
+            if self.backend == "onnx":
+                return self._onnx(model)
+            if self.backend == "compile":
+                return self._compiled(model)
+        except Exception as e:
+            return self._fall_back(model, e, locked=True)
+        return self._eager(model)
+
+    def _fall_back(self, model, error: Exception, locked: bool = False):
+        """Switch to eager PyTorch after a failure of the accelerated backend"""
+        logger.warning("BLIP %s backend unavailable (%s), using eager PyTorch", self.backend, error)
+        runner = self._eager(model)
+        if locked:
+            self.backend, self._verified = "eager", True
+            return runner
+        with self._lock:
+            self.backend, self._runner, self._verified = "eager", runner, True
+        return runner
+
+    @staticmethod
+    def _eager(model):
+        def run(pixel_values):
+            with torch.inference_mode():
+                return model.vision_model(pixel_values=pixel_values)[0]
+        return run
+
+    def _compiled(self, model):
+        """torch.compile the vision encoder, persisting compiled kernels between runs"""
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(self.config.BLIP_COMPILE_CACHE_DIR))
+        try:
+            import torch._inductor.config as inductor_config
+            inductor_config.fx_graph_cache = True
+        except (ImportError, AttributeError):
+            pass
+
+        compiled = torch.compile(model.vision_model, dynamic=True)
+
+        def run(pixel_values):
+            with torch.inference_mode():
+                return compiled(pixel_values=pixel_values)[0]
+        return run
+
+    def _onnx_path(self, size: int) -> str:
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.config.BLIP_MODEL_NAME)
+        return os.path.join(self.config.BLIP_ONNX_DIR, f"{name}-vision-{size}.onnx")
+
+    def _onnx(self, model):
+        """Export the vision encoder once and run it with ONNX Runtime on CPU"""
+        import onnxruntime as ort
+
+        size = model.config.vision_config.image_size
+        path = self._onnx_path(size)
+        if not os.path.exists(path):
+            self._export_onnx(model, size, path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = self.config.BLIP_ORT_INTRA_OP_THREADS or torch.get_num_threads()
+        options.inter_op_num_threads = self.config.BLIP_ORT_INTER_OP_THREADS
+        session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+        def run(pixel_values):
+            outputs = session.run(None, {"pixel_values": pixel_values.numpy()})
+            return torch.from_numpy(outputs[0])
+        return run
+
+    @staticmethod
+    def _export_onnx(model, size: int, path: str):
+        """Write the vision encoder as an ONNX graph with a dynamic batch axis"""
+        logger.info("Exporting BLIP vision encoder to %s...", path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        class VisionEncoder(torch.nn.Module):
+            def __init__(self, vision_model):
+                super().__init__()
+                self.vision_model = vision_model
+
+            def forward(self, pixel_values):
+                return self.vision_model(pixel_values=pixel_values)[0]
+
+        dummy = torch.zeros(1, 3, size, size, dtype=model.dtype)
+        # Newer torch defaults to the dynamo exporter; the TorchScript one handles BLIP's vision model
+        extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # The export is written under a temporary name so a partial file is never picked up
+        torch.onnx.export(
+            VisionEncoder(model.vision_model).eval(),
+            (dummy,),
+            tmp_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+            **extra,
+        )
+        os.replace(tmp_path, path)
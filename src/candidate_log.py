@@ -0,0 +1,267 @@
+"""
+Columnar log of every caption and humor score candidate, for offline tuning
+"""
+import os
+import glob
+import time
+import itertools
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Short, repetitive columns are stored as a value table plus integer codes
+CATEGORY_COLUMNS = ("stage", "keyword", "template", "style_hint", "parse_result")
+# Free text is stored as concatenated UTF-8 plus offsets
+TEXT_COLUMNS = ("raw_output", "top_text", "bottom_text")
+NUMERIC_COLUMNS = {
+    "time": np.float64,
+    "score": np.int8,  # -1 when no score was produced
+    "accepted": np.bool_,
+    "latency_ms": np.float32,
+    "prompt_tokens": np.int32,
+    "output_tokens": np.int32,
+}
+COLUMNS = ("time",) + CATEGORY_COLUMNS + TEXT_COLUMNS + tuple(c for c in NUMERIC_COLUMNS if c != "time")
+
+# Chunk numbers are unique per process, so several logs can share a directory
+_chunk_numbers = itertools.count(1)
+
+
+class CandidateLog:
+    """
+    Append-only candidate log written as chunked, compressed NumPy column files
+
+    record() only appends a row to an in-memory buffer. Every
+    CANDIDATE_LOG_CHUNK_ROWS rows (or CANDIDATE_LOG_FLUSH_SECONDS after the
+    last chunk) the buffer is handed to a background thread, which encodes
+    it column by column and writes one candidates-<pid>-<n>.npz file, so
+    forked workers can share a directory. Rows still buffered are written
+    by close(), which also runs at interpreter exit.
+    """
+
+    def __init__(self, directory: Optional[str] = None, chunk_rows: Optional[int] = None,
+                 flush_seconds: Optional[float] = None):
+        """
+        Args:
+            directory: Directory receiving the chunk files (Config.CANDIDATE_LOG_DIR if omitted)
+            chunk_rows: Rows per chunk file (Config.CANDIDATE_LOG_CHUNK_ROWS if omitted)
+            flush_seconds: Longest time rows wait in the buffer while candidates
+                keep arriving (Config.CANDIDATE_LOG_FLUSH_SECONDS if omitted)
+        """
+        self.config = Config()
+        self.directory = directory or self.config.CANDIDATE_LOG_DIR
+        self.chunk_rows = chunk_rows or self.config.CANDIDATE_LOG_CHUNK_ROWS
+        self.flush_seconds = flush_seconds or self.config.CANDIDATE_LOG_FLUSH_SECONDS
+        os.makedirs(self.directory, exist_ok=True)
+        self._rows: List[tuple] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._last_flush = time.monotonic()
+        self._stats = {"rows": 0, "chunks": 0, "bytes": 0, "write_seconds": 0.0, "errors": 0}
+        atexit.register(self.close)
+
+    def record(self, stage: str, keyword: Optional[str], template: Optional[str], style_hint: Optional[str],
+               raw_output: str, parse_result: str, top_text: Optional[str] = None,
+               bottom_text: Optional[str] = None, score: Optional[int] = None, accepted: bool = False,
+               latency: float = 0.0, prompt_tokens: int = 0, output_tokens: int = 0):
+        """
+        Buffer one candidate
+
+        Args:
+            stage: "caption" or "score"
+            keyword: Keyword the meme is generated for
+            template: Template name
+            style_hint: Style hint of the caption prompt
+            raw_output: Model output without the prompt ("" if no model ran)
+            parse_result: Outcome, e.g. "ok", "unparsed", "banned", "duplicate", "llm", "prefilter", "error"
+            top_text: Parsed top text
+            bottom_text: Parsed bottom text
+            score: Humor score (None for caption candidates)
+            accepted: Whether the candidate passed its stage
+            latency: Seconds the model call took
+            prompt_tokens: Prompt length in tokens
+            output_tokens: Generated tokens
+        """
+        row = (time.time(), stage, keyword or "", template or "", style_hint or "", parse_result,
+               raw_output or "", top_text or "", bottom_text or "",
+               -1 if score is None else score, accepted, latency * 1000, prompt_tokens, output_tokens)
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker inherits the parent's buffered rows, which the parent writes itself
+                self._rows, self._writer, self._pid = [], None, os.getpid()
+            self._rows.append(row)
+            if len(self._rows) >= self.chunk_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+                self._flush_locked()
+
+    def flush(self):
+        """Hand buffered rows to the writer thread"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="candidate-log")
+        self._writer.submit(self._write, *self._take_chunk_locked())
+
+    def _take_chunk_locked(self):
+        """Empty the buffer, returning its rows and the chunk file to write them to"""
+        rows, self._rows = self._rows, []
+        return rows, os.path.join(self.directory, f"candidates-{self._pid}-{next(_chunk_numbers):06d}.npz")
+
+    def _write(self, rows: List[tuple], path: str):
+        """Encode rows column by column and write them as one chunk file"""
+        start = time.perf_counter()
+        try:
+            # Row tuples follow COLUMNS order
+            columns = dict(zip(COLUMNS, zip(*rows)))
+            arrays = {}
+            for name in CATEGORY_COLUMNS:
+                values, codes = np.unique(np.asarray(columns[name], dtype=str), return_inverse=True)
+                arrays[f"{name}.values"] = values
+                arrays[f"{name}.codes"] = codes.astype(np.int32)
+            for name in TEXT_COLUMNS:
+                encoded = [text.encode("utf-8") for text in columns[name]]
+                arrays[f"{name}.offsets"] = np.cumsum([0] + [len(b) for b in encoded], dtype=np.int64)
+                arrays[f"{name}.data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            for name, dtype in NUMERIC_COLUMNS.items():
+                arrays[name] = np.asarray(columns[name], dtype=dtype)
+
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._stats["rows"] += len(rows)
+                self._stats["chunks"] += 1
+                self._stats["bytes"] += os.path.getsize(path)
+                self._stats["write_seconds"] += time.perf_counter() - start
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning("Error writing candidate log chunk %s: %s", path, e)
+
+    def close(self):
+        """Wait for the writer thread, then write the rows still buffered"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            writer, self._writer = self._writer, None
+            chunk = self._take_chunk_locked() if self._rows else None
+        if writer is not None:
+            writer.shutdown(wait=True)
+        # Written here rather than by the writer, which takes no new work once the interpreter exits
+        if chunk is not None:
+            self._write(*chunk)
+
+    def stats(self) -> Dict:
+        """
+        Get candidate log statistics
+
+        Returns:
+            Dict with rows and chunks written, their compressed bytes, time
+            spent writing (on the writer thread), write errors and rows still buffered
+        """
+        with self._lock:
+            return dict(self._stats, buffered=len(self._rows))
+
+
+def read_candidate_log(directory: str) -> Dict[str, np.ndarray]:
+    """
+    Load every chunk of a candidate log
+
+    Args:
+        directory: Directory holding the candidates-*.npz chunks
+
+    Returns:
+        Dict of equally long column arrays in chunk order; category and text
+        columns are decoded to arrays of str
+    """
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in COLUMNS}
+    for path in sorted(glob.glob(os.path.join(directory, "candidates-*.npz"))):
+        with np.load(path) as chunk:
+            for name in CATEGORY_COLUMNS:
+                parts[name].append(chunk[f"{name}.values"][chunk[f"{name}.codes"]])
+            for name in TEXT_COLUMNS:
+                data, offsets = chunk[f"{name}.data"].tobytes(), chunk[f"{name}.offsets"]
+                parts[name].append(np.array([data[offsets[i]:offsets[i + 1]].decode("utf-8")
+                                             for i in range(len(offsets) - 1)], dtype=object))
+            for name in NUMERIC_COLUMNS:
+                parts[name].append(chunk[name])
+    return {
+        name: np.concatenate(arrays) if arrays else np.array([], dtype=NUMERIC_COLUMNS.get(name, object))
+        for name, arrays in parts.items()
+    }
+
+
+def acceptance_rates(columns: Dict[str, np.ndarray], by: Sequence[str] = ("template", "style_hint"),
+                     threshold: Optional[int] = None) -> List[Dict]:
+    """
+    Caption parse rates and humor acceptance rates per group
+
+    Acceptance is recomputed from the logged scores, so a different
+    threshold can be tried without regenerating anything.
+
+    Args:
+        columns: Columns from read_candidate_log()
+        by: Category columns to group by
+        threshold: Score needed for acceptance (Config.HUMOR_SCORE_THRESHOLD if omitted)
+
+    Returns:
+        One dict per group, most scored first, with the group values, captions,
+        parsed (share of caption outputs usable), scored, accepted,
+        acceptance_rate, mean_score, prefiltered (share of scores settled
+        without the LLM) and mean caption latency_ms and output_tokens
+    """
+    threshold = threshold if threshold is not None else Config.HUMOR_SCORE_THRESHOLD
+    if not len(columns["stage"]):
+        return []
+    keys = np.array(["\x1f".join(values) for values in zip(*(columns[name] for name in by))], dtype=object)
+    caption = columns["stage"] == "caption"
+    score = (columns["stage"] == "score") & (columns["parse_result"] != "error")
+
+    groups = []
+    for key in np.unique(keys):
+        in_group = keys == key
+        captions, scores = in_group & caption, in_group & score
+        scored = int(scores.sum())
+        accepted = int((columns["score"][scores] >= threshold).sum())
+        groups.append(dict(
+            zip(by, key.split("\x1f")),
+            captions=int(captions.sum()),
+            parsed=float((columns["parse_result"][captions] == "ok").mean()) if captions.any() else 0.0,
+            scored=scored,
+            accepted=accepted,
+            acceptance_rate=accepted / scored if scored else 0.0,
+            mean_score=float(columns["score"][scores].mean()) if scored else 0.0,
+            prefiltered=float((columns["parse_result"][scores] == "prefilter").mean()) if scored else 0.0,
+            latency_ms=float(columns["latency_ms"][captions].mean()) if captions.any() else 0.0,
+            output_tokens=float(columns["output_tokens"][captions].mean()) if captions.any() else 0.0,
+        ))
+    return sorted(groups, key=lambda group: (-group["scored"], -group["acceptance_rate"]))
+
+
+def format_acceptance_report(groups: List[Dict], by: Sequence[str] = ("template", "style_hint"),
+                             min_scored: int = 1) -> str:
+    """Render acceptance_rates() as a table, skipping groups with fewer than min_scored scores"""
+    widths = [max([len(name)] + [min(len(group[name]), 40) for group in groups]) + 2 for name in by]
+    header = "".join(f"{name:<{width}}" for name, width in zip(by, widths))
+    lines = [f"{header}{'captions':>9}{'parsed':>8}{'scored':>8}{'accept':>8}{'mean':>6}"
+             f"{'prefilt':>9}{'lat ms':>8}{'tokens':>8}"]
+    for group in groups:
+        if group["scored"] < min_scored:
+            continue
+        names = "".join(f"{group[name][:40]:<{width}}" for name, width in zip(by, widths))
+        lines.append(f"{names}{group['captions']:>9}{group['parsed']:>8.0%}{group['scored']:>8}"
+                     f"{group['acceptance_rate']:>8.0%}{group['mean_score']:>6.1f}{group['prefiltered']:>9.0%}"
+                     f"{group['latency_ms']:>8.0f}{group['output_tokens']:>8.1f}")
+    return "\n".join(lines)
@@ -1,18 +1,56 @@
 """
 Meme caption generation and cleaning functionality
 """
+import logging
 import re
+import json
+import time
 import random
-from typing import Tuple, Optional
+import threading
+from typing import Dict, List, Tuple, Optional
 from .config import Config
 from .models import ModelManager
+from .dedup import CaptionDeduplicator
+from .humor_filter import HumorPrefilter
+from .deadline import Deadline, DeadlineExceeded
+from .prompt_builder import PromptBuilder, compact_prompt
+from .candidate_log import CandidateLog
+
+logger = logging.getLogger(__name__)
+
+MEME_PROMPT_TEMPLATE = compact_prompt("""
+    You are a witty meme creator. {style_hint}.
+
+    Image description: "{image_caption}"
+    Template name: '{template_name}'
+
+    Write ONE funny meme about '{keyword}' using this image and template.
+
+    RULES:
+    - Only return exactly TWO lines.
+    - First line MUST start with: Top text:
+    - Second line MUST start with: Bottom text:
+    - No explanations, no code, no HTML, no hashtags.
+    - No quotes around the sentences.
+    - Do NOT copy the example.
+
+    EXAMPLE (don't copy!):
+    Top text: When Monday hits too hard
+    Bottom text: And coffee hasn't kicked in yet
+
+    Now write your own meme in that exact format.
+    """)
 
 class CaptionGenerator:
     """Handles meme caption generation and cleaning"""
     
-    def __init__(self):
-        self.model_manager = ModelManager()
+    def __init__(self, model_manager: Optional[ModelManager] = None):
+        self.model_manager = model_manager or ModelManager()
         self.config = Config()
+        self.prefilter = HumorPrefilter()
+        self.prompt_builder = PromptBuilder(self.model_manager)
+        self._score_log_lock = threading.Lock()
+        self.candidate_log = CandidateLog() if self.config.CANDIDATE_LOG_DIR else None
     
     def extract_top_bottom(self, text: str) -> Tuple[Optional[str], Optional[str]]:
         """
@@ -58,109 +96,297 @@ class CaptionGenerator:
         """
         return any(bad in text for bad in self.config.BANNED_FRAGMENTS)
     
-    def generate_clean_captions(self, prompt: str, max_retries: int = 3) -> Tuple[Optional[str], Optional[str]]:
+    def generate_clean_captions(self, prompt: str, max_retries: int = 3,
+                                dedup_index: Optional[CaptionDeduplicator] = None,
+                                deadline: Optional[Deadline] = None,
+                                context: Optional[Dict] = None) -> Tuple[Optional[str], Optional[str]]:
         """
         Generate clean meme captions with retry logic
         
         Args:
             prompt: Prompt for caption generation
             max_retries: Maximum number of retry attempts
+            dedup_index: Optional index of captions already produced in this batch;
+                near-duplicates are rejected before they are rendered or scored
+            deadline: Request deadline; remaining retries are skipped once it expires
+            context: keyword, template and style_hint of the prompt, for the candidate log
             
         Returns:
             Tuple of (top_text, bottom_text) or (None, None) if generation fails
+            
+        Raises:
+            DeadlineExceeded: If the deadline expires before a clean caption is found
         """
         for attempt in range(max_retries):
+            start = time.perf_counter()
             try:
-                meme_text = self.model_manager.llm(prompt, temperature=0.95, top_p=0.95)
-                print(f"Model Output (Attempt {attempt+1}): {meme_text}")
+                meme_text = self.model_manager.generate(
+                    prompt, call_site="caption", temperature=0.95, top_p=0.95, deadline=deadline
+                )
+                latency = time.perf_counter() - start
+                tokens = self.model_manager.last_token_counts[0]
+                logger.debug("Model output (attempt %d): %s", attempt + 1, meme_text)
 
                 top, bottom = self.extract_top_bottom(meme_text)
+                outcome = self._caption_outcome(top, bottom, dedup_index)
+                self._log_candidate("caption", context, meme_text, outcome, top, bottom,
+                                    latency=latency, tokens=tokens)
 
                 # If there is no top/bottom text or if it contains parts of the prompt, retry
-                if (not top or not bottom or 
-                    self.is_bad_caption(top) or 
-                    self.is_bad_caption(bottom)):
-                    print(f"Bad caption detected → Retrying... ({attempt+1}/{max_retries})")
+                if outcome in ("unparsed", "banned"):
+                    logger.info("Bad caption detected → Retrying... (%d/%d)", attempt + 1, max_retries)
+                    continue
+                elif outcome == "duplicate":
+                    logger.info("Near-duplicate caption detected → Retrying... (%d/%d)", attempt + 1, max_retries)
                     continue
                 else:
-                    print(f"Clean Caption Found!\nTop: {top}\nBottom: {bottom}")
+                    logger.debug("Clean caption found!\nTop: %s\nBottom: %s", top, bottom)
                     return top, bottom
                     
+            except DeadlineExceeded:
+                raise
             except Exception as e:
-                print(f"Error generating caption (attempt {attempt+1}): {e}")
+                logger.warning("Error generating caption (attempt %d): %s", attempt + 1, e)
+                self._log_candidate("caption", context, "", "error", latency=time.perf_counter() - start)
                 continue
 
-        print("Could not generate a clean meme caption after retries.")
+        logger.info("Could not generate a clean meme caption after retries.")
         return None, None
     
-    def generate_meme_prompt(self, keyword: str, image_caption: str, template_name: str) -> str:
+    def _caption_outcome(self, top: Optional[str], bottom: Optional[str],
+                         dedup_index: Optional[CaptionDeduplicator]) -> str:
+        """Classify a parsed caption as ok, unparsed (no top/bottom text), banned or duplicate"""
+        if not top or not bottom:
+            return "unparsed"
+        if self.is_bad_caption(top) or self.is_bad_caption(bottom):
+            return "banned"
+        if dedup_index is not None and dedup_index.check_and_add(top, bottom):
+            return "duplicate"
+        return "ok"
+    
+    def choose_style_hint(self) -> str:
+        """Pick a random style hint for a caption prompt"""
+        return random.choice(self.config.STYLE_HINTS)
+    
+    def generate_meme_prompt(self, keyword: str, image_caption: str, template_name: str,
+                             style_hint: Optional[str] = None) -> str:
         """
         Generate a prompt for meme caption generation
         
+        The image description is trimmed, whole sentences first, so the
+        prompt stays within Config.PROMPT_TOKEN_BUDGET.
+        
         Args:
             keyword: Main keyword for the meme
             image_caption: Description of the image
             template_name: Name of the meme template
+            style_hint: Tone instruction (a random one of Config.STYLE_HINTS if omitted)
             
         Returns:
             Formatted prompt for the LLM
         """
-        style_hint = random.choice(self.config.STYLE_HINTS)
+        style_hint = style_hint or self.choose_style_hint()
         
-        prompt = f"""
-        You are a witty meme creator. {style_hint}.
-
-        Image description: "{image_caption}"
-        Template name: '{template_name}'
-
-        Write ONE funny meme about '{keyword}' using this image and template.
-
-        RULES:
-        - Only return exactly TWO lines.
-        - First line MUST start with: Top text:
-        - Second line MUST start with: Bottom text:
-        - No explanations, no code, no HTML, no hashtags.
-        - No quotes around the sentences.
-        - Do NOT copy the example.
-
-        EXAMPLE (don't copy!):
-        Top text: When Monday hits too hard
-        Bottom text: And coffee hasn't kicked in yet
-
-        Now write your own meme in that exact format.
-        """
-        
-        return prompt
+        return self.prompt_builder.build(
+            MEME_PROMPT_TEMPLATE,
+            trim_field="image_caption",
+            style_hint=style_hint,
+            image_caption=image_caption,
+            template_name=template_name,
+            keyword=keyword,
+        )
     
-    def score_humor(self, top_text: str, bottom_text: str) -> int:
+    def score_humor(self, top_text: str, bottom_text: str, keyword: Optional[str] = None,
+                    deadline: Optional[Deadline] = None, context: Optional[Dict] = None) -> int:
         """
         Score the humor of a meme caption
         
+        Obvious rejects (and, with a trained classifier, confident accepts) are
+        settled by the pre-filter cascade; only the rest reach the LLM scorer.
+        
         Args:
             top_text: Top text of the meme
             bottom_text: Bottom text of the meme
+            keyword: Keyword the meme was generated for
+            deadline: Request deadline
+            context: template and style_hint of the caption, for the candidate log
             
         Returns:
             Humor score from 1-10
+            
+        Raises:
+            DeadlineExceeded: If the deadline expires before the LLM scorer answers
         """
-        score_prompt = f"""You wrote these meme lines:
+        context = dict(context or {}, keyword=keyword)
+        score = self.prefilter.evaluate(top_text, bottom_text, keyword)
+        if score is not None:
+            logger.debug("Pre-filter score: %s", score)
+            self._log_candidate("score", context, "", "prefilter", top_text, bottom_text, score)
+            return score
+        
+        prompt = self._score_prompt(top_text, bottom_text)
+        start = time.perf_counter()
+        try:
+            score_text = self.model_manager.generate(prompt, call_site="scoring", temperature=0.3, deadline=deadline)
+            tokens = self.model_manager.last_token_counts[0]
+            logger.debug("Raw humor score response: %s", score_text)
+
+            score = self._parse_score(score_text)
+
+            logger.debug("Final score: %s", score)
+            self._log_score(top_text, bottom_text, keyword, score)
+            self._log_candidate("score", context, score_text, "llm" if score else "unparsed",
+                                top_text, bottom_text, score, time.perf_counter() - start, tokens)
+            return score
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning("Error scoring humor: %s", e)
+            self._log_candidate("score", context, "", "error", top_text, bottom_text,
+                                latency=time.perf_counter() - start)
+            return 0
+    
+    @staticmethod
+    def _score_prompt(top_text: str, bottom_text: str) -> str:
+        """Build the LLM humor scoring prompt"""
+        return compact_prompt(f"""You wrote these meme lines:
 
         Top text: "{top_text}"
         Bottom text: "{bottom_text}"
 
         How funny and fitting are these two lines together as a meme, on a scale from 1 (not funny at all) to 10 (extremely funny)?
-        Only reply with the number score."""
-
-        try:
-            score_text = self.model_manager.llm(score_prompt, temperature=0.3)
-            print(f"Raw humor score response: {score_text}")
-
-            matches = re.findall(r"\b([1-9]|10)\b", score_text)
-            score = int(matches[-1]) if matches else 0
-
-            print(f"Final Score: {score}")
-            return score
+        Only reply with the number score.""")
+    
+    @staticmethod
+    def _parse_score(score_text: str) -> int:
+        """Take the last 1-10 number of the scorer's output (0 if there is none)"""
+        matches = re.findall(r"\b([1-9]|10)\b", score_text)
+        return int(matches[-1]) if matches else 0
+    
+    def generate_captions_batch(self, prompts: List[str],
+                                dedup_index: Optional[CaptionDeduplicator] = None,
+                                deadline: Optional[Deadline] = None,
+                                contexts: Optional[List[Dict]] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Generate one caption per prompt in a single batched LLM call
+        
+        There are no per-prompt retries: unusable outputs simply drop out of
+        the round.
+        
+        Args:
+            prompts: Prompts for caption generation
+            dedup_index: Optional index of captions already produced in this batch
+            deadline: Request deadline
+            contexts: keyword, template and style_hint per prompt, for the candidate log
+            
+        Returns:
+            (top_text, bottom_text) per prompt, (None, None) where the output is unusable
             
+        Raises:
+            DeadlineExceeded: If the deadline expires during generation
+        """
+        start = time.perf_counter()
+        outputs = self.model_manager.generate_batch(
+            prompts, call_site="caption", temperature=0.95, top_p=0.95, deadline=deadline
+        )
+        latency = time.perf_counter() - start
+        token_counts = self.model_manager.last_token_counts
+        
+        captions = []
+        for index, meme_text in enumerate(outputs):
+            top, bottom = self.extract_top_bottom(meme_text)
+            outcome = self._caption_outcome(top, bottom, dedup_index)
+            self._log_candidate("caption", contexts[index] if contexts else None, meme_text,
+                                outcome, top, bottom, latency=latency, tokens=token_counts[index])
+            if outcome in ("unparsed", "banned"):
+                logger.info("Bad caption for candidate %d", index + 1)
+                captions.append((None, None))
+            elif outcome == "duplicate":
+                logger.info("Near-duplicate caption for candidate %d", index + 1)
+                captions.append((None, None))
+            else:
+                captions.append((top, bottom))
+        return captions
+    
+    def score_humor_batch(self, captions: List[Tuple[str, str]], keyword: Optional[str] = None,
+                          deadline: Optional[Deadline] = None, contexts: Optional[List[Dict]] = None) -> List[int]:
+        """
+        Score several captions, sending the ones the pre-filter cannot settle to the LLM in one batch
+        
+        Args:
+            captions: (top_text, bottom_text) pairs
+            keyword: Keyword the memes were generated for
+            deadline: Request deadline
+            contexts: template and style_hint per caption, for the candidate log
+            
+        Returns:
+            Humor score from 1-10 per caption (0 if scoring failed)
+            
+        Raises:
+            DeadlineExceeded: If the deadline expires before the LLM scorer answers
+        """
+        contexts = [dict(context, keyword=keyword) for context in contexts or [{}] * len(captions)]
+        scores = [self.prefilter.evaluate(top, bottom, keyword) for top, bottom in captions]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        for i, score in enumerate(scores):
+            if score is not None:
+                self._log_candidate("score", contexts[i], "", "prefilter", *captions[i], score)
+        if not pending:
+            return scores
+        
+        prompts = [self._score_prompt(*captions[i]) for i in pending]
+        start = time.perf_counter()
+        try:
+            outputs = self.model_manager.generate_batch(
+                prompts, call_site="scoring", temperature=0.3, deadline=deadline
+            )
+            token_counts = self.model_manager.last_token_counts
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"Error scoring humor: {e}")
-            return 0 
\ No newline at end of file
+            logger.warning("Error scoring humor: %s", e)
+            outputs = [""] * len(pending)
+            token_counts = [(0, 0)] * len(pending)
+        latency = time.perf_counter() - start
+        
+        for i, score_text, tokens in zip(pending, outputs, token_counts):
+            scores[i] = self._parse_score(score_text)
+            if score_text:
+                self._log_score(captions[i][0], captions[i][1], keyword, scores[i])
+                outcome = "llm" if scores[i] else "unparsed"
+            else:
+                outcome = "error"
+            self._log_candidate("score", contexts[i], score_text, outcome, *captions[i],
+                                scores[i] if score_text else None, latency, tokens)
+        return scores
+    
+    def _log_score(self, top_text: str, bottom_text: str, keyword: Optional[str], score: int):
+        """Append an LLM humor score to the log used to train the pre-filter classifier"""
+        if not self.config.HUMOR_SCORE_LOG_PATH:
+            return
+        record = {"keyword": keyword, "top_text": top_text, "bottom_text": bottom_text, "score": score}
+        try:
+            with self._score_log_lock, open(self.config.HUMOR_SCORE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning("Error writing humor score log: %s", e)
+    
+    def _log_candidate(self, stage: str, context: Optional[Dict], output: str, outcome: str,
+                       top_text: Optional[str] = None, bottom_text: Optional[str] = None,
+                       score: Optional[int] = None, latency: float = 0.0, tokens: Tuple[int, int] = (0, 0)):
+        """
+        Add a caption or score candidate to the candidate log, if it is enabled
+
+        tokens are the (prompt, generated) counts from ModelManager.last_token_counts,
+        so nothing is tokenized again here.
+        """
+        if self.candidate_log is None:
+            return
+        context = context or {}
+        prompt_tokens, output_tokens = tokens
+        accepted = outcome == "ok" if stage == "caption" else (score or 0) >= self.config.HUMOR_SCORE_THRESHOLD
+        self.candidate_log.record(
+            stage, context.get("keyword"), context.get("template"), context.get("style_hint"), output,
+            outcome, top_text, bottom_text, score, accepted, latency, prompt_tokens, output_tokens,
+        )
@@ -14,14 +14,143 @@ class Config:
     MODEL_NAME: str = "TheBloke/vicuna-7B-1.1-HF"
     BLIP_MODEL_NAME: str = "Salesforce/blip-image-captioning-large"
     
+    # Fast restarts: load prepared models from a local snapshot (see main.py --save-snapshot)
+    MODEL_SNAPSHOT_DIR: Optional[str] = os.getenv("MODEL_SNAPSHOT_DIR")
+    LAZY_MODEL_LOADING: bool = False  # load each model on first use instead of at agent start
+    MODEL_IDLE_TIMEOUT: Optional[float] = None  # seconds unused before a model is unloaded (None keeps models loaded)
+    MODEL_MEMORY_BUDGET_BYTES: Optional[int] = None  # unload least recently used models beyond this size
+    
+    # Speculative decoding with a small draft model sharing the LLM's tokenizer
+    SPECULATIVE_DECODING: bool = False
+    DRAFT_MODEL_NAME: str = "double7/vicuna-68m"
+    SPECULATIVE_NUM_DRAFT_TOKENS: int = 5
+    SPECULATIVE_CALL_SITES = ("caption", "expansion")  # scoring stays on the plain decoder
+    
+    # Continuous batching: concurrent generations share decode steps (speculative call sites keep generate())
+    CONTINUOUS_BATCHING: bool = False
+    ENGINE_MAX_BATCH: int = 8  # sequences decoded together per step
+    ENGINE_KV_CACHE_MB: int = 1024  # preallocated KV cache; requests wait for free blocks beyond it
+    ENGINE_BLOCK_SIZE: int = 16  # tokens per KV cache block
+    
     # Imgflip API settings
     IMGFLIP_USERNAME: str = os.getenv("IMGFLIP_USERNAME", "ADD_YOUR_IMGFLIP_USERNAME_HERE")
     IMGFLIP_PASSWORD: str = os.getenv("IMGFLIP_PASSWORD", "ADD_YOUR_IMGFLIP_PASSWORD_HERE")
+    IMGFLIP_API_URL: str = os.getenv("IMGFLIP_API_URL", "https://api.imgflip.com")  # or a LocalImgflipServer in load tests
+    
+    # Image description: "llm" rewrites the BLIP caption with the LLM, "fast" merges guided BLIP captions
+    DESCRIPTION_MODE: str = "llm"
+    FAST_DESCRIPTION_PREFIXES = ["", "a meme showing", "on the left", "on the right", "the person looks"]
+    DESCRIPTION_CACHE_SIZE: int = 256  # template descriptions kept in memory, so BLIP can sit idle
+    
+    # BLIP vision encoder backend: "eager", "compile" (torch.compile) or "onnx" (ONNX Runtime);
+    # accelerated backends fall back to eager if unavailable or if their output differs
+    BLIP_BACKEND: str = "eager"
+    BLIP_BACKEND_TOLERANCE: float = 1e-3
+    BLIP_ONNX_DIR: str = os.getenv("BLIP_ONNX_DIR", ".meme_cache/onnx")
+    BLIP_COMPILE_CACHE_DIR: str = os.getenv("BLIP_COMPILE_CACHE_DIR", ".meme_cache/inductor")
+    BLIP_ORT_INTRA_OP_THREADS: Optional[int] = None  # torch's thread count if None
+    BLIP_ORT_INTER_OP_THREADS: int = 1
+    
+    # Template image download limits
+    IMAGE_MAX_BYTES: int = 10 * 1024 * 1024
+    IMAGE_MAX_PIXELS: int = 40_000_000
+    IMAGE_FETCH_TIMEOUT: float = 15.0
     
     # Generation settings
     MAX_NEW_TOKENS: int = 256
     MAX_RETRIES: int = 3
     HUMOR_SCORE_THRESHOLD: int = 7
+    REQUEST_DEADLINE: Optional[float] = None  # seconds per generate_meme call; the best meme so far is returned when it expires
+    TOURNAMENT_SIZE: int = 1  # templates competing per round in one batched LLM call (1 disables tournaments)
+    TOURNAMENT_RENDER_GRACE: float = 5.0  # seconds allowed to render the best entrant after the deadline expires
+    
+    # Prompt assembly: the image description is trimmed (whole sentences first) to fit the budget
+    PROMPT_TOKEN_BUDGET: Optional[int] = 320  # None keeps the full description
+    PROMPT_TOKEN_CACHE_SIZE: int = 512  # tokenized prompts kept for reuse between counting and generation
+    
+    # LLM call cache (opt-in); creative captions are never cached by default
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_POLICIES = {"scoring": True, "expansion": True, "caption": False}
+    LLM_CACHE_MEMORY_ENTRIES: int = 1024
+    LLM_CACHE_DIR: Optional[str] = os.getenv("LLM_CACHE_DIR", ".meme_cache/llm")
+    LLM_CACHE_DISK_MAX_BYTES: int = 256 * 1024 * 1024
+    
+    # Single-flight: concurrent identical template searches, image downloads, descriptions
+    # and LLM calls of these stages wait for the one in flight instead of repeating it
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_CALL_SITES = ("scoring", "expansion")  # creative captions are never shared
+    
+    # Near-duplicate caption detection
+    DEDUP_SIMILARITY_THRESHOLD: float = 0.8
+    DEDUP_NUM_PERMUTATIONS: int = 64
+    DEDUP_SHINGLE_SIZE: int = 4
+    
+    # Humor scoring pre-filter cascade
+    PREFILTER_MAX_LINE_CHARS: int = 80
+    PREFILTER_EXAMPLE_SIMILARITY: float = 0.6
+    PREFILTER_CLASSIFIER_PATH: Optional[str] = os.getenv("PREFILTER_CLASSIFIER_PATH")
+    PREFILTER_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"  # or "hashing"
+    PREFILTER_EMBEDDING_CACHE_SIZE: int = 4096
+    PREFILTER_REJECT_BELOW: float = 0.15
+    PREFILTER_ACCEPT_ABOVE: float = 0.9
+    HUMOR_SCORE_LOG_PATH: Optional[str] = os.getenv("HUMOR_SCORE_LOG_PATH")
+    
+    # Columnar log of every caption and score candidate (candidate_log.py; query with candidate_report.py)
+    CANDIDATE_LOG_DIR: Optional[str] = os.getenv("CANDIDATE_LOG_DIR")  # None disables the log
+    CANDIDATE_LOG_CHUNK_ROWS: int = 4096  # rows buffered per chunk file
+    CANDIDATE_LOG_FLUSH_SECONDS: float = 60.0  # longest time a row stays buffered while candidates arrive
+    
+    # Adaptive template selection
+    ADAPTIVE_TEMPLATE_SELECTION: bool = False
+    TEMPLATE_SELECTION_STRATEGY: str = "thompson"  # "thompson" or "ucb"
+    TEMPLATE_CANDIDATES: int = 20
+    TEMPLATE_GLOBAL_PRIOR_WEIGHT: float = 0.25
+    TEMPLATE_STATS_PATH: Optional[str] = os.getenv("TEMPLATE_STATS_PATH", ".meme_cache/template_stats.json")
+    TEMPLATE_STATS_SAVE_EVERY: int = 20  # outcomes recorded between merges into TEMPLATE_STATS_PATH
+    
+    # Multi-process worker pool
+    WORKER_PROCESSES: int = 4
+    WORKER_TORCH_THREADS: Optional[int] = None  # None splits the available cores evenly
+    WORKER_SHARE_MEMORY: bool = True
+    WORKER_PIN_CORES: bool = True
+    
+    # BLIP and the text model on separate cores, overlapping across concurrent requests
+    CORE_PARTITIONING: bool = False
+    VISION_CORES: Optional[int] = None  # cores for BLIP; None gives it a third, the text model gets the rest
+    PARTITION_PIN_CORES: bool = True
+    
+    # Bulk keyword batch mode
+    BATCH_CONCURRENCY: int = 1
+    BATCH_PROGRESS_INTERVAL: float = 10.0  # seconds between progress lines
+    
+    # Bulk export of rendered memes (main.py --export)
+    EXPORT_CONCURRENCY: int = 16  # downloads in flight, also the size of the HTTP connection pool
+    EXPORT_RETRIES: int = 3  # retries per image on connection errors and 429/5xx responses
+    
+    # Logging (structured_logging.py); --verbose switches to DEBUG, which includes raw model outputs
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "json" writes JSON lines to the console
+    LOG_JSON_PATH: Optional[str] = os.getenv("LOG_JSON_PATH")  # also append every record as JSON lines here
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0  # fraction of DEBUG records kept, per message
+    LOG_QUEUE_SIZE: int = 10000  # records buffered for the writer thread; more are dropped, never waited on
+    
+    # Load testing (loadtest.py)
+    LOAD_TEST_P99_SLO: float = 30.0  # seconds; steps above it count as saturated
+    LOAD_TEST_MAX_BACKLOG: int = 64  # waiting open-loop requests beyond which new arrivals are shed
+    
+    # Memory instrumentation (memory_profiler.py) and soak tests (loadtest.py --soak)
+    MEMORY_PROFILING: bool = False  # per-stage RSS growth in the run statistics
+    MEMORY_TRACE_FRAMES: int = 0  # tracemalloc frames per allocation; 0 leaves tracemalloc off (it slows Python code ~2x)
+    SOAK_WARMUP_ITERATIONS: int = 100  # runs before the RSS baseline is taken
+    SOAK_MAX_GROWTH_MB: float = 50.0  # allowed RSS growth after warmup
+    SOAK_MAX_ERROR_RATE: float = 0.01  # fraction of runs allowed to raise; a soak of failing runs proves nothing
+    
+    # Fleet mode: workers on one or more hosts sharing a SQLite job queue and caches
+    FLEET_QUEUE_PATH: Optional[str] = os.getenv("FLEET_QUEUE_PATH")
+    FLEET_JOURNAL_MODE: str = "wal"  # WAL needs every worker on one host; use "delete" on a network filesystem
+    FLEET_LEASE_SECONDS: float = 120.0
+    FLEET_MAX_ATTEMPTS: int = 3
+    FLEET_POLL_INTERVAL: float = 2.0
     
     # Style hints for meme generation
     STYLE_HINTS = [
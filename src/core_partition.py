@@ -0,0 +1,139 @@
+"""
+Separate core sets and executors for the vision and text models
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import torch
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class PartitionedExecutors:
+    """
+    Runs BLIP and the text model each on its own thread, cores and intra-op pool
+
+    Without partitioning both models run on the request threads and each
+    call spreads over every core, so concurrent requests oversubscribe the
+    CPU and a BLIP call and a generation slow each other down. Here every
+    model call is handed to its model's single executor thread, pinned to
+    that model's cores with a matching torch thread count. Calls to the
+    same model queue up, while BLIP for one request overlaps with text
+    generation for another.
+    """
+
+    MODELS = ("vision", "text")
+
+    def __init__(self, vision_cores: Optional[int] = None, pin_cores: Optional[bool] = None):
+        """
+        Args:
+            vision_cores: Cores given to BLIP, the rest go to the text model
+                (Config.VISION_CORES if omitted; None gives BLIP a third)
+            pin_cores: Pin each executor thread to its cores (Config.PARTITION_PIN_CORES if omitted)
+        """
+        self.config = Config()
+        cores = _available_cores()
+        vision_cores = vision_cores or self.config.VISION_CORES or max(1, len(cores) // 3)
+        if len(cores) > vision_cores:
+            self.cores = {"vision": cores[:vision_cores], "text": cores[vision_cores:]}
+        else:
+            # Too few cores to split; both models share them but still overlap
+            self.cores = {"vision": cores, "text": cores}
+        self.pin_cores = self.config.PARTITION_PIN_CORES if pin_cores is None else pin_cores
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stats = {name: {"calls": 0, "busy_seconds": 0.0, "wait_seconds": 0.0} for name in self.MODELS}
+        self._busy = 0
+        self._overlap_since = 0.0
+        self._overlap_seconds = 0.0
+
+    def configure_thread(self, name: str):
+        """Pin the calling thread to a model's cores and size its intra-op pool"""
+        cores = self.cores[name]
+        if self.pin_cores and hasattr(os, "sched_setaffinity"):
+            # On Linux this pins only the calling thread; OpenMP workers it spawns inherit it
+            os.sched_setaffinity(0, cores)
+        # The first parallel op on a thread resets its pool to the process-wide
+        # count, so trigger it before choosing this thread's own count
+        torch.ones(64, 64) @ torch.ones(64, 64)
+        torch.set_num_threads(len(cores))
+
+    def _executor(self, name: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Executor threads do not survive a fork; the child starts its own
+                self._executors = {}
+                self._pid = os.getpid()
+            if name not in self._executors:
+                self._executors[name] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"{name}-model",
+                    initializer=self.configure_thread, initargs=(name,),
+                )
+                logger.info("%s model runs on cores %s with %d threads", name.capitalize(),
+                            self.cores[name], len(self.cores[name]))
+            return self._executors[name]
+
+    def run(self, name: str, fn: Callable):
+        """
+        Run a model call on the model's executor and wait for it
+
+        Args:
+            name: "vision" or "text"
+            fn: Call to run; it must not call run() for the same model
+
+        Returns:
+            Whatever fn returns (exceptions propagate)
+        """
+        submitted = time.perf_counter()
+        return self._executor(name).submit(self._timed, name, fn, submitted).result()
+
+    def _timed(self, name: str, fn: Callable, submitted: float):
+        start = time.perf_counter()
+        with self._lock:
+            self._busy += 1
+            if self._busy == len(self.MODELS):
+                self._overlap_since = start
+        try:
+            return fn()
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                if self._busy == len(self.MODELS):
+                    self._overlap_seconds += end - self._overlap_since
+                self._busy -= 1
+                stats = self._stats[name]
+                stats["calls"] += 1
+                stats["busy_seconds"] += end - start
+                stats["wait_seconds"] += start - submitted
+
+    def stats(self) -> Dict:
+        """
+        Get executor statistics
+
+        Returns:
+            Dict keyed by model with cores, calls, busy_seconds and wait_seconds
+            (time calls queued for the executor), plus overlap_seconds, the
+            time both models were running at once
+        """
+        with self._lock:
+            report = {name: dict(stats, cores=list(self.cores[name])) for name, stats in self._stats.items()}
+            report["overlap_seconds"] = self._overlap_seconds
+        return report
+
+    def shutdown(self):
+        """Stop the executor threads once their queued calls finish"""
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown()
@@ -0,0 +1,98 @@
+"""
+Per-request deadlines and cancellation
+"""
+import time
+import threading
+from typing import Optional
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs past its deadline or is cancelled"""
+
+
+class Deadline:
+    """
+    Time budget and cancellation flag shared by every stage of one request
+
+    Stages call check() between steps, bound network timeouts with
+    timeout(), and pass stopping_criteria() to model.generate so an
+    in-flight generation ends at the next token once time runs out.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout: Seconds the request may take (None for cancellation only)
+        """
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Cancel the request; stages stop at their next check"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancel() was called"""
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (None if there is no time limit)"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Whether the request was cancelled or ran out of time"""
+        return self.cancelled or self.remaining() == 0.0
+
+    def check(self, stage: str = "request"):
+        """
+        Stop the request if it is cancelled or out of time
+
+        Args:
+            stage: Name of the point in the request, for the error message
+
+        Raises:
+            DeadlineExceeded: If the request must stop
+        """
+        if self.cancelled:
+            raise DeadlineExceeded(f"Request cancelled at {stage}")
+        if self.remaining() == 0.0:
+            raise DeadlineExceeded(f"Deadline exceeded at {stage}")
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """
+        Network timeout bounded by the time left
+
+        Args:
+            default: Timeout to use when the deadline leaves more time (None for no limit)
+
+        Returns:
+            Timeout in seconds, or None for no limit
+
+        Raises:
+            DeadlineExceeded: If the request must stop
+        """
+        self.check("network request")
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    def stopping_criteria(self) -> StoppingCriteriaList:
+        """Stopping criteria ending model.generate once the deadline expires"""
+        return StoppingCriteriaList([_DeadlineStoppingCriteria(self)])
+
+
+class _DeadlineStoppingCriteria(StoppingCriteria):
+    """Ends every sequence of a generate call when its deadline expires"""
+
+    def __init__(self, deadline: Deadline):
+        self.deadline = deadline
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.deadline.expired, dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,177 @@
+"""
+Near-duplicate detection for generated meme captions
+"""
+import re
+import random
+import hashlib
+from typing import Dict, List, Set, Tuple
+from .config import Config
+
+# Largest 61-bit Mersenne prime, used for the MinHash permutations
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Chance that a pair exactly at the similarity threshold shares an LSH band
+_BAND_RECALL = 0.95
+
+
+def lsh_bands(threshold: float, num_permutations: int) -> Tuple[int, int]:
+    """
+    Choose the LSH banding for a similarity threshold
+
+    A pair with similarity s shares at least one of b bands of r rows with
+    probability 1 - (1 - s^r)^b. This picks the most rows per band (fewest
+    false candidates) that still finds pairs at the threshold with
+    probability _BAND_RECALL, so lowering the threshold widens the search.
+
+    Args:
+        threshold: Similarity at which captions count as near-duplicates
+        num_permutations: Length of the MinHash signatures
+
+    Returns:
+        Tuple of (rows_per_band, bands)
+    """
+    for rows in range(num_permutations, 0, -1):
+        bands = num_permutations // rows
+        if 1 - (1 - threshold ** rows) ** bands >= _BAND_RECALL:
+            return rows, bands
+    return 1, num_permutations
+
+
+class CaptionDeduplicator:
+    """Incremental MinHash index over (top, bottom) caption pairs"""
+
+    def __init__(self, threshold: float = None, num_permutations: int = None,
+                 shingle_size: int = None, seed: int = 1):
+        self.config = Config()
+        self.threshold = threshold if threshold is not None else self.config.DEDUP_SIMILARITY_THRESHOLD
+        self.num_permutations = num_permutations or self.config.DEDUP_NUM_PERMUTATIONS
+        self.shingle_size = shingle_size or self.config.DEDUP_SHINGLE_SIZE
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(self.num_permutations)
+        ]
+
+        # LSH banding: two signatures sharing any band become comparison candidates
+        self._rows_per_band, num_bands = lsh_bands(self.threshold, self.num_permutations)
+        self._bands: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(num_bands)]
+
+        self._exact: Set[str] = set()
+        self._signatures: List[Tuple[int, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def normalize(top_text: str, bottom_text: str) -> str:
+        """
+        Normalize a caption pair for comparison
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+
+        Returns:
+            Lowercased caption pair without punctuation or repeated whitespace
+        """
+        text = f"{top_text} | {bottom_text}".lower()
+        text = re.sub(r"[^\w\s|]", "", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    def _shingles(self, text: str) -> Set[int]:
+        """Hash the character shingles of a normalized caption"""
+        size = min(self.shingle_size, len(text)) or 1
+        return {
+            int.from_bytes(hashlib.blake2b(text[i:i + size].encode("utf-8"), digest_size=4).digest(), "big")
+            for i in range(max(len(text) - size + 1, 1))
+        }
+
+    def signature(self, top_text: str, bottom_text: str) -> Tuple[int, ...]:
+        """
+        Compute the MinHash signature of a caption pair
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+
+        Returns:
+            Tuple of num_permutations minimum hash values
+        """
+        shingles = self._shingles(self.normalize(top_text, bottom_text))
+        return tuple(
+            min(((a * s + b) % _MERSENNE_PRIME) & _MAX_HASH for s in shingles)
+            for a, b in self._permutations
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """Estimate the Jaccard similarity of two MinHash signatures"""
+        return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+    def _band_keys(self, sig: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        """Split a signature into its per-band keys"""
+        rows = self._rows_per_band
+        return [sig[i * rows:(i + 1) * rows] for i in range(len(self._bands))]
+
+    def is_duplicate(self, top_text: str, bottom_text: str) -> bool:
+        """
+        Check whether a caption pair is a near-duplicate of an indexed one
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+
+        Returns:
+            True if an indexed caption reaches the similarity threshold
+        """
+        if self.normalize(top_text, bottom_text) in self._exact:
+            return True
+        return self._is_near_duplicate(self.signature(top_text, bottom_text))
+
+    def _is_near_duplicate(self, sig: Tuple[int, ...]) -> bool:
+        """Compare a signature with the indexed ones sharing a band with it"""
+        candidates = set()
+        for band, key in zip(self._bands, self._band_keys(sig)):
+            candidates.update(band.get(key, ()))
+        return any(self.similarity(sig, self._signatures[i]) >= self.threshold for i in candidates)
+
+    def add(self, top_text: str, bottom_text: str):
+        """
+        Add a caption pair to the index
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+        """
+        self._add(self.normalize(top_text, bottom_text), self.signature(top_text, bottom_text))
+
+    def _add(self, normalized: str, sig: Tuple[int, ...]):
+        """Index a normalized caption and its signature"""
+        index = len(self._signatures)
+        self._signatures.append(sig)
+        self._exact.add(normalized)
+        for band, key in zip(self._bands, self._band_keys(sig)):
+            band.setdefault(key, []).append(index)
+
+    def check_and_add(self, top_text: str, bottom_text: str) -> bool:
+        """
+        Check a caption pair against the index and add it if it is new
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+
+        Returns:
+            True if the caption pair was a near-duplicate (and was not added)
+        """
+        normalized = self.normalize(top_text, bottom_text)
+        if normalized in self._exact:
+            return True
+
+        sig = self.signature(top_text, bottom_text)
+        if self._is_near_duplicate(sig):
+            return True
+
+        self._add(normalized, sig)
+        return False
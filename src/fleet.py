@@ -0,0 +1,214 @@
+"""
+Fleet mode: workers on one or more hosts sharing a job queue and caches
+"""
+import logging
+import os
+import time
+import socket
+import threading
+from typing import Dict, Optional
+from .config import Config
+from .deadline import Deadline
+from .job_queue import SQLiteJobQueue, connect
+from .llm_cache import LLMCache
+from .template_selector import TemplateStatsStore, TemplateSelector, keyword_cluster
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCacheStore:
+    """Key-value cache in the fleet database, e.g. template descriptions shared by all workers"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (namespace, key)
+        );
+    """
+
+    def __init__(self, path: str, namespace: str):
+        """
+        Args:
+            path: Fleet database file
+            namespace: Cache name, so several caches can share the table
+        """
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached value, or None on a miss"""
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: str):
+        """Store a value, replacing any earlier one"""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)",
+            (self.namespace, key, value),
+        )
+
+
+class SharedTemplateStatsStore(TemplateStatsStore):
+    """
+    Template statistics in the fleet database
+
+    Outcomes are added with atomic upserts, so concurrent workers merge
+    their counts instead of overwriting each other's JSON file.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS template_stats (
+            cluster TEXT NOT NULL,
+            template_id TEXT NOT NULL,
+            accepted INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            llm_calls REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (cluster, template_id)
+        );
+    """
+
+    # Cluster key of the per-template totals
+    ALL = "*"
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Fleet database file
+        """
+        super().__init__(None)
+        self.db_path = path
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+        return conn
+
+    def record(self, keyword: str, template_id: str, accepted: bool, llm_calls: int):
+        column = "accepted" if accepted else "rejected"
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for cluster in (self.ALL, keyword_cluster(keyword)):
+                conn.execute(
+                    f"INSERT INTO template_stats (cluster, template_id, {column}, llm_calls) VALUES (?, ?, 1, ?) "
+                    f"ON CONFLICT (cluster, template_id) DO UPDATE SET "
+                    f"{column} = {column} + 1, llm_calls = llm_calls + excluded.llm_calls",
+                    (cluster, template_id, llm_calls),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, template_id: str, keyword: Optional[str] = None) -> Dict[str, int]:
+        cluster = self.ALL if keyword is None else keyword_cluster(keyword)
+        row = self._conn().execute(
+            "SELECT accepted, rejected, llm_calls FROM template_stats WHERE cluster = ? AND template_id = ?",
+            (cluster, template_id),
+        ).fetchone()
+        if row is None:
+            return self._empty()
+        return {"accepted": row[0], "rejected": row[1], "llm_calls": row[2]}
+
+
+def attach_shared_caches(agent, path: str):
+    """
+    Point an agent's caches at the fleet's shared storage
+
+    Template descriptions and template statistics move into the fleet
+    database. With Config.LLM_CACHE_ENABLED, LLM outputs cached per
+    Config.LLM_CACHE_POLICIES (humor scores and description expansions) go to
+    an on-disk cache next to it; otherwise the LLM stays uncached.
+
+    Args:
+        agent: MemeAgent of a worker
+        path: Fleet database file
+    """
+    agent.image_processor.shared_cache = SharedCacheStore(path, "descriptions")
+    if agent.template_selector is not None:
+        agent.template_selector = TemplateSelector(SharedTemplateStatsStore(path))
+    if Config.LLM_CACHE_ENABLED:
+        agent.model_manager.cache = LLMCache(disk_dir=os.path.join(os.path.dirname(os.path.abspath(path)), "llm_cache"))
+
+
+class FleetWorker:
+    """Runs a warm MemeAgent over jobs leased from the shared queue"""
+
+    def __init__(self, agent, queue: SQLiteJobQueue, worker_id: Optional[str] = None, retry_limit: int = 3):
+        """
+        Args:
+            agent: Initialized MemeAgent kept warm across jobs
+            queue: Shared job queue
+            worker_id: Name of this worker in leases (host:pid if omitted)
+            retry_limit: Maximum retry attempts per meme
+        """
+        self.config = Config()
+        self.agent = agent
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.retry_limit = retry_limit
+
+    def run(self, exit_when_drained: bool = True) -> Dict[str, int]:
+        """
+        Process jobs until the queue is drained (or forever)
+
+        Args:
+            exit_when_drained: Stop once no job is pending or leased; otherwise keep polling
+
+        Returns:
+            Dict with completed, failed and lost counts for this worker
+        """
+        summary = {"completed": 0, "failed": 0, "lost": 0}
+        logger.info("Worker %s polling %s", self.worker_id, self.queue.path)
+        while True:
+            job = self.queue.lease(self.worker_id)
+            if job is None:
+                if exit_when_drained and self.queue.is_drained():
+                    return summary
+                time.sleep(self.config.FLEET_POLL_INTERVAL)
+                continue
+            summary[self._process(job)] += 1
+
+    def _process(self, job: Dict) -> str:
+        """Run one job while a heartbeat thread keeps its lease alive"""
+        logger.info("Worker %s took job %d ('%s', lease %d)", self.worker_id, job["id"], job["keyword"], job["attempts"])
+        deadline = Deadline(self.config.REQUEST_DEADLINE)
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job["id"], deadline, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.agent.generate_meme_result(job["keyword"], self.retry_limit, deadline=deadline)
+        except Exception as e:
+            self.queue.fail(job["id"], self.worker_id, str(e))
+            return "failed"
+        finally:
+            done.set()
+            heartbeat.join()
+
+        return "completed" if self.queue.complete(job["id"], self.worker_id, result) else "lost"
+
+    def _heartbeat(self, job_id: int, deadline: Deadline, done: threading.Event):
+        """Extend the lease until the job finishes; cancel the job if the lease was taken over"""
+        try:
+            while not done.wait(self.queue.lease_seconds / 3):
+                if not self.queue.heartbeat(job_id, self.worker_id):
+                    logger.warning("Worker %s lost the lease on job %d, cancelling it", self.worker_id, job_id)
+                    deadline.cancel()
+                    return
+        finally:
+            self.queue.close()
@@ -0,0 +1,446 @@
+"""
+Continuous (iteration-level) batching for the text model over a block-managed KV cache
+"""
+import math
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+import torch
+from transformers import DynamicCache
+from .config import Config
+from .deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+class BlockKVCache:
+    """
+    Preallocated key/value memory handed out to sequences in fixed-size blocks
+
+    Memory for every layer is allocated once, as slots of block_size
+    tokens. A sequence reserves the blocks for its prompt plus its token
+    limit when it is admitted and returns them when it finishes, so the
+    cache never grows, never fragments and bounds how many sequences can
+    run at once.
+    """
+
+    def __init__(self, num_layers: int, num_heads: int, head_dim: int, num_blocks: int, block_size: int,
+                 dtype: torch.dtype, device: torch.device):
+        """
+        Args:
+            num_layers: Decoder layers of the model
+            num_heads: Key/value heads per layer
+            head_dim: Size of each head
+            num_blocks: Blocks to preallocate
+            block_size: Tokens per block
+            dtype: dtype of the model's key/value states
+            device: Device of the model
+        """
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        shape = (num_layers, num_blocks * block_size, num_heads, head_dim)
+        self.keys = torch.zeros(shape, dtype=dtype, device=device)
+        self.values = torch.zeros(shape, dtype=dtype, device=device)
+        self._free = list(range(num_blocks - 1, -1, -1))
+
+    @property
+    def free_blocks(self) -> int:
+        return len(self._free)
+
+    def blocks_for(self, tokens: int) -> int:
+        """Blocks needed to hold the given number of tokens"""
+        return math.ceil(tokens / self.block_size)
+
+    def allocate(self, count: int) -> List[int]:
+        """Take blocks off the free list (the caller checks free_blocks first)"""
+        return [self._free.pop() for _ in range(count)]
+
+    def free(self, blocks: List[int]):
+        """Return a finished sequence's blocks"""
+        self._free.extend(reversed(blocks))
+
+    def slots(self, table: List[int], start: int, end: int) -> torch.Tensor:
+        """Flat slot indices of token positions [start, end) of a sequence"""
+        positions = torch.arange(start, end)
+        blocks = torch.tensor(table, dtype=torch.long)[positions // self.block_size]
+        return blocks * self.block_size + positions % self.block_size
+
+    def write(self, layer: int, slots: torch.Tensor, keys: torch.Tensor, values: torch.Tensor):
+        """
+        Store key/value states in the given slots
+
+        Args:
+            layer: Layer index
+            slots: Slot index per token, shape (tokens,)
+            keys: Key states, shape (heads, tokens, head_dim)
+            values: Value states, shape (heads, tokens, head_dim)
+        """
+        slots = slots.to(self.keys.device)
+        self.keys[layer].index_copy_(0, slots, keys.transpose(0, 1))
+        self.values[layer].index_copy_(0, slots, values.transpose(0, 1))
+
+    def gather(self, layer: int, slots: torch.Tensor):
+        """
+        Read a batch of sequences as contiguous key/value tensors
+
+        Args:
+            layer: Layer index
+            slots: Slot index per (sequence, position), shape (batch, length)
+
+        Returns:
+            Keys and values of shape (batch, heads, length, head_dim)
+        """
+        batch, length = slots.shape
+        flat = slots.reshape(-1).to(self.keys.device)
+        keys = self.keys[layer].index_select(0, flat).view(batch, length, *self.keys.shape[2:])
+        values = self.values[layer].index_select(0, flat).view(batch, length, *self.values.shape[2:])
+        return keys.transpose(1, 2), values.transpose(1, 2)
+
+
+class _Sequence:
+    """One generation request inside the engine"""
+
+    def __init__(self, input_ids: torch.Tensor, max_new_tokens: int, temperature: float, top_p: float,
+                 deadline: Optional[Deadline]):
+        self.prompt = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.deadline = deadline
+        self.future: Future = Future()
+        self.tokens: List[int] = []
+        self.blocks: List[int] = []
+        self.length = 0  # tokens whose key/value states are cached
+        self.forwards = 0
+        self.submitted = time.perf_counter()
+
+
+class GenerationEngine:
+    """
+    Decodes many text generation requests together, one token per step
+
+    Requests join the running batch as soon as there is room for them and
+    leave it the step they finish, so a short scoring reply never waits
+    for a long description expansion to complete, and the model's weights
+    are read once per step for every running sequence instead of once per
+    sequence. Each step first prefills newly admitted prompts, then runs
+    one batched decode step over all running sequences.
+
+    Key/value states live in a BlockKVCache. Without a paged-attention
+    kernel the running batch's blocks are gathered into a contiguous cache
+    for each step; that copy costs about as much as the attention itself,
+    which is small beside the weight matmuls of a 7B model.
+    """
+
+    def __init__(self, model, eos_token_ids: Sequence[int], max_batch: Optional[int] = None,
+                 kv_cache_mb: Optional[int] = None, block_size: Optional[int] = None,
+                 thread_init: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            model: Causal language model (transformers)
+            eos_token_ids: Tokens that end a sequence
+            max_batch: Sequences decoded per step (Config.ENGINE_MAX_BATCH if omitted)
+            kv_cache_mb: Preallocated KV cache size (Config.ENGINE_KV_CACHE_MB if omitted)
+            block_size: Tokens per KV block (Config.ENGINE_BLOCK_SIZE if omitted)
+            thread_init: Called on the engine thread when it starts (e.g. to pin it to cores)
+        """
+        self.config = Config()
+        self.model = model
+        self.eos_token_ids = set(eos_token_ids)
+        self.max_batch = max_batch or self.config.ENGINE_MAX_BATCH
+        self.kv_cache_mb = kv_cache_mb or self.config.ENGINE_KV_CACHE_MB
+        self.block_size = block_size or self.config.ENGINE_BLOCK_SIZE
+        self.thread_init = thread_init
+        self.cache: Optional[BlockKVCache] = None
+        self._waiting: "deque[_Sequence]" = deque()
+        self._running: List[_Sequence] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"requests": 0, "steps": 0, "generated_tokens": 0, "prefill_tokens": 0,
+                       "batch_size_sum": 0, "max_batch": 0, "seconds": 0.0, "queue_seconds": 0.0}
+
+    def submit(self, input_ids: torch.Tensor, max_new_tokens: int, temperature: float = 0.0,
+               top_p: float = 1.0, deadline: Optional[Deadline] = None) -> Future:
+        """
+        Queue a prompt for generation
+
+        Args:
+            input_ids: Prompt token ids, shape (length,) or (1, length)
+            max_new_tokens: Generation length limit
+            temperature: Sampling temperature (0 for greedy decoding)
+            top_p: Nucleus sampling probability mass
+            deadline: Request deadline; the sequence stops at the next step once it expires
+
+        Returns:
+            Future resolving to a dict with tokens (new token ids) and forwards
+            (model passes the sequence took part in); it fails with ValueError
+            if the prompt and token limit need more KV blocks than the cache holds
+        """
+        sequence = _Sequence(input_ids.reshape(-1).cpu(), max_new_tokens, temperature, top_p, deadline)
+        with self._lock:
+            # The cache is sized by the first prefill; until then _admit and _prefill check instead
+            error = self._check_fits(sequence)
+            if error is not None:
+                sequence.future.set_exception(error)
+                return sequence.future
+            self._waiting.append(sequence)
+            self._stats["requests"] += 1
+            if self._thread is None:
+                # The loop thread exits whenever the engine runs dry, dropping its references;
+                # it is not a daemon so interpreter exit waits for in-flight steps to finish
+                self._thread = threading.Thread(target=self._loop, name="generation-engine")
+                self._thread.start()
+        return sequence.future
+
+    def _loop(self):
+        if self.thread_init is not None:
+            self.thread_init()
+        while True:
+            with self._lock:
+                if not self._waiting and not self._running:
+                    self._thread = None
+                    return
+            try:
+                self._step()
+            except Exception as e:
+                # Prefill and decode failures are handled in _step; this is the last resort.
+                # Fail the running batch, or the head of the queue if nothing is running, so the loop progresses.
+                logger.warning("Generation engine step failed: %s", e)
+                with self._lock:
+                    failed = list(self._running) or ([self._waiting.popleft()] if self._waiting else [])
+                self._fail(failed, e)
+
+    def _step(self):
+        """Admit and prefill waiting sequences, then decode one token for every running one"""
+        start = time.perf_counter()
+        for sequence in self._admit():
+            try:
+                self._prefill(sequence)
+            except Exception as e:
+                logger.warning("Prefill of a %d-token prompt failed: %s", len(sequence.prompt), e)
+                self._fail([sequence], e)
+        self._retire()
+        if self._running:
+            batch = list(self._running)
+            try:
+                self._decode(batch)
+            except Exception as e:
+                # Only the sequences of this step fail; waiting ones are admitted next step
+                logger.warning("Decode step over %d sequences failed: %s", len(batch), e)
+                self._fail(batch, e)
+            self._retire()
+        with self._lock:
+            self._stats["seconds"] += time.perf_counter() - start
+
+    def _fail(self, sequences: List[_Sequence], error: Exception):
+        """Take sequences out of the engine and fail their futures"""
+        with self._lock:
+            self._running = [sequence for sequence in self._running if sequence not in sequences]
+        for sequence in sequences:
+            self._release(sequence)
+            if not sequence.future.done():
+                sequence.future.set_exception(error)
+
+    def _check_fits(self, sequence: _Sequence) -> Optional[ValueError]:
+        """Error for a sequence needing more KV blocks than the whole cache (None if it fits or no cache yet)"""
+        if self.cache is None:
+            return None
+        needed = self.cache.blocks_for(len(sequence.prompt) + sequence.max_new_tokens)
+        if needed > self.cache.num_blocks:
+            return ValueError(f"Prompt and token limit need {needed} KV blocks, "
+                              f"the cache has {self.cache.num_blocks}")
+        return None
+
+    def _admit(self) -> List[_Sequence]:
+        """Move waiting sequences into the batch while there is room and KV memory for them"""
+        admitted = []
+        with self._lock:
+            while self._waiting and len(self._running) < self.max_batch:
+                sequence = self._waiting[0]
+                if sequence.deadline is not None and sequence.deadline.expired:
+                    self._waiting.popleft()
+                    sequence.future.set_result({"tokens": [], "forwards": 0})
+                    continue
+                if self.cache is not None:
+                    # Sequences submitted before the first prefill sized the cache are checked here
+                    error = self._check_fits(sequence)
+                    if error is not None:
+                        self._waiting.popleft()
+                        sequence.future.set_exception(error)
+                        continue
+                    needed = self.cache.blocks_for(len(sequence.prompt) + sequence.max_new_tokens)
+                    if needed > self.cache.free_blocks:
+                        # First come, first served: later requests do not overtake a large one
+                        break
+                    sequence.blocks = self.cache.allocate(needed)
+                self._waiting.popleft()
+                self._stats["queue_seconds"] += time.perf_counter() - sequence.submitted
+                self._running.append(sequence)
+                admitted.append(sequence)
+                if self.cache is None:
+                    # The cache is sized from the first prefill; admit one sequence until then
+                    break
+        return admitted
+
+    def _allocate_cache(self, kv):
+        """Size the block cache from the model's first key/value states"""
+        keys = kv[0][0]
+        num_heads, head_dim = keys.shape[1], keys.shape[3]
+        bytes_per_block = 2 * len(kv) * self.block_size * num_heads * head_dim * keys.element_size()
+        num_blocks = max(int(self.kv_cache_mb * 2**20 // bytes_per_block), 1)
+        self.cache = BlockKVCache(len(kv), num_heads, head_dim, num_blocks, self.block_size,
+                                  keys.dtype, keys.device)
+        logger.info("KV cache: %d blocks of %d tokens (%d MB)", num_blocks, self.block_size, self.kv_cache_mb)
+
+    def _prefill(self, sequence: _Sequence):
+        """Run a new prompt through the model and store its key/value states"""
+        device = self.model.device
+        input_ids = sequence.prompt.unsqueeze(0).to(device)
+        with torch.inference_mode():
+            output = self.model(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                position_ids=torch.arange(input_ids.shape[1], device=device).unsqueeze(0),
+                past_key_values=DynamicCache(),
+                use_cache=True,
+            )
+        kv = [(layer[0], layer[1]) for layer in output.past_key_values]
+        if self.cache is None:
+            self._allocate_cache(kv)
+            error = self._check_fits(sequence)
+            if error is not None:
+                raise error
+            sequence.blocks = self.cache.allocate(
+                self.cache.blocks_for(len(sequence.prompt) + sequence.max_new_tokens)
+            )
+
+        slots = self.cache.slots(sequence.blocks, 0, len(sequence.prompt))
+        for layer, (keys, values) in enumerate(kv):
+            self.cache.write(layer, slots, keys[0], values[0])
+        sequence.length = len(sequence.prompt)
+        sequence.forwards += 1
+        sequence.tokens.append(self._sample(output.logits[:, -1], [sequence])[0])
+        with self._lock:
+            self._stats["prefill_tokens"] += len(sequence.prompt)
+            self._stats["generated_tokens"] += 1
+
+    def _decode(self, batch: List[_Sequence]):
+        """Feed every running sequence its last token and sample the next one"""
+        device = self.model.device
+        length = max(sequence.length for sequence in batch)
+        slots = torch.zeros((len(batch), length), dtype=torch.long)
+        # Cached positions of each sequence, then the token being fed (always the last column)
+        attention_mask = torch.zeros((len(batch), length + 1), dtype=torch.long)
+        for row, sequence in enumerate(batch):
+            slots[row, :sequence.length] = self.cache.slots(sequence.blocks, 0, sequence.length)
+            attention_mask[row, :sequence.length] = 1
+        attention_mask[:, -1] = 1
+
+        past = DynamicCache()
+        for layer in range(self.cache.keys.shape[0]):
+            past.update(*self.cache.gather(layer, slots), layer)
+
+        input_ids = torch.tensor([[sequence.tokens[-1]] for sequence in batch], device=device)
+        position_ids = torch.tensor([[sequence.length] for sequence in batch], device=device)
+        with torch.inference_mode():
+            output = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask.to(device),
+                position_ids=position_ids,
+                past_key_values=past,
+                use_cache=True,
+            )
+
+        new_slots = [self.cache.slots(sequence.blocks, sequence.length, sequence.length + 1) for sequence in batch]
+        for layer, kv in enumerate(output.past_key_values):
+            keys, values = kv[0][:, :, -1:], kv[1][:, :, -1:]
+            for row, slot in enumerate(new_slots):
+                self.cache.write(layer, slot, keys[row], values[row])
+        next_tokens = self._sample(output.logits[:, -1], batch)
+        for sequence, token in zip(batch, next_tokens):
+            sequence.length += 1
+            sequence.forwards += 1
+            sequence.tokens.append(token)
+        with self._lock:
+            self._stats["steps"] += 1
+            self._stats["generated_tokens"] += len(batch)
+            self._stats["batch_size_sum"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+
+    @staticmethod
+    def _sample(logits: torch.Tensor, batch: List[_Sequence]) -> List[int]:
+        """Pick each sequence's next token, greedily or by nucleus sampling"""
+        tokens = []
+        for row, sequence in enumerate(batch):
+            if sequence.temperature <= 0:
+                tokens.append(int(logits[row].argmax()))
+                continue
+            probs = torch.softmax(logits[row].float() / sequence.temperature, dim=-1)
+            if sequence.top_p < 1.0:
+                sorted_probs, order = probs.sort(descending=True)
+                # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+                keep = sorted_probs.cumsum(0) - sorted_probs < sequence.top_p
+                probs = torch.zeros_like(probs).scatter_(0, order[keep], sorted_probs[keep])
+            tokens.append(int(torch.multinomial(probs, 1)))
+        return tokens
+
+    def _finished(self, sequence: _Sequence) -> bool:
+        return (
+            sequence.tokens[-1] in self.eos_token_ids
+            or len(sequence.tokens) >= sequence.max_new_tokens
+            or (sequence.deadline is not None and sequence.deadline.expired)
+        )
+
+    def _retire(self):
+        """Remove finished sequences from the batch and resolve their futures"""
+        with self._lock:
+            finished = [sequence for sequence in self._running if self._finished(sequence)]
+            self._running = [sequence for sequence in self._running if sequence not in finished]
+        for sequence in finished:
+            self._release(sequence)
+            tokens = sequence.tokens
+            if tokens and tokens[-1] in self.eos_token_ids:
+                tokens = tokens[:-1]
+            sequence.future.set_result({"tokens": tokens, "forwards": sequence.forwards})
+
+    def _release(self, sequence: _Sequence):
+        if sequence.blocks and self.cache is not None:
+            with self._lock:
+                self.cache.free(sequence.blocks)
+            sequence.blocks = []
+
+    def generate(self, input_ids: torch.Tensor, max_new_tokens: int, temperature: float = 0.0,
+                 top_p: float = 1.0, deadline: Optional[Deadline] = None) -> Dict:
+        """Submit a prompt and wait for its tokens (see submit)"""
+        return self.submit(input_ids, max_new_tokens, temperature, top_p, deadline).result()
+
+    def stats(self) -> Dict:
+        """
+        Get engine statistics
+
+        Returns:
+            Dict with requests, steps, generated and prefill tokens, mean and max
+            batch size, tokens_per_sec (generated tokens over time spent
+            stepping), mean queue wait and KV block usage
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            running, waiting = len(self._running), len(self._waiting)
+            blocks = (self.cache.num_blocks, self.cache.free_blocks) if self.cache is not None else (0, 0)
+        return {
+            "requests": stats["requests"],
+            "running": running,
+            "waiting": waiting,
+            "steps": stats["steps"],
+            "generated_tokens": stats["generated_tokens"],
+            "prefill_tokens": stats["prefill_tokens"],
+            "mean_batch": stats["batch_size_sum"] / stats["steps"] if stats["steps"] else 0.0,
+            "max_batch": stats["max_batch"],
+            "tokens_per_sec": stats["generated_tokens"] / stats["seconds"] if stats["seconds"] else 0.0,
+            "mean_queue_seconds": stats["queue_seconds"] / stats["requests"] if stats["requests"] else 0.0,
+            "kv_blocks": blocks[0],
+            "kv_blocks_free": blocks[1],
+        }
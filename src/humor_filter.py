@@ -0,0 +1,284 @@
+"""
+Cheap pre-filter cascade run before the LLM humor scorer
+"""
+import logging
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .config import Config
+from .dedup import CaptionDeduplicator
+
+logger = logging.getLogger(__name__)
+
+# The example pair shown in the caption prompt; copies of it are never funny
+PROMPT_EXAMPLE = ("When Monday hits too hard", "And coffee hasn't kicked in yet")
+
+
+class CaptionEmbedder:
+    """Sentence embeddings for caption pairs with an in-memory LRU cache"""
+
+    HASHING_DIM = 512
+
+    def __init__(self, model_name: Optional[str] = None, cache_size: Optional[int] = None):
+        """
+        Args:
+            model_name: sentence-transformers model, or "hashing" for the dependency-free
+                hashed n-gram features (Config.PREFILTER_EMBEDDING_MODEL if omitted)
+            cache_size: Maximum number of cached embeddings
+        """
+        self.config = Config()
+        self.model_name = model_name or self.config.PREFILTER_EMBEDDING_MODEL
+        self.cache_size = cache_size or self.config.PREFILTER_EMBEDDING_CACHE_SIZE
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = None
+
+        if self.model_name != "hashing":
+            try:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name, device="cpu")
+            except Exception as e:
+                logger.warning("Sentence embedding model unavailable (%s), using hashed n-gram features", e)
+                self.model_name = "hashing"
+
+    def _hashing_embed(self, text: str) -> np.ndarray:
+        """Hash word unigrams, bigrams and character trigrams into a fixed-size vector"""
+        words = re.findall(r"\w+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        joined = " ".join(words)
+        features += [f"#{joined[i:i + 3]}" for i in range(len(joined) - 2)]
+
+        vec = np.zeros(self.HASHING_DIM, dtype=np.float32)
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest()
+            h = int.from_bytes(digest, "big")
+            vec[h % self.HASHING_DIM] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def embed(self, top_text: str, bottom_text: str) -> np.ndarray:
+        """
+        Embed a caption pair
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+
+        Returns:
+            1-D embedding vector
+        """
+        text = f"{top_text}\n{bottom_text}"
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return self._cache[text]
+
+        if self._model is not None:
+            vec = self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+        else:
+            vec = self._hashing_embed(text)
+
+        with self._lock:
+            self._cache[text] = vec
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return vec
+
+
+class CaptionClassifier:
+    """Logistic regression predicting whether a caption pair passes the humor threshold"""
+
+    def __init__(self, weights: np.ndarray, bias: float, embedding_model: str):
+        self.weights = weights
+        self.bias = bias
+        self.embedding_model = embedding_model
+
+    def predict_proba(self, embedding: np.ndarray) -> float:
+        """
+        Probability that a caption pair reaches the humor threshold
+
+        Args:
+            embedding: Embedding of the caption pair
+
+        Returns:
+            Probability between 0 and 1
+        """
+        return float(1.0 / (1.0 + np.exp(-(embedding @ self.weights + self.bias))))
+
+    @classmethod
+    def train(cls, records: Iterable[Dict], embedder: CaptionEmbedder, threshold: Optional[int] = None,
+              epochs: int = 300, learning_rate: float = 0.5, l2: float = 1e-3) -> "CaptionClassifier":
+        """
+        Fit the classifier on logged LLM humor scores
+
+        Args:
+            records: Dicts with top_text, bottom_text and score keys
+            embedder: Embedder used for the features
+            threshold: Score counted as funny (Config.HUMOR_SCORE_THRESHOLD if omitted)
+            epochs: Full-batch gradient descent steps
+            learning_rate: Gradient descent step size
+            l2: L2 regularization strength
+
+        Returns:
+            Trained classifier
+        """
+        threshold = threshold if threshold is not None else Config.HUMOR_SCORE_THRESHOLD
+        records = list(records)
+        if not records:
+            raise ValueError("No logged scores to train on")
+
+        X = np.stack([embedder.embed(r["top_text"], r["bottom_text"]) for r in records])
+        y = np.array([r["score"] >= threshold for r in records], dtype=np.float32)
+
+        # Re-weight classes so a mostly-unfunny log does not collapse to "always reject"
+        pos = max(y.mean(), 1e-3)
+        sample_weight = np.where(y == 1, 0.5 / pos, 0.5 / max(1 - pos, 1e-3))
+
+        weights = np.zeros(X.shape[1], dtype=np.float32)
+        bias = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(X @ weights + bias)))
+            grad = sample_weight * (p - y)
+            weights -= learning_rate * (X.T @ grad / len(y) + l2 * weights)
+            bias -= learning_rate * float(grad.mean())
+
+        return cls(weights, bias, embedder.model_name)
+
+    def save(self, path: str):
+        """Save the classifier to an .npz file"""
+        np.savez(path, weights=self.weights, bias=self.bias, embedding_model=self.embedding_model)
+
+    @classmethod
+    def load(cls, path: str) -> "CaptionClassifier":
+        """Load a classifier saved with save()"""
+        data = np.load(path)
+        return cls(data["weights"], float(data["bias"]), str(data["embedding_model"]))
+
+
+def load_score_log(path: str) -> List[Dict]:
+    """
+    Read the humor score log written by CaptionGenerator.score_humor
+
+    Args:
+        path: JSONL file with one scored caption pair per line
+
+    Returns:
+        List of score records
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class HumorPrefilter:
+    """Rule checks and a local classifier that settle obvious cases before the LLM scorer"""
+
+    def __init__(self, classifier_path: Optional[str] = None):
+        """
+        Args:
+            classifier_path: Trained classifier (Config.PREFILTER_CLASSIFIER_PATH if omitted);
+                without one only the rule stage runs
+        """
+        self.config = Config()
+        self.threshold = self.config.HUMOR_SCORE_THRESHOLD
+        self._example_index = CaptionDeduplicator(threshold=self.config.PREFILTER_EXAMPLE_SIMILARITY)
+        self._example_index.add(*PROMPT_EXAMPLE)
+
+        self.classifier = None
+        self.embedder = None
+        classifier_path = classifier_path or self.config.PREFILTER_CLASSIFIER_PATH
+        if classifier_path:
+            try:
+                self.classifier = CaptionClassifier.load(classifier_path)
+                self.embedder = CaptionEmbedder(self.classifier.embedding_model)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Error loading humor pre-filter classifier: %s", e)
+
+        self._lock = threading.Lock()
+        self._counts = {"evaluated": 0, "rule_rejected": 0, "classifier_rejected": 0,
+                        "classifier_accepted": 0, "escalated": 0}
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return re.findall(r"\w+", text.lower())
+
+    def check_rules(self, top_text: str, bottom_text: str, keyword: Optional[str] = None) -> Optional[str]:
+        """
+        Run the rule and length checks
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+            keyword: Keyword the meme was generated for
+
+        Returns:
+            Reason the caption is rejected, or None if it passes
+        """
+        max_chars = self.config.PREFILTER_MAX_LINE_CHARS
+        if len(top_text) > max_chars or len(bottom_text) > max_chars:
+            return "too long for the template"
+
+        top_words, bottom_words = self._words(top_text), self._words(bottom_text)
+        if top_words == bottom_words:
+            return "top and bottom are identical"
+
+        if keyword:
+            keyword_words = set(self._words(keyword))
+            keyword_words |= {f"{w}s" for w in keyword_words}
+            if set(top_words + bottom_words) <= keyword_words:
+                return "only repeats the keyword"
+
+        if self._example_index.is_duplicate(top_text, bottom_text):
+            return "copies the prompt example"
+        example_lines = {" ".join(self._words(line)) for line in PROMPT_EXAMPLE}
+        if " ".join(top_words) in example_lines or " ".join(bottom_words) in example_lines:
+            return "copies the prompt example"
+
+        return None
+
+    def evaluate(self, top_text: str, bottom_text: str, keyword: Optional[str] = None) -> Optional[int]:
+        """
+        Settle a caption pair without the LLM if possible
+
+        Args:
+            top_text: Top text of the meme
+            bottom_text: Bottom text of the meme
+            keyword: Keyword the meme was generated for
+
+        Returns:
+            Estimated humor score from 0-10, or None if the LLM scorer must decide
+        """
+        outcome, score = "escalated", None
+
+        reason = self.check_rules(top_text, bottom_text, keyword)
+        if reason:
+            logger.debug("Pre-filter rejected caption: %s", reason)
+            outcome, score = "rule_rejected", 0
+        elif self.classifier is not None:
+            p = self.classifier.predict_proba(self.embedder.embed(top_text, bottom_text))
+            estimate = int(round(1 + 9 * p))
+            if p < self.config.PREFILTER_REJECT_BELOW:
+                outcome, score = "classifier_rejected", min(estimate, self.threshold - 1)
+            elif p > self.config.PREFILTER_ACCEPT_ABOVE:
+                outcome, score = "classifier_accepted", max(estimate, self.threshold)
+
+        with self._lock:
+            self._counts["evaluated"] += 1
+            self._counts[outcome] += 1
+        return score
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get pre-filter counters
+
+        Returns:
+            Dict with per-stage counts and the fraction of LLM scorer calls avoided
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        evaluated = stats["evaluated"]
+        stats["llm_calls_avoided"] = (evaluated - stats["escalated"]) / evaluated if evaluated else 0.0
+        return stats
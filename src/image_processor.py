@@ -1,55 +1,286 @@
 """
 Image processing and captioning functionality
 """
+import logging
+import io
+import re
+import threading
 import requests
+import torch
+from collections import OrderedDict
 from PIL import Image
-from typing import Optional
+from typing import List, Optional
 from .models import ModelManager
 from .config import Config
+from .deadline import Deadline, DeadlineExceeded
+from .prompt_builder import compact_prompt
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Returned when an image cannot be captioned; never cached so the next request retries
+FALLBACK_CAPTION = "A person in a scene"
 
 class ImageProcessor:
     """Handles image processing and captioning"""
     
-    def __init__(self):
-        self.model_manager = ModelManager()
+    def __init__(self, model_manager: Optional[ModelManager] = None):
+        self.model_manager = model_manager or ModelManager()
         self.config = Config()
+        self._descriptions: "OrderedDict[tuple, str]" = OrderedDict()
+        self._descriptions_lock = threading.Lock()
+        # Optional store shared with other workers (see fleet.attach_shared_caches)
+        self.shared_cache = None
+        # Concurrent requests for the same image share one download and one description
+        self.download_flight = SingleFlight("image_download")
+        self.describe_flight = SingleFlight("describe_image")
     
-    def get_base_caption(self, image_url: str) -> str:
+    def get_base_caption(self, image_url: str, deadline: Optional[Deadline] = None) -> str:
         """
         Get a basic caption for an image using BLIP
         
         Args:
             image_url: URL of the image to caption
+            deadline: Request deadline bounding the download and caption generation
             
         Returns:
             Basic caption string
         """
         try:
             # Download and process image
-            img = Image.open(requests.get(image_url, stream=True).raw).convert("RGB")
+            img = self._load_image(image_url, deadline)
             
             # Generate caption
-            inputs = self.model_manager.blip_processor(img, return_tensors="pt").to("cpu")
-            out = self.model_manager.blip_model.generate(inputs, max_length=60)
-            caption = self.model_manager.blip_processor.decode(out[0], skip_special_tokens=True)
+            return self._caption(self._pixel_values(img), [""], deadline)[0]
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning("Error generating base caption: %s", e)
+            return FALLBACK_CAPTION
+    
+    @property
+    def blip_image_size(self) -> int:
+        """Square input resolution of the BLIP vision encoder"""
+        size = self.model_manager.blip_processor.image_processor.size
+        height = size.get("height") if hasattr(size, "get") else getattr(size, "height", None)
+        return int(height or 384)
+    
+    @staticmethod
+    def _generate_kwargs(deadline: Optional[Deadline]) -> dict:
+        """Extra generate() arguments stopping BLIP decoding once the deadline expires"""
+        return {"stopping_criteria": deadline.stopping_criteria()} if deadline is not None else {}
+    
+    def _fetch_image_bytes(self, image_url: str, deadline: Optional[Deadline] = None) -> bytes:
+        """
+        Download an image, refusing anything over Config.IMAGE_MAX_BYTES
+        
+        Concurrent downloads of the same URL are coalesced into one.
+        
+        Args:
+            image_url: URL of the image
+            deadline: Request deadline bounding the download timeout
+            
+        Returns:
+            Raw (encoded) image bytes
+        """
+        return self.download_flight.do(image_url, lambda: self._download(image_url, deadline), deadline)
+    
+    def _download(self, image_url: str, deadline: Optional[Deadline] = None) -> bytes:
+        """Download an image, streaming it so the size limit applies before it is all read"""
+        max_bytes = self.config.IMAGE_MAX_BYTES
+        timeout = deadline.timeout(self.config.IMAGE_FETCH_TIMEOUT) if deadline else self.config.IMAGE_FETCH_TIMEOUT
+        with requests.get(image_url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise ValueError(f"Image is {int(length)} bytes, limit is {max_bytes}")
+            
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                data += chunk
+                if len(data) > max_bytes:
+                    raise ValueError(f"Image exceeds {max_bytes} bytes")
+                if deadline is not None:
+                    deadline.check("end of image download")
+        return bytes(data)
+    
+    def _decode_image(self, data: bytes, target_size: int) -> Image.Image:
+        """
+        Decode an image at roughly the scale the captioner needs
+        
+        The header is checked against Config.IMAGE_MAX_PIXELS before any pixel
+        data is decoded. JPEGs are decoded in draft mode, letting libjpeg
+        scale by 1/2, 1/4 or 1/8 while decoding; other formats are reduced
+        by an integer factor right after decoding.
+        
+        Args:
+            data: Encoded image bytes
+            target_size: Side length the image will be resized to
             
-            return caption
+        Returns:
+            RGB image no smaller than target_size on its shorter side (unless the source is)
+        """
+        img = Image.open(io.BytesIO(data))
+        width, height = img.size
+        if width * height > self.config.IMAGE_MAX_PIXELS:
+            raise ValueError(f"Image is {width}x{height}, limit is {self.config.IMAGE_MAX_PIXELS} pixels")
+        
+        if img.format == "JPEG":
+            img.draft("RGB", (target_size, target_size))
+        
+        img = img.convert("RGB")
+        
+        factor = min(img.size) // target_size
+        if factor >= 2:
+            img = img.reduce(factor)
+        return img
+    
+    def _load_image(self, image_url: str, deadline: Optional[Deadline] = None) -> Image.Image:
+        """Download an image within the size limits and decode it near BLIP's input scale"""
+        return self._decode_image(self._fetch_image_bytes(image_url, deadline), self.blip_image_size)
+    
+    def _pixel_values(self, img: Image.Image) -> torch.Tensor:
+        """Resize once to the BLIP input resolution and convert to a normalized tensor"""
+        size = self.blip_image_size
+        if img.size != (size, size):
+            img = img.resize((size, size), Image.BICUBIC)
+        return self.model_manager.blip_processor(
+            images=img, do_resize=False, return_tensors="pt"
+        )["pixel_values"]
+    
+    def get_guided_captions(self, image_url: str, prefixes: Optional[List[str]] = None,
+                            deadline: Optional[Deadline] = None) -> List[str]:
+        """
+        Caption an image once per guiding prefix using BLIP conditional captioning
+        
+        The vision encoder runs once; its output is shared by a batched text
+        decoder pass over all prefixes of the same token length.
+        
+        Args:
+            image_url: URL of the image to caption
+            prefixes: Text the captions must start with ("" for an unconditional caption)
+            deadline: Request deadline bounding the download and caption generation
             
+        Returns:
+            One caption per prefix, in prefix order
+        """
+        prefixes = prefixes if prefixes is not None else self.config.FAST_DESCRIPTION_PREFIXES
+        
+        img = self._load_image(image_url, deadline)
+        return self._caption(self._pixel_values(img), prefixes, deadline)
+    
+    def _caption(self, pixel_values: torch.Tensor, prefixes: List[str],
+                 deadline: Optional[Deadline] = None) -> List[str]:
+        """Encode an image and decode one caption per prefix, on BLIP's cores when they are partitioned"""
+        with self.model_manager.lifecycle.hold("blip"):
+            return self.model_manager.run_on(
+                "vision",
+                lambda: self._decode_captions(self.model_manager.blip_vision(pixel_values), prefixes, deadline),
+            )
+    
+    def _decode_captions(self, image_embeds: torch.Tensor, prefixes: List[str],
+                         deadline: Optional[Deadline] = None) -> List[str]:
+        """
+        Run the BLIP text decoder on encoded images, once per prefix
+        
+        Args:
+            image_embeds: Output of the BLIP vision encoder for one image
+            prefixes: Text the captions must start with ("" for an unconditional caption)
+            deadline: Request deadline; decoding stops at the next token once it expires
+            
+        Returns:
+            One caption per prefix, in prefix order
+        """
+        processor = self.model_manager.blip_processor
+        model = self.model_manager.blip_model
+        text_config = model.config.text_config
+        
+        with torch.inference_mode():
+            # Group prefixes by token length so each group decodes without padding
+            groups = {}
+            for index, prefix in enumerate(prefixes):
+                input_ids = processor.tokenizer(prefix, return_tensors="pt")["input_ids"][0]
+                groups.setdefault(len(input_ids), []).append((index, input_ids))
+            
+            captions = [""] * len(prefixes)
+            for members in groups.values():
+                # Same layout BlipForConditionalGeneration.generate builds: [DEC] + prefix, no trailing [SEP]
+                input_ids = torch.stack([ids for _, ids in members])[:, :-1]
+                input_ids[:, 0] = text_config.bos_token_id
+                embeds = image_embeds.expand(len(members), -1, -1)
+                
+                out = model.text_decoder.generate(
+                    input_ids=input_ids,
+                    eos_token_id=text_config.sep_token_id,
+                    pad_token_id=text_config.pad_token_id,
+                    encoder_hidden_states=embeds,
+                    encoder_attention_mask=torch.ones(embeds.shape[:-1], dtype=torch.long),
+                    max_length=60,
+                    **self._generate_kwargs(deadline),
+                )
+                if deadline is not None:
+                    deadline.check("end of image captioning")
+                for (index, _), caption in zip(members, processor.batch_decode(out, skip_special_tokens=True)):
+                    captions[index] = caption.strip()
+        
+        return captions
+    
+    @staticmethod
+    def merge_captions(captions: List[str]) -> str:
+        """
+        Merge guided captions into one description
+        
+        Args:
+            captions: Captions from get_guided_captions
+            
+        Returns:
+            Description made of the distinct captions as sentences
+        """
+        kept = []
+        for caption in captions:
+            normalized = re.sub(r"[^a-z0-9 ]", "", caption.lower()).strip()
+            if not normalized or any(normalized in other for other, _ in kept):
+                continue
+            # A caption that extends an earlier one replaces it
+            kept = [(other, text) for other, text in kept if other not in normalized]
+            kept.append((normalized, caption))
+        
+        sentences = [text[0].upper() + text[1:].rstrip(".") + "." for _, text in kept]
+        return " ".join(sentences)
+    
+    def describe_image_fast(self, image_url: str, deadline: Optional[Deadline] = None) -> str:
+        """
+        Describe an image with guided BLIP captions only, skipping the LLM rewrite
+        
+        Args:
+            image_url: URL of the image to describe
+            deadline: Request deadline
+            
+        Returns:
+            Image description
+        """
+        try:
+            return self.merge_captions(self.get_guided_captions(image_url, deadline=deadline))
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"Error generating base caption: {e}")
-            return "A person in a scene"
+            logger.warning("Error generating guided captions: %s", e)
+            return FALLBACK_CAPTION
     
-    def expand_caption_with_llm(self, base_caption: str) -> str:
+    def expand_caption_with_llm(self, base_caption: str, deadline: Optional[Deadline] = None) -> str:
         """
         Expand a basic caption into a detailed description using LLM
         
         Args:
             base_caption: Basic caption from BLIP
+            deadline: Request deadline
             
         Returns:
             Detailed scene description
         """
-        prompt = f"""
+        prompt = compact_prompt(f"""
         Short image caption: "{base_caption}"
 
         Rewrite this into a **detailed scene description** for someone who cannot see the image.
@@ -65,31 +296,96 @@ class ImageProcessor:
         - Only return one clean paragraph in plain English.
 
         ONLY return the scene description. NOTHING else.
-        """
+        """)
         
         try:
-            detailed_caption = self.model_manager.llm(prompt, temperature=0.4)
+            detailed_caption = self.model_manager.generate(
+                prompt, call_site="expansion", temperature=0.4, deadline=deadline
+            )
             return detailed_caption.strip()
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"Error expanding caption: {e}")
+            logger.warning("Error expanding caption: %s", e)
             return base_caption
     
-    def describe_image(self, image_url: str) -> str:
+    def describe_image(self, image_url: str, mode: Optional[str] = None,
+                       deadline: Optional[Deadline] = None) -> str:
         """
         Get a detailed description of an image
         
+        Descriptions are cached, and concurrent requests for the same image
+        and mode wait for the one already being computed.
+        
         Args:
             image_url: URL of the image to describe
+            mode: "llm" (BLIP caption rewritten by the LLM) or "fast" (guided BLIP
+                captions only); Config.DESCRIPTION_MODE if omitted
+            deadline: Request deadline; cached descriptions are returned regardless
             
         Returns:
             Detailed image description
+            
+        Raises:
+            DeadlineExceeded: If the deadline expires while the image is described
         """
-        # Get basic caption
-        short_caption = self.get_base_caption(image_url)
-        print(f"Base caption: {short_caption}")
+        mode = mode or self.config.DESCRIPTION_MODE
+        if mode not in ("fast", "llm"):
+            raise ValueError(f"Unknown description mode: {mode}")
         
-        # Expand with LLM
-        detailed_caption = self.expand_caption_with_llm(short_caption)
-        print(f"Detailed caption: {detailed_caption}")
+        key = (mode, image_url)
+        description = self._cached_description(key)
+        if description is not None:
+            return description
+        return self.describe_flight.do(key, lambda: self._describe(key, deadline), deadline)
+    
+    def _cached_description(self, key: tuple) -> Optional[str]:
+        """Description from the in-memory LRU or the shared cache, or None"""
+        with self._descriptions_lock:
+            if key in self._descriptions:
+                self._descriptions.move_to_end(key)
+                return self._descriptions[key]
         
-        return detailed_caption 
\ No newline at end of file
+        if self.shared_cache is not None:
+            mode, image_url = key
+            description = self.shared_cache.get(f"{mode}:{image_url}")
+            if description is not None:
+                self._remember_description(key, description)
+                return description
+        return None
+    
+    def _describe(self, key: tuple, deadline: Optional[Deadline] = None) -> str:
+        """Compute and cache a description (the leader's side of describe_image)"""
+        # Another caller may have finished it between our cache check and taking the lead
+        description = self._cached_description(key)
+        if description is not None:
+            return description
+        
+        mode, image_url = key
+        if mode == "fast":
+            description = self.describe_image_fast(image_url, deadline)
+            logger.debug("Fast description: %s", description)
+            cacheable = description != FALLBACK_CAPTION
+        else:
+            # Get basic caption
+            short_caption = self.get_base_caption(image_url, deadline)
+            logger.debug("Base caption: %s", short_caption)
+            
+            # Expand with LLM
+            description = self.expand_caption_with_llm(short_caption, deadline)
+            logger.debug("Detailed caption: %s", description)
+            cacheable = short_caption != FALLBACK_CAPTION
+        
+        if not cacheable:
+            return description
+        self._remember_description(key, description)
+        if self.shared_cache is not None:
+            self.shared_cache.put(f"{mode}:{image_url}", description)
+        return description
+    
+    def _remember_description(self, key: tuple, description: str):
+        """Keep a description in the in-memory LRU"""
+        with self._descriptions_lock:
+            self._descriptions[key] = description
+            while len(self._descriptions) > self.config.DESCRIPTION_CACHE_SIZE:
+                self._descriptions.popitem(last=False)
@@ -1,53 +1,71 @@
 """
 Imgflip API integration for meme template search and generation
 """
+import logging
 import requests
 from typing import List, Dict, Optional
 from .config import Config
+from .deadline import Deadline
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
 
 class ImgflipAPI:
     """Handles Imgflip API interactions"""
     
     def __init__(self):
         self.config = Config()
-        self.base_url = "https://api.imgflip.com"
+        self.base_url = self.config.IMGFLIP_API_URL
+        # Concurrent searches share one template list download
+        self.template_flight = SingleFlight("template_search")
     
-    def search_template(self, keyword: str) -> Dict:
+    def search_templates(self, keyword: str, deadline: Optional[Deadline] = None) -> List[Dict]:
         """
-        Search for meme templates based on keyword
+        Search for all meme templates matching a keyword
         
         Args:
             keyword: Search term for meme template
+            deadline: Request deadline bounding the HTTP timeout
             
         Returns:
-            Dict containing template information
+            List of matching templates, or the most popular templates if none match
         """
         try:
-            response = requests.get(f"{self.base_url}/get_memes")
-            response.raise_for_status()
-            
-            memes = response.json()["data"]["memes"]
+            memes = self.template_flight.do("get_memes", lambda: self._fetch_memes(deadline), deadline)
             matches = [m for m in memes if keyword.lower() in m["name"].lower()]
             
-            if matches:
-                template = matches[0]
-                print(f"Found template: {template['name']}")
-                return template
-            else:
-                template = memes[0]
-                print(f"No exact match found, using: {template['name']}")
-                return template
+            return matches if matches else memes[:self.config.TEMPLATE_CANDIDATES]
                 
         except requests.RequestException as e:
-            print(f"Error searching for template: {e}")
+            logger.warning("Error searching for template: %s", e)
             # Return a default template if API fails
-            return {
+            return [{
                 "id": "101716",
                 "name": "Yo Dawg Heard You",
                 "url": "https://i.imgflip.com/1g8my4.jpg"
-            }
+            }]
+    
+    def search_template(self, keyword: str, deadline: Optional[Deadline] = None) -> Dict:
+        """
+        Search for meme templates based on keyword
+        
+        Args:
+            keyword: Search term for meme template
+            deadline: Request deadline bounding the HTTP timeout
+            
+        Returns:
+            Dict containing template information
+        """
+        candidates = self.search_templates(keyword, deadline)
+        template = candidates[0]
+        if keyword.lower() in template["name"].lower():
+            logger.info("Found template: %s", template["name"])
+        else:
+            logger.info("No exact match found, using: %s", template["name"])
+        return template
     
-    def generate_meme(self, template_id: str, top_text: str, bottom_text: str) -> Optional[str]:
+    def generate_meme(self, template_id: str, top_text: str, bottom_text: str,
+                      deadline: Optional[Deadline] = None) -> Optional[str]:
         """
         Generate a meme using Imgflip API
         
@@ -55,6 +73,7 @@ class ImgflipAPI:
             template_id: ID of the meme template
             top_text: Text for the top of the meme
             bottom_text: Text for the bottom of the meme
+            deadline: Request deadline bounding the HTTP timeout
             
         Returns:
             URL of the generated meme or None if failed
@@ -68,23 +87,35 @@ class ImgflipAPI:
                 "text1": bottom_text
             }
             
-            response = requests.post(f"{self.base_url}/caption_image", data=payload)
+            response = requests.post(f"{self.base_url}/caption_image", data=payload,
+                                     timeout=self._timeout(deadline))
             response.raise_for_status()
             
             result = response.json()
             
             if result.get("success"):
                 meme_url = result["data"]["url"]
-                print(f"Meme generated successfully: {meme_url}")
+                logger.info("Meme generated successfully: %s", meme_url)
                 return meme_url
             else:
-                print(f"Failed to generate meme: {result.get('error_message', 'Unknown error')}")
+                logger.warning("Failed to generate meme: %s", result.get("error_message", "Unknown error"))
                 return None
                 
         except requests.RequestException as e:
-            print(f"Error generating meme: {e}")
+            logger.warning("Error generating meme: %s", e)
             return None
     
+    def _fetch_memes(self, deadline: Optional[Deadline] = None) -> List[Dict]:
+        """Download the list of popular templates"""
+        response = requests.get(f"{self.base_url}/get_memes", timeout=self._timeout(deadline))
+        response.raise_for_status()
+        return response.json()["data"]["memes"]
+    
+    @staticmethod
+    def _timeout(deadline: Optional[Deadline]) -> Optional[float]:
+        """HTTP timeout for a call made under the given deadline (no limit without one)"""
+        return deadline.timeout() if deadline is not None else None
+    
     def get_all_templates(self) -> List[Dict]:
         """
         Get all available meme templates
@@ -99,5 +130,5 @@ class ImgflipAPI:
             return response.json()["data"]["memes"]
             
         except requests.RequestException as e:
-            print(f"Error fetching templates: {e}")
+            logger.warning("Error fetching templates: %s", e)
             return [] 
\ No newline at end of file
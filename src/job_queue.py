@@ -0,0 +1,243 @@
+"""
+Durable SQLite job queue with leases for a fleet of meme workers
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, Optional
+from .config import Config
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open a fleet database connection
+
+    Args:
+        path: SQLite database file
+
+    Returns:
+        Connection in autocommit mode with Config.FLEET_JOURNAL_MODE and a busy timeout
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+    conn.execute(f"PRAGMA journal_mode={Config.FLEET_JOURNAL_MODE}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteJobQueue:
+    """
+    Keyword job queue shared by worker processes through one SQLite file
+
+    A worker leases a job for Config.FLEET_LEASE_SECONDS and extends the
+    lease with heartbeats while it works. A job whose lease runs out (its
+    worker died or hung) is handed to the next worker that asks, up to
+    Config.FLEET_MAX_ATTEMPTS leases in total.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            keyword TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            result TEXT,
+            error TEXT,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+    """
+
+    def __init__(self, path: Optional[str] = None, lease_seconds: Optional[float] = None,
+                 max_attempts: Optional[int] = None):
+        """
+        Args:
+            path: SQLite database file (Config.FLEET_QUEUE_PATH if omitted)
+            lease_seconds: How long a lease lasts without a heartbeat
+            max_attempts: Leases a job may get before it is marked failed
+        """
+        self.config = Config()
+        self.path = path or self.config.FLEET_QUEUE_PATH
+        if not self.path:
+            raise ValueError("No job queue path given (set FLEET_QUEUE_PATH or pass --queue)")
+        self.lease_seconds = lease_seconds or self.config.FLEET_LEASE_SECONDS
+        self.max_attempts = max_attempts or self.config.FLEET_MAX_ATTEMPTS
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connection of the calling thread (sqlite3 connections are not shared across threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def enqueue(self, keywords: Iterable[str]) -> int:
+        """
+        Add one job per keyword
+
+        Args:
+            keywords: Keywords to generate one meme each for
+
+        Returns:
+            Number of jobs added
+        """
+        now = time.time()
+        rows = [(keyword, now) for keyword in keywords]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO jobs (keyword, updated) VALUES (?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def lease(self, worker_id: str) -> Optional[Dict]:
+        """
+        Take the oldest pending job, or one whose lease expired
+
+        Args:
+            worker_id: Name of the leasing worker
+
+        Returns:
+            Dict with id, keyword and attempts, or None if nothing is available
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT id, keyword, attempts FROM jobs "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job_id, keyword, attempts = row
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, updated = ? WHERE id = ?",
+                        (f"lease expired {attempts} times", now, job_id),
+                    )
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, job_id),
+                )
+                conn.execute("COMMIT")
+                return {"id": job_id, "keyword": keyword, "attempts": attempts + 1}
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """
+        Extend a lease
+
+        Args:
+            job_id: Leased job
+            worker_id: Worker holding the lease
+
+        Returns:
+            False if the worker no longer holds the lease (it expired and was taken over)
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + self.lease_seconds, now, job_id, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result: Optional[Dict]) -> bool:
+        """
+        Store a job's result and mark it done
+
+        Args:
+            job_id: Leased job
+            worker_id: Worker holding the lease
+            result: Result of MemeAgent.generate_meme_result (None if no meme passed)
+
+        Returns:
+            False if the lease was lost, in which case the result is discarded
+        """
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_owner = NULL, updated = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str):
+        """
+        Give a job back after an error; it is retried until it runs out of attempts
+
+        Args:
+            job_id: Leased job
+            worker_id: Worker holding the lease
+            error: Error message
+        """
+        self._conn().execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_owner = NULL, updated = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (self.max_attempts, error, time.time(), job_id, worker_id),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count jobs by status
+
+        Returns:
+            Dict with pending, leased, done and failed counts
+        """
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for status, count in self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def is_drained(self) -> bool:
+        """Whether every job is done or failed"""
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["leased"] == 0
+
+    def results(self) -> Iterator[Dict]:
+        """
+        Iterate over finished jobs in queue order
+
+        Returns:
+            Iterator of records like BatchRunner's (index, keyword, url, ... or error)
+        """
+        rows = self._conn().execute(
+            "SELECT id, keyword, status, result, error, attempts FROM jobs "
+            "WHERE status IN ('done', 'failed') ORDER BY id"
+        )
+        for job_id, keyword, status, result, error, attempts in rows:
+            record = {"index": job_id, "keyword": keyword, "url": None}
+            if result and result != "null":
+                record.update(json.loads(result))
+            if status == "failed":
+                record["error"] = error
+            record["leases"] = attempts
+            yield record
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
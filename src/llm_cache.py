@@ -0,0 +1,209 @@
+"""
+Opt-in cache for LLM generations keyed by prompt hash
+"""
+import logging
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Part of every key, bumped when the stored output format changes
+# (2: generated text only; entries of version 1 also held the prompt)
+CACHE_FORMAT_VERSION = 2
+
+
+class LLMCache:
+    """Two-tier (in-memory LRU + on-disk) cache of LLM outputs with per-call-site policies"""
+
+    def __init__(self, model_id: Optional[str] = None, memory_entries: Optional[int] = None,
+                 disk_dir: Optional[str] = None, disk_max_bytes: Optional[int] = None,
+                 policies: Optional[Dict[str, bool]] = None):
+        """
+        Args:
+            model_id: Model the outputs come from (Config.MODEL_NAME if omitted)
+            memory_entries: Size of the in-memory LRU tier
+            disk_dir: Directory of the on-disk tier (disabled if empty)
+            disk_max_bytes: Size cap of the on-disk tier
+            policies: Map of call site to whether its outputs may be cached
+        """
+        self.config = Config()
+        self.model_id = model_id or self.config.MODEL_NAME
+        self.memory_entries = memory_entries or self.config.LLM_CACHE_MEMORY_ENTRIES
+        self.disk_dir = disk_dir if disk_dir is not None else self.config.LLM_CACHE_DIR
+        self.disk_max_bytes = disk_max_bytes or self.config.LLM_CACHE_DISK_MAX_BYTES
+        self.policies = policies if policies is not None else dict(self.config.LLM_CACHE_POLICIES)
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._disk_bytes = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def enabled_for(self, call_site: str) -> bool:
+        """Whether outputs of the given call site are cached"""
+        return self.policies.get(call_site, False)
+
+    def key(self, prompt: str, params: Dict) -> str:
+        """
+        Build the cache key of a generation
+
+        Args:
+            prompt: Prompt text
+            params: Sampling parameters of the call
+
+        Returns:
+            Hex digest of (format version, model id, prompt, sampling params)
+        """
+        payload = json.dumps([CACHE_FORMAT_VERSION, self.model_id, prompt, sorted(params.items())],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _count(self, call_site: str, outcome: str):
+        stats = self._stats.setdefault(call_site, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        stats[outcome] += 1
+
+    def get(self, call_site: str, prompt: str, params: Dict) -> Optional[str]:
+        """
+        Look up a cached generation
+
+        Args:
+            call_site: Name of the calling stage
+            prompt: Prompt text
+            params: Sampling parameters of the call
+
+        Returns:
+            Cached output, or None on a miss or if the call site is not cached
+        """
+        if not self.enabled_for(call_site):
+            return None
+
+        key = self.key(prompt, params)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._count(call_site, "memory_hits")
+                return self._memory[key]
+
+        text = self._disk_get(key) if self.disk_dir else None
+        with self._lock:
+            if text is None:
+                self._count(call_site, "misses")
+                return None
+            self._count(call_site, "disk_hits")
+            self._memory_put(key, text)
+        return text
+
+    def put(self, call_site: str, prompt: str, params: Dict, text: str):
+        """
+        Store a generation
+
+        Args:
+            call_site: Name of the calling stage
+            prompt: Prompt text
+            params: Sampling parameters of the call
+            text: Generated output
+        """
+        if not self.enabled_for(call_site):
+            return
+
+        key = self.key(prompt, params)
+        with self._lock:
+            self._memory_put(key, text)
+        if self.disk_dir:
+            self._disk_put(key, text)
+
+    def _memory_put(self, key: str, text: str):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            # Refresh the access time so eviction removes the least recently used entries
+            os.utime(path)
+            return text
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_put(self, key: str, text: str):
+        path = self._disk_path(key)
+        data = json.dumps({"text": text}, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique across the processes of a fleet sharing the directory, not just across threads
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Error writing LLM cache entry: %s", e)
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        """List (path, size, mtime) of every on-disk entry"""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        """Remove least recently used entries until the disk tier is at 90% of its cap"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get cache hit statistics
+
+        Returns:
+            Dict keyed by call site with memory_hits, disk_hits, misses and hit_rate
+        """
+        with self._lock:
+            report = {site: dict(stats) for site, stats in self._stats.items()}
+        for stats in report.values():
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return report
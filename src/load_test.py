@@ -0,0 +1,275 @@
+"""
+Load generator measuring latency and throughput of the meme pipeline under concurrency
+"""
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _percentiles(values: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of a sample (zeros if it is empty)"""
+    if not len(values):
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(max(values))}
+
+
+class LoadTest:
+    """
+    Drives a MemeAgent at stepped concurrency levels and arrival rates
+
+    Each step runs for a fixed time, either closed-loop (every worker
+    thread starts its next request as soon as the last one finishes) or
+    open-loop (requests arrive as a Poisson process at a given rate and
+    wait for a free worker). Latency is measured from arrival, so it
+    includes the time spent queueing. Open-loop arrivals are shed once
+    the backlog of waiting requests reaches max_backlog, keeping an
+    overloaded step from running on indefinitely.
+    """
+
+    def __init__(self, agent, keywords: Sequence[str], retry_limit: int = 3,
+                 max_backlog: Optional[int] = None, seed: int = 0):
+        """
+        Args:
+            agent: MemeAgent to drive (real or stub models)
+            keywords: Keywords requests cycle through
+            retry_limit: Maximum retry attempts per meme
+            max_backlog: Waiting requests at which open-loop arrivals are shed (Config.LOAD_TEST_MAX_BACKLOG)
+            seed: Seed for the arrival process
+        """
+        self.config = Config()
+        self.agent = agent
+        self.keywords = list(keywords)
+        self.retry_limit = retry_limit
+        self.max_backlog = max_backlog or self.config.LOAD_TEST_MAX_BACKLOG
+        self._rng = random.Random(seed)
+        self._next_keyword = 0
+        self._lock = threading.Lock()
+
+    def _keyword(self) -> str:
+        with self._lock:
+            keyword = self.keywords[self._next_keyword % len(self.keywords)]
+            self._next_keyword += 1
+        return keyword
+
+    def _request(self, arrival: float) -> Dict:
+        """Run one request and time it"""
+        start = time.perf_counter()
+        calls_before = self.agent.model_manager.llm_calls
+        result, error = None, None
+        try:
+            result = self.agent.generate_meme_result(self._keyword(), self.retry_limit)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        end = time.perf_counter()
+        return {
+            "arrival": arrival,
+            "start": start,
+            "end": end,
+            "ok": result is not None,
+            "error": error,
+            "attempts": result["attempts"] if result else None,
+            "deadline_exceeded": bool(result and result.get("deadline_exceeded")),
+            "llm_calls": self.agent.model_manager.llm_calls - calls_before,
+        }
+
+    def run_step(self, concurrency: int, rate: Optional[float] = None, duration: float = 30.0) -> Dict:
+        """
+        Run one load level
+
+        Args:
+            concurrency: Worker threads issuing requests
+            rate: Arrivals per second (None for closed-loop)
+            duration: Seconds during which new requests are started
+
+        Returns:
+            Step summary (see summarize)
+        """
+        records: List[Dict] = []
+        rejected = 0
+        step_start = time.perf_counter()
+        stop_at = step_start + duration
+
+        if rate is None:
+            def loop():
+                while time.perf_counter() < stop_at:
+                    record = self._request(time.perf_counter())
+                    with self._lock:
+                        records.append(record)
+
+            threads = [threading.Thread(target=loop, name=f"load-{i}") for i in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            waiting = [0]
+
+            def admitted(arrival: float) -> Dict:
+                with self._lock:
+                    waiting[0] -= 1
+                return self._request(arrival)
+
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as pool:
+                futures = []
+                arrival = step_start
+                while True:
+                    arrival += self._rng.expovariate(rate)
+                    if arrival >= stop_at:
+                        break
+                    time.sleep(max(arrival - time.perf_counter(), 0.0))
+                    with self._lock:
+                        if waiting[0] >= self.max_backlog:
+                            rejected += 1
+                            continue
+                        waiting[0] += 1
+                    futures.append(pool.submit(admitted, arrival))
+                records = [future.result() for future in futures]
+
+        return self.summarize(records, concurrency, rate, duration, rejected, step_start)
+
+    def summarize(self, records: List[Dict], concurrency: int, rate: Optional[float], duration: float,
+                  rejected: int, step_start: float) -> Dict:
+        """
+        Aggregate request records of one step
+
+        Args:
+            records: Timings and outcomes of the step's requests
+            concurrency: Worker threads of the step
+            rate: Arrivals per second (None for closed-loop)
+            duration: Seconds during which new requests were started
+            rejected: Arrivals shed at the backlog limit
+            step_start: perf_counter() time the step started
+
+        Returns:
+            Dict with request counts, throughput and goodput (memes/s), latency,
+            service and queueing percentiles, and error, failure, retry and
+            deadline rates
+        """
+        elapsed = max((r["end"] for r in records), default=step_start) - step_start
+        done = len(records)
+        memes = sum(r["ok"] for r in records)
+        # A request that produced no meme used up its attempts (unless an error or deadline cut it short)
+        attempts = [r["attempts"] or self.retry_limit for r in records if r["error"] is None]
+        return {
+            "concurrency": concurrency,
+            "rate": rate,
+            "duration": duration,
+            "requests": done,
+            "rejected": rejected,
+            "memes": memes,
+            "elapsed": elapsed,
+            "throughput": done / elapsed if elapsed > 0 else 0.0,
+            "goodput": memes / elapsed if elapsed > 0 else 0.0,
+            "latency": _percentiles([r["end"] - r["arrival"] for r in records]),
+            "service": _percentiles([r["end"] - r["start"] for r in records]),
+            "queue": _percentiles([r["start"] - r["arrival"] for r in records]),
+            "error_rate": sum(r["error"] is not None for r in records) / done if done else 0.0,
+            "failure_rate": (done - memes) / done if done else 0.0,
+            "retry_rate": sum(a - 1 for a in attempts) / len(attempts) if attempts else 0.0,
+            "deadline_rate": sum(r["deadline_exceeded"] for r in records) / done if done else 0.0,
+            "llm_calls_per_request": sum(r["llm_calls"] for r in records) / done if done else 0.0,
+            "errors": sorted({r["error"] for r in records if r["error"]})[:5],
+        }
+
+    def run(self, steps: Sequence[Tuple[int, Optional[float]]], duration: float = 30.0,
+            p99_slo: Optional[float] = None) -> Dict:
+        """
+        Run every load level in order and report where the pipeline saturates
+
+        Args:
+            steps: (concurrency, rate) pairs; rate None means closed-loop
+            duration: Seconds per step
+            p99_slo: p99 latency target in seconds (Config.LOAD_TEST_P99_SLO)
+
+        Returns:
+            Dict with the step summaries and the saturation report
+        """
+        results = []
+        for concurrency, rate in steps:
+            label = f"{rate:g}/s" if rate is not None else "closed-loop"
+            logger.info("Load step: concurrency %d, %s, %gs", concurrency, label, duration)
+            results.append(self.run_step(concurrency, rate, duration))
+        return {"steps": results, "saturation": saturation_report(results, p99_slo)}
+
+
+def saturation_report(steps: List[Dict], p99_slo: Optional[float] = None) -> Dict:
+    """
+    Find the highest sustainable load level and the first saturated one
+
+    A step is saturated when its p99 latency exceeds the SLO, arrivals were
+    shed, more than 5% of requests raised errors, or throughput grew by
+    less than 5% although the offered load went up.
+
+    Args:
+        steps: Step summaries in the order they were run
+        p99_slo: p99 latency target in seconds (Config.LOAD_TEST_P99_SLO)
+
+    Returns:
+        Dict with max_sustainable (best unsaturated step) and saturated_at (first
+        saturated step with its reasons); either may be None
+    """
+    slo = p99_slo if p99_slo is not None else Config.LOAD_TEST_P99_SLO
+    best, saturated, peak = None, None, 0.0
+    previous = None
+    for step in steps:
+        reasons = []
+        if step["latency"]["p99"] > slo:
+            reasons.append(f"p99 latency {step['latency']['p99']:.2f}s exceeds the {slo:g}s SLO")
+        if step["rejected"]:
+            reasons.append(f"{step['rejected']} arrivals shed at the backlog limit")
+        if step["error_rate"] > 0.05:
+            reasons.append(f"error rate {step['error_rate']:.0%}")
+        more_load = previous is not None and (
+            step["concurrency"] > previous["concurrency"] or (step["rate"] or 0) > (previous["rate"] or 0)
+        )
+        if more_load and peak and step["throughput"] < peak * 1.05:
+            reasons.append(f"throughput {step['throughput']:.2f}/s no longer grows with load (peak {peak:.2f}/s)")
+
+        key = {"concurrency": step["concurrency"], "rate": step["rate"], "throughput": step["throughput"],
+               "p99": step["latency"]["p99"]}
+        if reasons:
+            if saturated is None:
+                saturated = dict(key, reasons=reasons)
+        elif best is None or step["throughput"] > best["throughput"]:
+            best = key
+        peak = max(peak, step["throughput"])
+        previous = step
+    return {"p99_slo": slo, "max_sustainable": best, "saturated_at": saturated}
+
+
+def format_report(report: Dict) -> str:
+    """Render a load test report as a table plus the saturation verdict"""
+    lines = [f"{'conc':>5}{'rate':>8}{'reqs':>6}{'shed':>6}{'req/s':>8}{'memes/s':>9}"
+             f"{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'queue p95':>11}{'err':>6}{'retry':>7}"]
+    for step in report["steps"]:
+        rate = f"{step['rate']:g}" if step["rate"] is not None else "closed"
+        lines.append(
+            f"{step['concurrency']:>5}{rate:>8}{step['requests']:>6}{step['rejected']:>6}"
+            f"{step['throughput']:>8.2f}{step['goodput']:>9.2f}{step['latency']['p50']:>8.2f}"
+            f"{step['latency']['p95']:>8.2f}{step['latency']['p99']:>8.2f}{step['queue']['p95']:>11.2f}"
+            f"{step['error_rate']:>6.0%}{step['retry_rate']:>7.2f}"
+        )
+
+    saturation = report["saturation"]
+    best, saturated = saturation["max_sustainable"], saturation["saturated_at"]
+    lines.append("")
+    if best:
+        rate = f", {best['rate']:g} req/s offered" if best["rate"] is not None else ""
+        lines.append(f"Max sustainable: concurrency {best['concurrency']}{rate} -> "
+                     f"{best['throughput']:.2f} req/s at p99 {best['p99']:.2f}s (SLO {saturation['p99_slo']:g}s)")
+    else:
+        lines.append(f"No step met the p99 SLO of {saturation['p99_slo']:g}s")
+    if saturated:
+        rate = f", {saturated['rate']:g} req/s offered" if saturated["rate"] is not None else ""
+        lines.append(f"Saturated at concurrency {saturated['concurrency']}{rate}: " + "; ".join(saturated["reasons"]))
+    else:
+        lines.append("No step saturated; try higher concurrency or arrival rates")
+    return "\n".join(lines)
@@ -0,0 +1,167 @@
+"""
+Local stand-in for the Imgflip API, for load and soak tests
+"""
+import io
+import json
+import re
+import time
+import random
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAMES = [
+    "Drake Hotline Bling", "Distracted Boyfriend", "Two Buttons", "Left Exit 12 Off Ramp",
+    "Running Away Balloon", "UNO Draw 25 Cards", "Change My Mind", "Batman Slapping Robin",
+    "Disaster Girl", "Woman Yelling At Cat", "Monday Mood", "Surprised Pikachu",
+    "Is This A Pigeon", "This Is Fine", "Expanding Brain", "Coffee Morning",
+    "Sad Pablo Escobar", "Hide the Pain Harold", "Roll Safe Think About It", "Grumpy Cat",
+]
+
+
+class LocalImgflipServer:
+    """
+    HTTP server answering get_memes and caption_image like api.imgflip.com
+
+    Template images are generated JPEGs served by the same server, so the
+    whole download and decode path runs without network access; a rendered
+    meme's URL serves its template's image. Latency and a failure rate can
+    be injected to see how the agent copes.
+    """
+
+    def __init__(self, num_templates: int = 20, latency: float = 0.0, error_rate: float = 0.0,
+                 image_size: int = 500, seed: int = 0):
+        """
+        Args:
+            num_templates: Number of templates get_memes returns
+            latency: Seconds added to every API call and rendered meme download
+            error_rate: Fraction of caption_image calls answered with success=false
+            image_size: Side length of the template images
+            seed: Seed for the images and injected failures
+        """
+        self.num_templates = num_templates
+        self.latency = latency
+        self.error_rate = error_rate
+        self.image_size = image_size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._images: Dict[str, bytes] = {}
+        self._memes: Dict[int, str] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.requests = {"get_memes": 0, "caption_image": 0, "image": 0, "errors": 0}
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as Config.IMGFLIP_API_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def templates(self) -> List[Dict]:
+        """Templates in the get_memes format"""
+        templates = []
+        for i in range(self.num_templates):
+            name = TEMPLATE_NAMES[i % len(TEMPLATE_NAMES)]
+            if i >= len(TEMPLATE_NAMES):
+                name += f" {i // len(TEMPLATE_NAMES) + 1}"
+            template_id = str(100000 + i)
+            templates.append({"id": template_id, "name": name, "url": f"{self.url}/images/{template_id}.jpg",
+                              "width": self.image_size, "height": self.image_size, "box_count": 2})
+        return templates
+
+    def _image(self, template_id: str) -> bytes:
+        if template_id not in self._images:
+            # Noise keeps the JPEG about as costly to decode as a photo
+            size = (self.image_size, self.image_size)
+            channels = [Image.effect_noise(size, 48).point(lambda v, c=int(template_id) * k: (v + c) % 256)
+                        for k in (37, 91, 151)]
+            img = Image.merge("RGB", channels)
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=85)
+            self._images[template_id] = buffer.getvalue()
+        return self._images[template_id]
+
+    def _fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def _count(self, name: str) -> int:
+        with self._lock:
+            self.requests[name] += 1
+            return self.requests[name]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, as Imgflip's CDN does, so pooled clients reuse connections
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, payload: Dict):
+                self._send(200, json.dumps(payload).encode("utf-8"), "application/json")
+
+            def do_GET(self):
+                if self.path == "/get_memes":
+                    server._count("get_memes")
+                    time.sleep(server.latency)
+                    self._json({"success": True, "data": {"memes": server.templates()}})
+                elif self.path.startswith("/images/") and self.path.endswith(".jpg"):
+                    server._count("image")
+                    self._send(200, server._image(self.path[len("/images/"):-len(".jpg")]), "image/jpeg")
+                elif re.fullmatch(r"/m/\d+\.jpg", self.path) and int(self.path[3:-4]) in server._memes:
+                    server._count("image")
+                    time.sleep(server.latency)
+                    self._send(200, server._image(server._memes[int(self.path[3:-4])]), "image/jpeg")
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+            def do_POST(self):
+                if self.path != "/caption_image":
+                    self._send(404, b"not found", "text/plain")
+                    return
+                form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8"))
+                meme_id = server._count("caption_image")
+                server._memes[meme_id] = form.get("template_id", ["100000"])[0]
+                time.sleep(server.latency)
+                if server._fail():
+                    server._count("errors")
+                    self._json({"success": False, "error_message": "Injected failure"})
+                    return
+                self._json({"success": True, "data": {"url": f"{server.url}/m/{meme_id}.jpg",
+                                                      "page_url": f"{server.url}/i/{meme_id}"}})
+
+            def log_message(self, format, *args):
+                logger.debug("Local Imgflip: " + format, *args)
+
+        return Handler
+
+    def start(self) -> "LocalImgflipServer":
+        """Serve on a free localhost port in a background thread"""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="local-imgflip", daemon=True).start()
+        return self
+
+    def stop(self):
+        """Shut the server down"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "LocalImgflipServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,91 +1,354 @@
 """
 Main Meme Agent that orchestrates all components
 """
-from typing import List, Optional
+import logging
+from contextlib import nullcontext
+from typing import Dict, List, Optional
 from .models import ModelManager
 from .imgflip_api import ImgflipAPI
 from .image_processor import ImageProcessor
 from .caption_generator import CaptionGenerator
+from .dedup import CaptionDeduplicator
+from .template_selector import TemplateSelector
+from .deadline import Deadline, DeadlineExceeded
+from .memory_profiler import MemoryProfiler
 from .config import Config
 
+logger = logging.getLogger(__name__)
+
 class MemeAgent:
     """Main agent that generates memes using AI"""
     
-    def __init__(self):
+    def __init__(self, model_manager: Optional[ModelManager] = None):
         self.config = Config()
-        self.model_manager = ModelManager()
+        # A single ModelManager is shared by every component so the weights are loaded once
+        self.model_manager = model_manager or ModelManager()
         self.imgflip_api = ImgflipAPI()
-        self.image_processor = ImageProcessor()
-        self.caption_generator = CaptionGenerator()
+        self.image_processor = ImageProcessor(self.model_manager)
+        self.caption_generator = CaptionGenerator(self.model_manager)
+        self.template_selector = TemplateSelector() if self.config.ADAPTIVE_TEMPLATE_SELECTION else None
+        self.memory_profiler = MemoryProfiler() if self.config.MEMORY_PROFILING else None
         
         # Initialize models
-        self.model_manager.initialize()
+        if not self.config.LAZY_MODEL_LOADING:
+            self.model_manager.initialize()
     
-    def generate_meme(self, keyword: str, retry_limit: int = 3) -> Optional[str]:
+    def generate_meme(self, keyword: str, retry_limit: int = 3,
+                      dedup_index: Optional[CaptionDeduplicator] = None,
+                      description_mode: Optional[str] = None,
+                      deadline: Optional[Deadline] = None) -> Optional[str]:
         """
         Generate a single meme for the given keyword
         
         Args:
             keyword: Main keyword for the meme
             retry_limit: Maximum number of retry attempts
+            dedup_index: Caption index shared across a batch (a fresh one is used per call if omitted)
+            description_mode: "llm" or "fast" image description (Config.DESCRIPTION_MODE if omitted)
+            deadline: Deadline/cancellation token for the request (Config.REQUEST_DEADLINE if omitted)
             
         Returns:
             URL of the generated meme or None if failed
         """
-        print(f"Generating meme for keyword: '{keyword}'")
+        result = self.generate_meme_result(keyword, retry_limit, dedup_index, description_mode, deadline)
+        return result["url"] if result else None
+    
+    def generate_meme_result(self, keyword: str, retry_limit: int = 3,
+                             dedup_index: Optional[CaptionDeduplicator] = None,
+                             description_mode: Optional[str] = None,
+                             deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """
+        Generate a single meme and return it with its metadata
         
+        When the deadline expires or the request is cancelled, the in-flight
+        generation stops, remaining retries are skipped and the best meme
+        rendered so far is returned even if it missed the humor threshold.
+        
+        Args:
+            keyword: Main keyword for the meme
+            retry_limit: Maximum number of retry attempts
+            dedup_index: Caption index shared across a batch (a fresh one is used per call if omitted)
+            description_mode: "llm" or "fast" image description (Config.DESCRIPTION_MODE if omitted)
+            deadline: Deadline/cancellation token for the request (Config.REQUEST_DEADLINE if omitted)
+            
+        Returns:
+            Dict with keyword, url, template_id, template_name, top_text, bottom_text,
+            score (None if scoring was cut off), attempts and deadline_exceeded,
+            or None if failed
+        """
+        if self.config.TOURNAMENT_SIZE > 1:
+            return self.generate_meme_tournament(
+                keyword, self.config.TOURNAMENT_SIZE, retry_limit, dedup_index, description_mode, deadline
+            )
+        
+        logger.info("Generating meme for keyword: '%s'", keyword, extra={"keyword": keyword})
+        
+        if dedup_index is None:
+            dedup_index = CaptionDeduplicator()
+        if deadline is None and self.config.REQUEST_DEADLINE is not None:
+            deadline = Deadline(self.config.REQUEST_DEADLINE)
+        
+        best = None
         for attempt in range(retry_limit):
-            print(f"Attempt {attempt + 1} / {retry_limit}")
+            logger.info("Attempt %d / %d", attempt + 1, retry_limit)
             
             try:
+                if deadline is not None:
+                    deadline.check(f"attempt {attempt + 1}")
+                calls_before = self.model_manager.llm_calls
+                
                 # 1. Select a meme template
-                template = self.imgflip_api.search_template(keyword)
-                print(f"Selected Template: {template['name']}")
+                with self._stage("select_template"):
+                    template = self._select_template(keyword, deadline)
+                logger.info("Selected template: %s", template["name"])
                 
                 # 2. Get image description
                 template_url = template["url"]
-                image_caption = self.image_processor.describe_image(template_url)
-                print(f"Image caption: {image_caption}")
+                with self._stage("describe_image"):
+                    image_caption = self.image_processor.describe_image(template_url, description_mode, deadline)
+                logger.debug("Image caption: %s", image_caption)
                 
                 # 3. Generate meme prompt
+                style_hint = self.caption_generator.choose_style_hint()
                 prompt = self.caption_generator.generate_meme_prompt(
-                    keyword, image_caption, template['name']
+                    keyword, image_caption, template['name'], style_hint
                 )
+                context = {"keyword": keyword, "template": template["name"], "style_hint": style_hint}
                 
                 # 4. Generate captions
-                top, bottom = self.caption_generator.generate_clean_captions(prompt)
+                with self._stage("generate_captions"):
+                    top, bottom = self.caption_generator.generate_clean_captions(
+                        prompt, dedup_index=dedup_index, deadline=deadline, context=context
+                    )
                 
                 if not top or not bottom:
-                    print("Couldn't parse Top/Bottom text. Retrying...")
+                    logger.info("Couldn't parse Top/Bottom text. Retrying...")
+                    self._record_outcome(keyword, template, False, calls_before)
                     continue
                 
-                print(f"Final Top text: {top}")
-                print(f"Final Bottom text: {bottom}")
+                logger.debug("Final top text: %s\nFinal bottom text: %s", top, bottom)
                 
                 # 5. Generate the meme
-                meme_url = self.imgflip_api.generate_meme(template["id"], top, bottom)
+                with self._stage("render_meme"):
+                    meme_url = self.imgflip_api.generate_meme(template["id"], top, bottom, deadline)
                 
                 if not meme_url:
-                    print("Failed to generate meme. Retrying...")
+                    logger.info("Failed to generate meme. Retrying...")
                     continue
                 
+                candidate = {
+                    "keyword": keyword,
+                    "url": meme_url,
+                    "template_id": template["id"],
+                    "template_name": template["name"],
+                    "top_text": top,
+                    "bottom_text": bottom,
+                    "score": None,
+                    "attempts": attempt + 1,
+                    "deadline_exceeded": False,
+                }
+                if best is None:
+                    best = candidate
+                
                 # 6. Score the humor
-                score = self.caption_generator.score_humor(top, bottom)
+                with self._stage("score_humor"):
+                    score = self.caption_generator.score_humor(top, bottom, keyword, deadline, context)
+                candidate["score"] = score
+                if best["score"] is None or score > best["score"]:
+                    best = candidate
                 
-                if score >= self.config.HUMOR_SCORE_THRESHOLD:
-                    print(f"Funny meme found! Score: {score}")
-                    return meme_url
+                accepted = score >= self.config.HUMOR_SCORE_THRESHOLD
+                self._record_outcome(keyword, template, accepted, calls_before)
+                
+                if accepted:
+                    logger.info("Funny meme found! Score: %s", score, extra={"keyword": keyword, "score": score})
+                    return candidate
                 else:
-                    print(f"Meme not funny enough (score: {score}). Retrying...")
+                    logger.info("Meme not funny enough (score: %s). Retrying...", score)
                     
+            except DeadlineExceeded as e:
+                logger.warning("%s; skipping remaining attempts", e, extra={"keyword": keyword})
+                if best is not None:
+                    logger.info("Returning best meme so far (score: %s)", best["score"])
+                    return dict(best, deadline_exceeded=True)
+                return None
+            except Exception as e:
+                logger.warning("Error in attempt %d: %s", attempt + 1, e, extra={"keyword": keyword})
+                continue
+        
+        logger.info("Could not generate a funny meme after all attempts.", extra={"keyword": keyword})
+        return None
+    
+    def generate_meme_tournament(self, keyword: str, k: int = 4, rounds: int = 1,
+                                 dedup_index: Optional[CaptionDeduplicator] = None,
+                                 description_mode: Optional[str] = None,
+                                 deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """
+        Generate a meme by letting captions for several templates compete
+        
+        Each round picks the k most promising templates, captions all of them
+        in one batched LLM call, scores them in one batch and renders only the
+        winner, replacing sequential retries with one wide round. When the
+        deadline expires, the best entrant scored in any round is rendered
+        and returned even if it missed the humor threshold.
+        
+        Args:
+            keyword: Main keyword for the meme
+            k: Number of competing templates per round
+            rounds: Maximum number of rounds
+            dedup_index: Caption index shared across a batch (a fresh one is used per call if omitted)
+            description_mode: "llm" or "fast" image description (Config.DESCRIPTION_MODE if omitted)
+            deadline: Deadline/cancellation token for the request (Config.REQUEST_DEADLINE if omitted)
+            
+        Returns:
+            Same dict as generate_meme_result, or None if no candidate reached the
+            threshold (or, once the deadline expired, none was scored)
+        """
+        logger.info("Generating meme for keyword: '%s' (tournament of %d)", keyword, k, extra={"keyword": keyword})
+        
+        if dedup_index is None:
+            dedup_index = CaptionDeduplicator()
+        if deadline is None and self.config.REQUEST_DEADLINE is not None:
+            deadline = Deadline(self.config.REQUEST_DEADLINE)
+        
+        best = None
+        for round_num in range(rounds):
+            logger.info("Round %d / %d", round_num + 1, rounds)
+            
+            try:
+                if deadline is not None:
+                    deadline.check(f"round {round_num + 1}")
+                calls_before = self.model_manager.llm_calls
+                
+                # 1. Pick the competing templates
+                with self._stage("select_template"):
+                    templates = self._select_templates(keyword, k, deadline)
+                logger.info("Competing templates: %s", ", ".join(t["name"] for t in templates))
+                
+                # 2. Describe them and build one prompt each
+                contexts = [{"keyword": keyword, "template": t["name"],
+                             "style_hint": self.caption_generator.choose_style_hint()} for t in templates]
+                with self._stage("describe_image"):
+                    prompts = [
+                        self.caption_generator.generate_meme_prompt(
+                            keyword,
+                            self.image_processor.describe_image(t["url"], description_mode, deadline),
+                            t["name"],
+                            context["style_hint"],
+                        )
+                        for t, context in zip(templates, contexts)
+                    ]
+                
+                # 3. Caption every template in one batched call
+                with self._stage("generate_captions"):
+                    captions = self.caption_generator.generate_captions_batch(prompts, dedup_index, deadline,
+                                                                              contexts)
+                entrants = [(t, c) for t, c in zip(templates, captions) if c[0] and c[1]]
+                if not entrants:
+                    logger.info("No usable captions this round.")
+                    self._record_round(keyword, templates, [], calls_before)
+                    continue
+                
+                # 4. Score every usable caption in one batch
+                with self._stage("score_humor"):
+                    scores = self.caption_generator.score_humor_batch(
+                        [c for _, c in entrants], keyword, deadline,
+                        [context for context, c in zip(contexts, captions) if c[0] and c[1]],
+                    )
+                (template, (top, bottom)), score = max(zip(entrants, scores), key=lambda pair: pair[1])
+                if best is None or score > best["score"]:
+                    best = {"template": template, "top_text": top, "bottom_text": bottom,
+                            "score": score, "attempts": round_num + 1}
+                # Every entrant that reached the threshold counts as accepted, not only the winner
+                accepted = [t for (t, _), s in zip(entrants, scores) if s >= self.config.HUMOR_SCORE_THRESHOLD]
+                self._record_round(keyword, templates, accepted, calls_before)
+                
+                logger.info("Winner: %s (score: %s)", template["name"], score)
+                if score < self.config.HUMOR_SCORE_THRESHOLD:
+                    logger.info("No candidate funny enough. Retrying...")
+                    continue
+                
+                # 5. Render only the winner
+                with self._stage("render_meme"):
+                    meme_url = self.imgflip_api.generate_meme(template["id"], top, bottom, deadline)
+                if not meme_url:
+                    logger.info("Failed to generate meme. Retrying...")
+                    continue
+                
+                logger.info("Funny meme found! Score: %s", score, extra={"keyword": keyword, "score": score})
+                return self._tournament_result(keyword, meme_url, template, top, bottom, score, round_num + 1)
+                
+            except DeadlineExceeded as e:
+                logger.warning("%s; skipping remaining rounds", e, extra={"keyword": keyword})
+                if best is None:
+                    return None
+                logger.info("Rendering best entrant so far (score: %s)", best["score"])
+                # The request deadline has passed, so the render gets a short grace period of its own
+                meme_url = self.imgflip_api.generate_meme(best["template"]["id"], best["top_text"],
+                                                          best["bottom_text"],
+                                                          Deadline(self.config.TOURNAMENT_RENDER_GRACE))
+                if not meme_url:
+                    return None
+                return self._tournament_result(keyword, meme_url, best["template"], best["top_text"],
+                                               best["bottom_text"], best["score"], best["attempts"],
+                                               deadline_exceeded=True)
             except Exception as e:
-                print(f"Error in attempt {attempt + 1}: {e}")
+                logger.warning("Error in round %d: %s", round_num + 1, e, extra={"keyword": keyword})
                 continue
         
-        print("Could not generate a funny meme after all attempts.")
+        logger.info("Could not generate a funny meme after all rounds.", extra={"keyword": keyword})
         return None
     
-    def generate_multiple_memes(self, keyword: str, num_memes: int = 5, retry_limit: int = 3) -> List[str]:
+    @staticmethod
+    def _tournament_result(keyword: str, url: str, template: dict, top: str, bottom: str, score: int,
+                           attempts: int, deadline_exceeded: bool = False) -> Dict:
+        """Build the result dict of a rendered tournament entrant"""
+        return {
+            "keyword": keyword,
+            "url": url,
+            "template_id": template["id"],
+            "template_name": template["name"],
+            "top_text": top,
+            "bottom_text": bottom,
+            "score": score,
+            "attempts": attempts,
+            "deadline_exceeded": deadline_exceeded,
+        }
+    
+    def _stage(self, name: str):
+        """Measure a pipeline stage's memory growth when memory profiling is on"""
+        return self.memory_profiler.stage(name) if self.memory_profiler is not None else nullcontext()
+    
+    def _select_templates(self, keyword: str, k: int, deadline: Optional[Deadline] = None) -> List[dict]:
+        """Pick the k most promising distinct templates"""
+        candidates = self.imgflip_api.search_templates(keyword, deadline)
+        if self.template_selector is None:
+            return candidates[:k]
+        return self.template_selector.select_many(keyword, candidates, k)
+    
+    def _record_round(self, keyword: str, templates: List[dict], accepted: List[dict], calls_before: int):
+        """Report a tournament round to the template selector, splitting its LLM cost across entrants"""
+        if self.template_selector is not None:
+            llm_calls = (self.model_manager.llm_calls - calls_before) / len(templates)
+            for template in templates:
+                self.template_selector.record(keyword, template, template in accepted, llm_calls)
+    
+    def _select_template(self, keyword: str, deadline: Optional[Deadline] = None) -> dict:
+        """Pick a template, steering towards ones that tend to pass the humor threshold"""
+        if self.template_selector is None:
+            return self.imgflip_api.search_template(keyword, deadline)
+        
+        candidates = self.imgflip_api.search_templates(keyword, deadline)
+        return self.template_selector.select(keyword, candidates)
+    
+    def _record_outcome(self, keyword: str, template: dict, accepted: bool, calls_before: int):
+        """Report an attempt's outcome and LLM cost to the template selector"""
+        if self.template_selector is not None:
+            llm_calls = self.model_manager.llm_calls - calls_before
+            self.template_selector.record(keyword, template, accepted, llm_calls)
+    
+    def generate_multiple_memes(self, keyword: str, num_memes: int = 5, retry_limit: int = 3,
+                                description_mode: Optional[str] = None) -> List[str]:
         """
         Generate multiple memes for the given keyword
         
@@ -93,27 +356,77 @@ class MemeAgent:
             keyword: Main keyword for the memes
             num_memes: Number of memes to generate
             retry_limit: Maximum number of retry attempts per meme
+            description_mode: "llm" or "fast" image description (Config.DESCRIPTION_MODE if omitted)
             
         Returns:
             List of meme URLs
         """
-        meme_urls = []
+        results = self.generate_multiple_meme_results(keyword, num_memes, retry_limit, description_mode)
+        return [result["url"] for result in results]
+    
+    def generate_multiple_meme_results(self, keyword: str, num_memes: int = 5, retry_limit: int = 3,
+                                       description_mode: Optional[str] = None) -> List[Dict]:
+        """
+        Generate multiple memes for the given keyword and return them with their metadata
         
-        print(f"Generating {num_memes} memes for keyword: '{keyword}'")
+        Args:
+            keyword: Main keyword for the memes
+            num_memes: Number of memes to generate
+            retry_limit: Maximum number of retry attempts per meme
+            description_mode: "llm" or "fast" image description (Config.DESCRIPTION_MODE if omitted)
+            
+        Returns:
+            List of generate_meme_result() dicts for the memes that were generated
+        """
+        results = []
+        dedup_index = CaptionDeduplicator()
+        
+        logger.info("Generating %d memes for keyword: '%s'", num_memes, keyword)
         
         for meme_num in range(num_memes):
-            print(f"\n--- Meme {meme_num + 1} / {num_memes} ---")
+            logger.info("\n--- Meme %d / %d ---", meme_num + 1, num_memes)
             
-            meme_url = self.generate_meme(keyword, retry_limit)
+            result = self.generate_meme_result(
+                keyword, retry_limit, dedup_index=dedup_index, description_mode=description_mode
+            )
             
-            if meme_url:
-                meme_urls.append(meme_url)
-                print(f"Meme {meme_num + 1} generated successfully!")
+            if result:
+                results.append(result)
+                logger.info("Meme %d generated successfully!", meme_num + 1)
             else:
-                print(f"Failed to generate meme {meme_num + 1}")
+                logger.info("Failed to generate meme %d", meme_num + 1)
+        
+        logger.info("\nGenerated %d out of %d memes successfully!", len(results), num_memes)
+        return results
+    
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Get runtime statistics of the agent's components
         
-        print(f"\nGenerated {len(meme_urls)} out of {num_memes} memes successfully!")
-        return meme_urls
+        Returns:
+            Dict of per-component statistics
+        """
+        return {
+            "llm": {
+                "calls": self.model_manager.total_llm_calls,
+                "generation": self.model_manager.generation_stats(),
+                "cache": self.model_manager.cache.stats() if self.model_manager.cache else {},
+                "prompt_tokens": self.model_manager.prompt_token_stats(),
+                "engine": self.model_manager.engine_stats(),
+            },
+            "prompts": self.caption_generator.prompt_builder.stats(),
+            "prefilter": self.caption_generator.prefilter.stats(),
+            "models": self.model_manager.lifecycle.stats(),
+            "single_flight": {
+                flight.name: flight.stats()
+                for flight in (self.imgflip_api.template_flight, self.image_processor.download_flight,
+                               self.image_processor.describe_flight, self.model_manager.generation_flight)
+            },
+            "memory": self.memory_profiler.stats() if self.memory_profiler is not None else {},
+            "candidate_log": (self.caption_generator.candidate_log.stats()
+                              if self.caption_generator.candidate_log is not None else {}),
+            "executors": self.model_manager.executors.stats() if self.model_manager.executors is not None else {},
+        }
     
     def list_templates(self) -> List[dict]:
         """
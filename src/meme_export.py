@@ -0,0 +1,300 @@
+"""
+Concurrent bulk export of generated memes into a content-addressed directory or archive
+"""
+import io
+import os
+import json
+import time
+import logging
+import hashlib
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .config import Config
+from .batch_runner import JsonlWriter
+
+logger = logging.getLogger(__name__)
+
+# Result fields copied into each manifest entry
+MANIFEST_FIELDS = ("keyword", "template_id", "template_name", "top_text", "bottom_text", "score", "url")
+
+
+def read_results_file(path: str) -> List[Dict]:
+    """
+    Read meme records from a JSONL results file (batch mode or fleet --output)
+
+    Args:
+        path: JSONL file with one record per line
+
+    Returns:
+        List of records in file order; unparsable lines are skipped
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+class _DirectoryStore:
+    """Writes blobs as files under a directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def contains(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.root, name))
+
+    def add(self, name: str, data: bytes):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        pass
+
+
+class _TarStore:
+    """Appends blobs to an uncompressed tar file"""
+
+    def __init__(self, path: str):
+        self._tar = tarfile.open(path, "a" if os.path.exists(path) else "w")
+        self._names = set(self._tar.getnames())
+
+    def contains(self, name: str) -> bool:
+        return name in self._names
+
+    def add(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+        self._tar.fileobj.flush()
+        self._names.add(name)
+
+    def close(self):
+        self._tar.close()
+
+
+class _ZipStore:
+    """Appends blobs to a zip file without recompressing them"""
+
+    def __init__(self, path: str):
+        self._zip = zipfile.ZipFile(path, "a" if os.path.exists(path) else "w", zipfile.ZIP_STORED)
+        self._names = set(self._zip.namelist())
+
+    def contains(self, name: str) -> bool:
+        return name in self._names
+
+    def add(self, name: str, data: bytes):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        self._zip.writestr(info, data)
+        self._names.add(name)
+
+    def close(self):
+        self._zip.close()
+
+
+class MemeExporter:
+    """
+    Downloads rendered memes concurrently and stores each distinct image once
+
+    Images are fetched by a bounded pool of threads sharing one HTTP session,
+    so connections to Imgflip are kept alive and reused instead of opened per
+    image. Each image is stored under its SHA-256 (``ab/abcdef....jpg``), in a
+    directory or streamed into a .tar or .zip, and described in a JSON
+    manifest next to it. Entries are journaled as they are stored; a rerun
+    skips memes already exported, so an interrupted export resumes where it
+    stopped. Identical images share one stored copy.
+    """
+
+    def __init__(self, output: str, concurrency: Optional[int] = None, min_score: Optional[float] = None,
+                 manifest_path: Optional[str] = None):
+        """
+        Args:
+            output: Directory, or a path ending in .tar or .zip
+            concurrency: Downloads in flight at once (Config.EXPORT_CONCURRENCY if omitted)
+            min_score: Lowest humor score exported (Config.HUMOR_SCORE_THRESHOLD if omitted);
+                records without a score field are exported as they are
+            manifest_path: Manifest file (output/manifest.json for a directory,
+                output + ".manifest.json" for an archive, if omitted)
+        """
+        self.config = Config()
+        self.output = output
+        self.concurrency = concurrency or self.config.EXPORT_CONCURRENCY
+        self.min_score = min_score if min_score is not None else self.config.HUMOR_SCORE_THRESHOLD
+        self.archive = output.endswith((".tar", ".zip"))
+        self.manifest_path = manifest_path or (
+            f"{output}.manifest.json" if self.archive else os.path.join(output, "manifest.json")
+        )
+        self.journal_path = f"{self.manifest_path}.partial"
+
+    def _session(self) -> requests.Session:
+        """HTTP session whose connection pool holds one connection per download thread"""
+        session = requests.Session()
+        retries = Retry(total=self.config.EXPORT_RETRIES, backoff_factor=0.5,
+                        status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency, max_retries=retries)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _open_store(self):
+        if self.output.endswith(".tar"):
+            return _TarStore(self.output)
+        if self.output.endswith(".zip"):
+            return _ZipStore(self.output)
+        return _DirectoryStore(self.output)
+
+    def _accepted(self, record: Dict) -> bool:
+        """Whether a result record is a meme worth exporting"""
+        if not record.get("url") or record.get("error"):
+            return False
+        if "score" not in record:
+            return True
+        return record["score"] is not None and record["score"] >= self.min_score
+
+    def _load_entries(self) -> List[Dict]:
+        """Manifest entries of earlier runs, including an interrupted one's journal"""
+        entries = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)["memes"]
+        if os.path.exists(self.journal_path):
+            entries += read_results_file(self.journal_path)
+        return entries
+
+    def _download(self, session: requests.Session, url: str) -> Dict:
+        """Fetch one image, hashing it as it streams in"""
+        max_bytes = self.config.IMAGE_MAX_BYTES
+        digest = hashlib.sha256()
+        data = bytearray()
+        with session.get(url, stream=True, timeout=self.config.IMAGE_FETCH_TIMEOUT) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                data += chunk
+                digest.update(chunk)
+                if len(data) > max_bytes:
+                    raise ValueError(f"Image exceeds {max_bytes} bytes")
+        return {"sha256": digest.hexdigest(), "data": bytes(data)}
+
+    @staticmethod
+    def _blob_name(sha256: str, url: str) -> str:
+        extension = os.path.splitext(urlparse(url).path)[1].lower() or ".jpg"
+        return f"{sha256[:2]}/{sha256}{extension}"
+
+    def export(self, records: Iterable[Dict]) -> Dict:
+        """
+        Export every accepted meme not already in the manifest
+
+        Downloads run concurrently; storing and journaling happen on the
+        calling thread as downloads complete, so the archive is written by
+        one thread only.
+
+        Args:
+            records: Meme results (generate_meme_result() dicts or batch JSONL records)
+
+        Returns:
+            Dict with exported, duplicates (identical images stored once),
+            skipped (already exported), rejected (no URL or below min_score),
+            failed, bytes and seconds
+        """
+        store = self._open_store()
+        # A meme whose image was lost since the last run (e.g. deleted from the directory) is exported again
+        entries = [entry for entry in self._load_entries() if store.contains(entry["path"])]
+        exported_urls = {entry["url"] for entry in entries}
+        stored = {entry["sha256"]: entry["path"] for entry in entries}
+        summary = {"exported": 0, "duplicates": 0, "skipped": 0, "rejected": 0, "failed": 0, "bytes": 0}
+
+        pending = []
+        for record in records:
+            if not self._accepted(record):
+                summary["rejected"] += 1
+            elif record["url"] in exported_urls:
+                summary["skipped"] += 1
+            else:
+                exported_urls.add(record["url"])
+                pending.append(record)
+        if summary["skipped"]:
+            logger.info("Resuming export: %d memes already exported", summary["skipped"])
+
+        session = self._session()
+        journal = JsonlWriter(self.journal_path)
+        start = time.perf_counter()
+        jobs = iter(pending)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="export") as executor:
+                in_flight = {}
+                while True:
+                    # Bound the downloaded images held in memory while the store catches up
+                    while len(in_flight) < self.concurrency * 2:
+                        record = next(jobs, None)
+                        if record is None:
+                            break
+                        in_flight[executor.submit(self._download, session, record["url"])] = record
+                    if not in_flight:
+                        break
+
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record = in_flight.pop(future)
+                        try:
+                            blob = future.result()
+                        except Exception as e:
+                            summary["failed"] += 1
+                            logger.warning("Export of %s failed: %s", record["url"], e)
+                            continue
+
+                        sha256 = blob["sha256"]
+                        if sha256 in stored:
+                            summary["duplicates"] += 1
+                        else:
+                            stored[sha256] = self._blob_name(sha256, record["url"])
+                            store.add(stored[sha256], blob["data"])
+                            summary["bytes"] += len(blob["data"])
+                        entry = {field: record.get(field) for field in MANIFEST_FIELDS}
+                        entry.update(sha256=sha256, path=stored[sha256], bytes=len(blob["data"]))
+                        journal.write(entry)
+                        entries.append(entry)
+                        summary["exported"] += 1
+        finally:
+            store.close()
+            journal.close()
+            session.close()
+            self._write_manifest(entries)
+
+        summary["seconds"] = time.perf_counter() - start
+        logger.info("Exported %d memes (%d duplicates, %.1f MiB) in %.1fs", summary["exported"],
+                    summary["duplicates"], summary["bytes"] / 2**20, summary["seconds"])
+        return summary
+
+    def _write_manifest(self, entries: List[Dict]):
+        """Replace the manifest with every entry so far and drop the journal"""
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        manifest = {
+            "output": os.path.basename(self.output.rstrip(os.sep)),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "count": len(entries),
+            "memes": entries,
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
@@ -0,0 +1,306 @@
+"""
+Memory instrumentation: per-stage RSS and tracemalloc deltas, live object counts and soak tests
+"""
+import gc
+import os
+import sys
+import time
+import logging
+import warnings
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size of the process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def live_objects() -> Dict[str, int]:
+    """
+    Count live PIL images and torch tensors
+
+    Walks every object the garbage collector tracks, so it costs tens of
+    milliseconds; call it at snapshots, not per request.
+
+    Returns:
+        Dict with pil_images, pil_image_bytes, tensors and tensor_bytes
+        (storage shared by several views is counted once)
+    """
+    from PIL import Image
+    import torch
+
+    counts = {"pil_images": 0, "pil_image_bytes": 0, "tensors": 0, "tensor_bytes": 0}
+    storages = set()
+    gc.collect()
+    with warnings.catch_warnings():
+        # isinstance() on deprecated module proxies (torch.distributed.reduce_op) warns
+        warnings.simplefilter("ignore")
+        for obj in gc.get_objects():
+            if isinstance(obj, Image.Image):
+                counts["pil_images"] += 1
+                counts["pil_image_bytes"] += obj.width * obj.height * len(obj.getbands())
+            elif isinstance(obj, torch.Tensor):
+                counts["tensors"] += 1
+                try:
+                    storage = obj.untyped_storage()
+                except RuntimeError:
+                    continue
+                key = (storage.data_ptr(), storage.nbytes())
+                if key not in storages:
+                    storages.add(key)
+                    counts["tensor_bytes"] += storage.nbytes()
+    return counts
+
+
+def torch_allocator_stats() -> Dict[str, int]:
+    """
+    Caching allocator statistics of the current CUDA device
+
+    CPU tensors come from the system allocator, so on CPU they only show up
+    in RSS and in live_objects(); an empty dict is returned then.
+    """
+    import torch
+
+    if not torch.cuda.is_available():
+        return {}
+    stats = torch.cuda.memory_stats()
+    return {
+        "allocated_bytes": stats.get("allocated_bytes.all.current", 0),
+        "reserved_bytes": stats.get("reserved_bytes.all.current", 0),
+        "peak_allocated_bytes": stats.get("allocated_bytes.all.peak", 0),
+        "alloc_retries": stats.get("num_alloc_retries", 0),
+        "ooms": stats.get("num_ooms", 0),
+    }
+
+
+class MemoryProfiler:
+    """
+    Tracks memory growth per pipeline stage and across snapshots
+
+    stage() records how much RSS and traced Python memory each stage adds.
+    Both are process-wide, so with concurrent requests a stage's delta also
+    includes what other threads allocated meanwhile; the totals over many
+    calls still show which stages keep memory.
+    """
+
+    def __init__(self, trace_frames: Optional[int] = None):
+        """
+        Args:
+            trace_frames: Stack frames tracemalloc keeps per allocation
+                (Config.MEMORY_TRACE_FRAMES if omitted; 0 leaves tracemalloc off
+                and only RSS is tracked)
+        """
+        self.config = Config()
+        self.trace_frames = trace_frames if trace_frames is not None else self.config.MEMORY_TRACE_FRAMES
+        if self.trace_frames and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+        self._stages: Dict[str, Dict] = {}
+        self._snapshots: List[Dict] = []
+        self._traces: List[tracemalloc.Snapshot] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure the RSS and traced memory a block leaves behind"""
+        rss_before = rss_bytes()
+        traced_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rss_delta = rss_bytes() - rss_before
+            traced_delta = (tracemalloc.get_traced_memory()[0] - traced_before) if tracemalloc.is_tracing() else 0
+            with self._lock:
+                stage = self._stages.setdefault(name, {
+                    "calls": 0, "seconds": 0.0, "rss_growth_bytes": 0, "max_rss_delta_bytes": 0,
+                    "traced_growth_bytes": 0,
+                })
+                stage["calls"] += 1
+                stage["seconds"] += elapsed
+                stage["rss_growth_bytes"] += rss_delta
+                stage["max_rss_delta_bytes"] = max(stage["max_rss_delta_bytes"], rss_delta)
+                stage["traced_growth_bytes"] += traced_delta
+
+    def snapshot(self, label: str = "") -> Dict:
+        """
+        Record RSS, traced memory, live object counts and allocator statistics
+
+        Args:
+            label: Name for the snapshot
+
+        Returns:
+            The snapshot dict (also kept for stats())
+        """
+        snapshot = {"label": label, "time": time.time(), "rss_bytes": rss_bytes()}
+        snapshot.update(live_objects())
+        snapshot["torch"] = torch_allocator_stats()
+        if tracemalloc.is_tracing():
+            snapshot["traced_bytes"], snapshot["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+            trace = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            with self._lock:
+                # Only the first and latest traces are needed to report growth
+                self._traces = self._traces[:1] + [trace]
+        with self._lock:
+            self._snapshots.append(snapshot)
+        return snapshot
+
+    def top_growth(self, limit: int = 10) -> List[str]:
+        """
+        Source lines whose traced memory grew most between the first and latest snapshot
+
+        Args:
+            limit: Number of lines to return
+
+        Returns:
+            Lines like "src/file.py:42: +1.2 MiB (+3100 blocks)"; empty without tracemalloc
+        """
+        with self._lock:
+            if len(self._traces) < 2:
+                return []
+            first, latest = self._traces[0], self._traces[-1]
+        diffs = latest.compare_to(first, "lineno")
+        lines = []
+        for diff in diffs[:limit]:
+            if diff.size_diff <= 0:
+                break
+            frame = diff.traceback[0]
+            lines.append(f"{frame.filename}:{frame.lineno}: +{diff.size_diff / 2**20:.2f} MiB "
+                         f"(+{diff.count_diff} blocks)")
+        return lines
+
+    def stats(self) -> Dict:
+        """
+        Get memory statistics
+
+        Returns:
+            Dict with current rss_bytes, per-stage growth (stages) and the snapshots taken
+        """
+        with self._lock:
+            return {
+                "rss_bytes": rss_bytes(),
+                "stages": {name: dict(stage) for name, stage in self._stages.items()},
+                "snapshots": list(self._snapshots),
+            }
+
+
+def soak_test(run_once: Callable[[int], object], iterations: int, warmup: Optional[int] = None,
+              sample_every: Optional[int] = None, max_growth_bytes: Optional[int] = None,
+              profiler: Optional[MemoryProfiler] = None, max_error_rate: Optional[float] = None) -> Dict:
+    """
+    Run a pipeline many times and check that memory stops growing
+
+    The RSS after warmup is the baseline: caches, model state and allocator
+    pools fill up during the first runs. Growth after that, both end to end
+    and as a fitted per-iteration slope, points at a leak. Runs that raise
+    skip most of the pipeline, so the soak also fails when more of them
+    raise than max_error_rate allows.
+
+    Args:
+        run_once: Called with the iteration number; runs one pipeline
+        iterations: Number of runs
+        warmup: Runs before the baseline (Config.SOAK_WARMUP_ITERATIONS if omitted)
+        sample_every: Runs between snapshots (iterations // 20 if omitted)
+        max_growth_bytes: Allowed RSS growth after warmup (Config.SOAK_MAX_GROWTH_MB if omitted)
+        profiler: MemoryProfiler to take snapshots with (a new one without tracemalloc if omitted)
+        max_error_rate: Allowed fraction of failed runs (Config.SOAK_MAX_ERROR_RATE if omitted)
+
+    Returns:
+        Dict with passed, errors, error_rate, growth_bytes, bytes_per_iteration, the samples and,
+        when tracemalloc runs, the top growing source lines; per-stage growth
+        too if run_once measures its stages with the same profiler
+    """
+    warmup = warmup if warmup is not None else min(Config.SOAK_WARMUP_ITERATIONS, iterations // 2)
+    sample_every = sample_every or max(iterations // 20, 1)
+    if max_growth_bytes is None:
+        max_growth_bytes = int(Config.SOAK_MAX_GROWTH_MB * 2**20)
+    if max_error_rate is None:
+        max_error_rate = Config.SOAK_MAX_ERROR_RATE
+    profiler = profiler or MemoryProfiler(trace_frames=0)
+
+    samples = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        try:
+            run_once(i)
+        except Exception as e:
+            errors += 1
+            logger.warning("Soak iteration %d failed: %s", i, e)
+        done = i + 1
+        if done == warmup or (done > warmup and (done - warmup) % sample_every == 0) or done == iterations:
+            snapshot = profiler.snapshot(f"iteration {done}")
+            snapshot["iteration"] = done
+            samples.append(snapshot)
+            logger.info("Soak %d/%d: RSS %.1f MiB, %d PIL images, %d tensors", done, iterations,
+                        snapshot["rss_bytes"] / 2**20, snapshot["pil_images"], snapshot["tensors"])
+
+    measured = [s for s in samples if s["iteration"] >= warmup] or samples
+    baseline, final = measured[0], measured[-1]
+    growth = final["rss_bytes"] - baseline["rss_bytes"]
+    slope = 0.0
+    if len(measured) >= 3:
+        slope = float(np.polyfit([s["iteration"] for s in measured], [s["rss_bytes"] for s in measured], 1)[0])
+    error_rate = errors / iterations if iterations else 0.0
+    return {
+        "passed": growth <= max_growth_bytes and error_rate <= max_error_rate,
+        "iterations": iterations,
+        "warmup": warmup,
+        "errors": errors,
+        "error_rate": error_rate,
+        "max_error_rate": max_error_rate,
+        "seconds": time.perf_counter() - start,
+        "baseline_rss_bytes": baseline["rss_bytes"],
+        "final_rss_bytes": final["rss_bytes"],
+        "growth_bytes": growth,
+        "max_growth_bytes": max_growth_bytes,
+        "bytes_per_iteration": slope,
+        "pil_image_growth": final["pil_images"] - baseline["pil_images"],
+        "tensor_growth": final["tensors"] - baseline["tensors"],
+        "samples": samples,
+        "stages": profiler.stats()["stages"],
+        "top_growth": profiler.top_growth(),
+    }
+
+
+def format_soak_report(report: Dict) -> str:
+    """Render a soak test report"""
+    lines = [f"{'iteration':>10}{'RSS MiB':>10}{'PIL':>6}{'tensors':>9}{'tensor MiB':>12}"]
+    for sample in report["samples"]:
+        lines.append(f"{sample['iteration']:>10}{sample['rss_bytes'] / 2**20:>10.1f}{sample['pil_images']:>6}"
+                     f"{sample['tensors']:>9}{sample['tensor_bytes'] / 2**20:>12.1f}")
+    lines.append("")
+    lines.append(f"{report['iterations']} iterations in {report['seconds']:.0f}s ({report['errors']} errors); "
+                 f"RSS grew {report['growth_bytes'] / 2**20:+.1f} MiB after {report['warmup']} warmup runs "
+                 f"({report['bytes_per_iteration'] / 1024:+.2f} KiB/iteration), "
+                 f"PIL images {report['pil_image_growth']:+d}, tensors {report['tensor_growth']:+d}")
+    if report["stages"]:
+        lines.append("RSS growth by stage:")
+        for name, stage in report["stages"].items():
+            lines.append(f"  {name}: {stage['rss_growth_bytes'] / 2**20:+.1f} MiB over {stage['calls']} calls")
+    if report["top_growth"]:
+        lines.append("Top growing allocations:")
+        lines.extend(f"  {line}" for line in report["top_growth"])
+    verdict = "PASSED" if report["passed"] else "FAILED"
+    lines.append(f"{verdict}: growth limit {report['max_growth_bytes'] / 2**20:.3g} MiB, "
+                 f"error rate {report['error_rate']:.1%} (limit {report['max_error_rate']:.1%})")
+    return "\n".join(lines)
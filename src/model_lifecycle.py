@@ -0,0 +1,245 @@
+"""
+Idle eviction and on-demand reload of loaded models
+"""
+import logging
+import gc
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class _ManagedModel:
+    """Bookkeeping for one model under lifecycle management"""
+
+    def __init__(self, loader: Callable[[], None], unloader: Callable[[], None], size_fn: Callable[[], int]):
+        self.loader = loader
+        self.unloader = unloader
+        self.size_fn = size_fn
+        # Held while the loader runs, so one thread loads and the others wait for it
+        self.load_lock = threading.Lock()
+        self.loaded = False
+        # Calls running on the model; idle and budget eviction leave it loaded until they finish
+        self.in_use = 0
+        self.size_bytes = 0
+        self.loads = 0
+        self.unloads = 0
+        self.loaded_at = 0.0
+        self.last_used = 0.0
+        self.resident_seconds = 0.0
+
+
+class ModelLifecycleManager:
+    """
+    Loads models on demand and unloads them when idle or over the memory budget
+
+    Loaders run outside the manager's lock, under a per-model guard, so
+    loading one model (many seconds for the text model) does not block
+    requests using the others. The manager's lock is only taken to publish
+    a finished load and to update the LRU and budget accounting. Models
+    held by a running call are never evicted for idleness or the budget.
+    """
+
+    def __init__(self, idle_timeout: Optional[float] = None, memory_budget_bytes: Optional[int] = None):
+        """
+        Args:
+            idle_timeout: Seconds a model may stay unused before it is unloaded
+                (Config.MODEL_IDLE_TIMEOUT if omitted; None disables idle eviction)
+            memory_budget_bytes: Maximum combined size of loaded models
+                (Config.MODEL_MEMORY_BUDGET_BYTES if omitted; None disables the budget)
+        """
+        self.config = Config()
+        self.idle_timeout = idle_timeout if idle_timeout is not None else self.config.MODEL_IDLE_TIMEOUT
+        self.memory_budget_bytes = (memory_budget_bytes if memory_budget_bytes is not None
+                                    else self.config.MODEL_MEMORY_BUDGET_BYTES)
+        self._models: Dict[str, _ManagedModel] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[[], None], unloader: Callable[[], None],
+                 size_fn: Callable[[], int]):
+        """
+        Put a model under lifecycle management
+
+        Args:
+            name: Model name ("text", "blip", ...)
+            loader: Loads the model
+            unloader: Drops every reference the owner holds to the model
+            size_fn: Returns the loaded model's size in bytes
+        """
+        with self._lock:
+            self._models[name] = _ManagedModel(loader, unloader, size_fn)
+
+    def ensure_loaded(self, name: str):
+        """
+        Load a model if needed and mark it as used
+
+        Threads asking for a model another thread is loading wait for that
+        load instead of starting their own.
+
+        Args:
+            name: Model name
+        """
+        model = self._models[name]
+        while True:
+            with self._lock:
+                if model.loaded:
+                    model.last_used = time.monotonic()
+                    return
+            with model.load_lock:
+                with self._lock:
+                    if model.loaded:
+                        # Loaded by the thread that held the guard
+                        continue
+                    # Make room using the size from the previous load, if there was one
+                    self._enforce_budget(exclude=name, incoming=model.size_bytes)
+                    if model.loads:
+                        logger.info("Reloading %s model...", name)
+                model.loader()
+                with self._lock:
+                    model.loaded = True
+                    model.loads += 1
+                    model.loaded_at = model.last_used = time.monotonic()
+                    model.size_bytes = model.size_fn()
+                    self._enforce_budget(exclude=name)
+                    self._start_reaper()
+                return
+
+    def use(self, name: str, getter: Callable):
+        """
+        Load a model if needed and read its references atomically
+
+        Args:
+            name: Model name
+            getter: Returns the owner's references to the model
+
+        Returns:
+            Whatever getter returns, taken while the model is guaranteed loaded
+        """
+        while True:
+            self.ensure_loaded(name)
+            with self._lock:
+                # The model may have been unloaded between the load and taking the lock
+                if self._models[name].loaded:
+                    return getter()
+
+    @contextmanager
+    def hold(self, name: str, getter: Optional[Callable] = None):
+        """
+        Keep a model loaded for the duration of a call
+
+        Idle eviction and the memory budget skip held models, and releasing
+        the hold counts as a use, so the idle timer starts when the call ends.
+
+        Args:
+            name: Model name
+            getter: Returns the owner's references to the model
+
+        Yields:
+            Whatever getter returns (None without a getter)
+        """
+        model = self._models[name]
+        while True:
+            self.ensure_loaded(name)
+            with self._lock:
+                # The model may have been unloaded between the load and taking the lock
+                if model.loaded:
+                    model.in_use += 1
+                    refs = getter() if getter is not None else None
+                    break
+        try:
+            yield refs
+        finally:
+            with self._lock:
+                model.in_use -= 1
+                model.last_used = time.monotonic()
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether the model is currently loaded"""
+        with self._lock:
+            return self._models[name].loaded
+
+    def unload(self, name: str, reason: str = "requested"):
+        """
+        Unload a model; it is reloaded on its next use
+
+        Callers still holding a reference keep the weights alive until they
+        finish, so unloading never breaks an in-flight request.
+
+        Args:
+            name: Model name
+            reason: Why the model is unloaded, for the log line
+        """
+        with self._lock:
+            model = self._models[name]
+            if not model.loaded:
+                return
+            model.unloader()
+            model.loaded = False
+            model.unloads += 1
+            model.resident_seconds += time.monotonic() - model.loaded_at
+        gc.collect()
+        logger.info("Unloaded %s model (%s)", name, reason)
+
+    def _enforce_budget(self, exclude: str, incoming: int = 0):
+        """Unload least recently used models that no call holds until the loaded set fits the budget"""
+        if self.memory_budget_bytes is None:
+            return
+        loaded = sorted(
+            (m.last_used, name) for name, m in self._models.items()
+            if m.loaded and not m.in_use and name != exclude
+        )
+        used = incoming + sum(m.size_bytes for m in self._models.values() if m.loaded)
+        for _, name in loaded:
+            if used <= self.memory_budget_bytes:
+                break
+            used -= self._models[name].size_bytes
+            self.unload(name, "memory budget")
+
+    def _start_reaper(self):
+        """Start the idle eviction thread once idle eviction is configured"""
+        if self.idle_timeout is None or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap_idle, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_idle(self):
+        interval = max(min(self.idle_timeout / 4, 30.0), 0.05)
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            with self._lock:
+                idle = [name for name, m in self._models.items()
+                        if m.loaded and not m.in_use and now - m.last_used > self.idle_timeout]
+                for name in idle:
+                    self.unload(name, f"idle for {self.idle_timeout:g}s")
+
+    def close(self):
+        """Stop the idle eviction thread"""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Get residency statistics
+
+        Returns:
+            Dict keyed by model name with loaded, in_use, size_bytes, loads,
+            reloads, unloads and resident_seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "loaded": m.loaded,
+                    "in_use": m.in_use,
+                    "size_bytes": m.size_bytes,
+                    "loads": m.loads,
+                    "reloads": max(m.loads - 1, 0),
+                    "unloads": m.unloads,
+                    "resident_seconds": m.resident_seconds + (now - m.loaded_at if m.loaded else 0.0),
+                }
+                for name, m in self._models.items()
+            }
@@ -0,0 +1,196 @@
+"""
+Local snapshot of the fully prepared models for fast restarts
+"""
+import logging
+import os
+import glob
+import json
+import time
+import torch
+from typing import Callable, Dict, Optional, Tuple
+from accelerate import init_empty_weights
+from accelerate.utils import set_module_tensor_to_device
+from safetensors import safe_open
+from transformers import (
+    AutoConfig,
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    BlipProcessor,
+    BlipForConditionalGeneration,
+    GenerationConfig
+)
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSnapshot:
+    """
+    Directory of safetensors checkpoints written after the models are prepared
+
+    Loading a snapshot skips the hub login and download checks and the
+    dtype conversion of the original checkpoints. On CPU the models are
+    built without weights and their parameters point straight into the
+    memory-mapped safetensors files: pages are read when first touched,
+    and processes loading the same snapshot share them through the page
+    cache until a weight is written. On GPU the weights are copied to the
+    device, so the models are loaded with from_pretrained instead.
+    """
+
+    MANIFEST = "snapshot.json"
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Snapshot directory
+        """
+        self.path = path
+        self.config = Config()
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def manifest(self) -> Optional[Dict]:
+        """
+        Read the snapshot manifest
+
+        Returns:
+            Manifest dict, or None if there is no snapshot
+        """
+        try:
+            with open(os.path.join(self.path, self.MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self) -> bool:
+        """Whether the snapshot exists and was taken from the configured models"""
+        manifest = self.manifest()
+        if manifest is None:
+            return False
+        if (manifest.get("model_name") != self.config.MODEL_NAME or
+                manifest.get("blip_model_name") != self.config.BLIP_MODEL_NAME):
+            logger.warning("Model snapshot in %s was taken from different models, ignoring it", self.path)
+            return False
+        return True
+
+    def has_draft_model(self) -> bool:
+        """Whether the snapshot includes the configured speculative decoding draft model"""
+        manifest = self.manifest() or {}
+        return manifest.get("draft_model_name") == self.config.DRAFT_MODEL_NAME
+
+    def save(self, tokenizer, text_model, blip_processor, blip_model, draft_model=None):
+        """
+        Write the prepared models to the snapshot directory
+
+        Args:
+            tokenizer: Text model tokenizer
+            text_model: Text generation model
+            blip_processor: BLIP processor
+            blip_model: BLIP captioning model
+            draft_model: Optional speculative decoding draft model
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        text_model.save_pretrained(self._dir("text"), safe_serialization=True)
+        tokenizer.save_pretrained(self._dir("text"))
+        blip_model.save_pretrained(self._dir("blip"), safe_serialization=True)
+        blip_processor.save_pretrained(self._dir("blip"))
+        if draft_model is not None:
+            draft_model.save_pretrained(self._dir("draft"), safe_serialization=True)
+
+        manifest = {
+            "model_name": self.config.MODEL_NAME,
+            "blip_model_name": self.config.BLIP_MODEL_NAME,
+            "draft_model_name": self.config.DRAFT_MODEL_NAME if draft_model is not None else None,
+            "text_dtype": str(text_model.dtype).replace("torch.", ""),
+            "blip_dtype": str(blip_model.dtype).replace("torch.", ""),
+            "created": time.time(),
+        }
+        # The manifest is written last so a partial snapshot is never picked up
+        with open(os.path.join(self.path, self.MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def load_text_model(self) -> Tuple:
+        """
+        Load the tokenizer and text model
+
+        Returns:
+            Tuple of (tokenizer, model)
+        """
+        manifest = self.manifest()
+        tokenizer = AutoTokenizer.from_pretrained(self._dir("text"), local_files_only=True)
+        if not torch.cuda.is_available():
+            return tokenizer, self._load_mapped("text", AutoModelForCausalLM.from_config)
+        model = AutoModelForCausalLM.from_pretrained(
+            self._dir("text"),
+            local_files_only=True,
+            device_map="auto",
+            torch_dtype=manifest["text_dtype"],
+        )
+        return tokenizer, model
+
+    def load_draft_model(self, torch_dtype):
+        """
+        Load the speculative decoding draft model
+
+        Args:
+            torch_dtype: dtype matching the text model
+
+        Returns:
+            Draft model
+        """
+        if not torch.cuda.is_available():
+            return self._load_mapped("draft", AutoModelForCausalLM.from_config).to(torch_dtype)
+        return AutoModelForCausalLM.from_pretrained(
+            self._dir("draft"), local_files_only=True, torch_dtype=torch_dtype
+        )
+
+    def load_blip_model(self) -> Tuple:
+        """
+        Load the BLIP processor and model
+
+        Returns:
+            Tuple of (processor, model)
+        """
+        manifest = self.manifest()
+        processor = BlipProcessor.from_pretrained(self._dir("blip"), local_files_only=True)
+        if not torch.cuda.is_available():
+            return processor, self._load_mapped("blip", BlipForConditionalGeneration)
+        model = BlipForConditionalGeneration.from_pretrained(
+            self._dir("blip"), local_files_only=True, torch_dtype=manifest["blip_dtype"]
+        )
+        return processor, model
+
+    def _load_mapped(self, name: str, build: Callable):
+        """
+        Build a model on the meta device and point its parameters into its memory-mapped safetensors files
+
+        Args:
+            name: Snapshot subdirectory
+            build: Creates the model from its config
+
+        Returns:
+            Model in eval mode whose weights are backed by the snapshot files
+        """
+        directory = self._dir(name)
+        with init_empty_weights(include_buffers=False):
+            model = build(AutoConfig.from_pretrained(directory, local_files_only=True))
+
+        for path in sorted(glob.glob(os.path.join(directory, "*.safetensors"))):
+            with safe_open(path, framework="pt", device="cpu") as f:
+                for key in f.keys():
+                    tensor = f.get_tensor(key)
+                    # Same dtype and device, so the parameter keeps the mapped storage instead of a copy
+                    set_module_tensor_to_device(model, key, "cpu", value=tensor, dtype=tensor.dtype)
+        # Tied weights (e.g. the LM head) are not stored separately
+        model.tie_weights()
+
+        missing = [key for key, param in model.named_parameters() if param.device.type == "meta"]
+        if missing:
+            raise ValueError(f"Model snapshot in {directory} is missing weights: {', '.join(missing[:5])}")
+        try:
+            model.generation_config = GenerationConfig.from_pretrained(directory, local_files_only=True)
+        except OSError:
+            pass
+        return model.eval()
@@ -1,6 +1,11 @@
 """
 AI Models initialization and management
 """
+import logging
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 import torch
 from transformers import (
     AutoTokenizer, 
@@ -12,6 +17,16 @@ from transformers import (
 from langchain_community.llms import HuggingFacePipeline
 from huggingface_hub import login
 from .config import Config
+from .llm_cache import LLMCache
+from .model_snapshot import ModelSnapshot
+from .model_lifecycle import ModelLifecycleManager
+from .deadline import Deadline
+from .single_flight import SingleFlight
+from .blip_backend import BlipVisionEncoder
+from .core_partition import PartitionedExecutors
+from .generation_engine import GenerationEngine
+
+logger = logging.getLogger(__name__)
 
 class ModelManager:
     """Manages all AI models used in the meme generator"""
@@ -19,37 +34,119 @@ class ModelManager:
     def __init__(self):
         self.config = Config()
         self._llm = None
+        self._tokenizer = None
+        self._text_model = None
+        self._draft_model = None
+        self._engine = None
         self._blip_processor = None
         self._blip_model = None
         self._is_initialized = False
+        self._logged_in = False
+        self.load_times = {}
+        self.snapshot = ModelSnapshot(self.config.MODEL_SNAPSHOT_DIR) if self.config.MODEL_SNAPSHOT_DIR else None
+        self._total_llm_calls = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.cache = LLMCache() if self.config.LLM_CACHE_ENABLED else None
+        self.generation_flight = SingleFlight("generation")
+        self._generation_stats = {
+            mode: {"calls": 0, "new_tokens": 0, "seconds": 0.0, "target_forwards": 0, "draft_forwards": 0}
+            for mode in ("standard", "speculative", "continuous")
+        }
+        self._prompt_token_stats = {}
+        self._encodings: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._encodings_lock = threading.Lock()
+        
+        self.blip_vision = BlipVisionEncoder(self)
+        self.executors = PartitionedExecutors() if self.config.CORE_PARTITIONING else None
+        
+        # Models are loaded on demand and may be unloaded when idle or over the memory budget
+        self.lifecycle = ModelLifecycleManager()
+        self.lifecycle.register(
+            "text",
+            lambda: self._timed_load("text", self._initialize_text_model),
+            self._unload_text_model,
+            lambda: self._model_bytes(self._text_model, self._draft_model),
+        )
+        self.lifecycle.register(
+            "blip",
+            lambda: self._timed_load("blip", self._initialize_blip_model),
+            self._unload_blip_model,
+            lambda: self._model_bytes(self._blip_model),
+        )
     
     def initialize(self):
         """Initialize all models"""
         if self._is_initialized:
             return
-            
-        # Login to Hugging Face
-        login(self.config.HF_TOKEN)
         
         # Initialize text generation model
-        self._initialize_text_model()
+        self._ensure_text_model()
         
         # Initialize BLIP model for image captioning
-        self._initialize_blip_model()
+        self._ensure_blip_model()
         
         self._is_initialized = True
-        print("All models initialized successfully!")
+        logger.info("All models initialized successfully!")
+    
+    def _use_snapshot(self) -> bool:
+        """Whether models should be loaded from the local snapshot"""
+        return self.snapshot is not None and self.snapshot.is_valid()
+    
+    def _login(self):
+        """Login to Hugging Face once, only when loading from the hub"""
+        if not self._logged_in:
+            login(self.config.HF_TOKEN)
+            self._logged_in = True
+    
+    def _timed_load(self, name: str, loader):
+        """Run a model loader and record how long it took"""
+        start = time.perf_counter()
+        loader()
+        self.load_times[name] = time.perf_counter() - start
+    
+    def _ensure_text_model(self):
+        """Load the text generation model if it is not loaded yet"""
+        self.lifecycle.ensure_loaded("text")
+    
+    def _ensure_blip_model(self):
+        """Load the BLIP model if it is not loaded yet"""
+        self.lifecycle.ensure_loaded("blip")
+    
+    @staticmethod
+    def _model_bytes(*models) -> int:
+        """Size of the parameters and buffers of the given models"""
+        return sum(
+            t.numel() * t.element_size()
+            for model in models if model is not None
+            for t in list(model.parameters()) + list(model.buffers())
+        )
+    
+    def _unload_text_model(self):
+        """Drop the references to the text and draft models"""
+        self._llm = self._tokenizer = self._text_model = self._draft_model = self._engine = None
+        self._is_initialized = False
+    
+    def _unload_blip_model(self):
+        """Drop the references to the BLIP model"""
+        self._blip_processor = self._blip_model = None
+        self.blip_vision.reset()
+        self._is_initialized = False
     
     def _initialize_text_model(self):
         """Initialize the text generation model"""
-        print("Loading text generation model...")
+        logger.info("Loading text generation model...")
         
-        tokenizer = AutoTokenizer.from_pretrained(self.config.MODEL_NAME)
-        model = AutoModelForCausalLM.from_pretrained(
-            self.config.MODEL_NAME, 
-            device_map="auto", 
-            torch_dtype="auto"
-        )
+        if self._use_snapshot():
+            tokenizer, model = self.snapshot.load_text_model()
+        else:
+            self._login()
+            tokenizer = AutoTokenizer.from_pretrained(self.config.MODEL_NAME)
+            model = AutoModelForCausalLM.from_pretrained(
+                self.config.MODEL_NAME, 
+                device_map="auto", 
+                torch_dtype="auto"
+            )
         
         pipe = pipeline(
             "text-generation", 
@@ -59,36 +156,461 @@ class ModelManager:
         )
         
         self._llm = HuggingFacePipeline(pipeline=pipe)
-        print("Text generation model loaded!")
+        self._tokenizer = tokenizer
+        self._text_model = model
+        model.register_forward_hook(self._count_forward("target_forwards"))
+        if self.config.CONTINUOUS_BATCHING:
+            self._engine = self._build_engine(tokenizer, model)
+        logger.info("Text generation model loaded!")
+        
+        if self.config.SPECULATIVE_DECODING:
+            self._initialize_draft_model()
+    
+    def _initialize_draft_model(self):
+        """Initialize the small draft model used for speculative decoding"""
+        logger.info("Loading draft model %s...", self.config.DRAFT_MODEL_NAME)
+        
+        if self._use_snapshot() and self.snapshot.has_draft_model():
+            draft = self.snapshot.load_draft_model(self._text_model.dtype)
+        else:
+            self._login()
+            draft = AutoModelForCausalLM.from_pretrained(
+                self.config.DRAFT_MODEL_NAME,
+                torch_dtype=self._text_model.dtype
+            )
+        draft = draft.to(self._text_model.device)
+        draft.generation_config.num_assistant_tokens = self.config.SPECULATIVE_NUM_DRAFT_TOKENS
+        draft.register_forward_hook(self._count_forward("draft_forwards"))
+        
+        self._draft_model = draft
+        logger.info("Draft model loaded!")
+    
+    def _build_engine(self, tokenizer, model) -> GenerationEngine:
+        """Continuous batching engine for the text model, on the text cores when they are partitioned"""
+        eos = model.generation_config.eos_token_id
+        eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos]) | {tokenizer.eos_token_id}
+        thread_init = (lambda: self.executors.configure_thread("text")) if self.executors is not None else None
+        return GenerationEngine(model, [t for t in eos_token_ids if t is not None], thread_init=thread_init)
+    
+    def _count_forward(self, counter: str):
+        """Build a forward hook counting model passes made by generate() on this thread"""
+        def hook(module, inputs, output):
+            stats = getattr(self._local, "forwards", None)
+            if stats is not None:
+                stats[counter] += 1
+        return hook
     
     def _initialize_blip_model(self):
         """Initialize the BLIP model for image captioning"""
-        print("Loading BLIP model for image captioning...")
+        logger.info("Loading BLIP model for image captioning...")
+        
+        if self._use_snapshot():
+            self._blip_processor, blip_model = self.snapshot.load_blip_model()
+        else:
+            self._login()
+            self._blip_processor = BlipProcessor.from_pretrained(self.config.BLIP_MODEL_NAME)
+            blip_model = BlipForConditionalGeneration.from_pretrained(
+                self.config.BLIP_MODEL_NAME
+            )
+        self._blip_model = blip_model.to("cpu")
+        
+        logger.info("BLIP model loaded!")
+    
+    def generate(self, prompt: str, call_site: str = "default", temperature: float = 0.0,
+                 top_p: float = 1.0, max_new_tokens: int = None, deadline: Deadline = None) -> str:
+        """
+        Run the language model on a prompt
+        
+        Args:
+            prompt: Prompt text
+            call_site: Name of the calling stage ("caption", "expansion", "scoring", ...);
+                speculative decoding is used only for Config.SPECULATIVE_CALL_SITES
+            temperature: Sampling temperature (0 for greedy decoding)
+            top_p: Nucleus sampling probability mass
+            max_new_tokens: Generation length limit (Config.MAX_NEW_TOKENS if omitted)
+            deadline: Request deadline; generation stops at the next token once it expires
+            
+        Returns:
+            Generated text, without the prompt
+            
+        Raises:
+            DeadlineExceeded: If the deadline expired before or during generation
+        """
+        if deadline is not None:
+            deadline.check(f"start of {call_site} generation")
+        
+        # Stays (0, 0) when the output comes from the cache or another thread's identical call
+        self._local.token_counts = [(0, 0)]
+        params = {"temperature": temperature, "top_p": top_p,
+                  "max_new_tokens": max_new_tokens or self.config.MAX_NEW_TOKENS}
+        if call_site in self.config.SINGLE_FLIGHT_CALL_SITES:
+            key = (call_site, prompt, temperature, top_p, params["max_new_tokens"])
+            return self.generation_flight.do(
+                key, lambda: self._cached_generate(prompt, call_site, params, deadline), deadline
+            )
+        return self._cached_generate(prompt, call_site, params, deadline)
+    
+    def _cached_generate(self, prompt: str, call_site: str, params: dict, deadline: Deadline = None) -> str:
+        """Run the text model unless the LLM cache already holds the output"""
+        if self.cache is not None:
+            cached = self.cache.get(call_site, prompt, params)
+            if cached is not None:
+                return cached
         
-        self._blip_processor = BlipProcessor.from_pretrained(self.config.BLIP_MODEL_NAME)
-        self._blip_model = BlipForConditionalGeneration.from_pretrained(
-            self.config.BLIP_MODEL_NAME
-        ).to("cpu")
+        text = self._generate(prompt, call_site, deadline=deadline, **params)
         
-        print("BLIP model loaded!")
+        if self.cache is not None:
+            self.cache.put(call_site, prompt, params, text)
+        return text
+    
+    def _generate(self, prompt: str, call_site: str, temperature: float, top_p: float,
+                  max_new_tokens: int, deadline: Deadline = None) -> str:
+        """Run the text model, with the draft model if the call site allows it"""
+        self._total_llm_calls += 1
+        self._local.calls = getattr(self._local, "calls", 0) + 1
+        
+        with self.lifecycle.hold(
+            "text", lambda: (self._tokenizer, self._text_model, self._draft_model, self._engine)
+        ) as (tokenizer, model, draft_model, engine):
+            speculative = draft_model is not None and call_site in self.config.SPECULATIVE_CALL_SITES
+            if engine is not None and not speculative:
+                input_ids = self.encode(prompt)
+                self._record_prompt_tokens(call_site, input_ids.shape[1])
+                start = time.perf_counter()
+                result = engine.generate(input_ids, max_new_tokens, temperature, top_p, deadline)
+                self._record_generation("continuous", len(result["tokens"]), time.perf_counter() - start,
+                                        {"target_forwards": result["forwards"], "draft_forwards": 0})
+                self._local.token_counts = [(input_ids.shape[1], len(result["tokens"]))]
+                if deadline is not None:
+                    deadline.check(f"end of {call_site} generation")
+                return tokenizer.decode(result["tokens"], skip_special_tokens=True)
+            
+            generate_kwargs = self._generate_kwargs(temperature, top_p, max_new_tokens, deadline)
+            if speculative:
+                generate_kwargs["assistant_model"] = draft_model
+            
+            input_ids = self.encode(prompt).to(model.device)
+            inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+            self._record_prompt_tokens(call_site, input_ids.shape[1])
+            
+            output, forwards, elapsed = self.run_on("text", lambda: self._counted_generate(
+                model, **inputs, pad_token_id=tokenizer.eos_token_id, **generate_kwargs
+            ))
+            
+            new_tokens = output[0, inputs["input_ids"].shape[1]:]
+            self._record_generation("speculative" if speculative else "standard", len(new_tokens), elapsed, forwards)
+            self._local.token_counts = [(input_ids.shape[1], len(new_tokens))]
+            
+            # Output cut short by the deadline is discarded rather than parsed or cached
+            if deadline is not None:
+                deadline.check(f"end of {call_site} generation")
+            
+            return tokenizer.decode(new_tokens, skip_special_tokens=True)
+    
+    def _counted_generate(self, model, **kwargs):
+        """Run model.generate, counting its forward passes on the thread that runs it"""
+        self._local.forwards = {"target_forwards": 0, "draft_forwards": 0}
+        start = time.perf_counter()
+        try:
+            with torch.inference_mode():
+                output = model.generate(**kwargs)
+        finally:
+            forwards, self._local.forwards = self._local.forwards, None
+        return output, forwards, time.perf_counter() - start
+    
+    def run_on(self, model: str, fn):
+        """
+        Run a model call on that model's cores when core partitioning is on
+        
+        Args:
+            model: "vision" or "text"
+            fn: The model call
+            
+        Returns:
+            Whatever fn returns
+        """
+        if self.executors is None:
+            return fn()
+        return self.executors.run(model, fn)
+    
+    @staticmethod
+    def _generate_kwargs(temperature: float, top_p: float, max_new_tokens: int,
+                         deadline: Deadline = None) -> dict:
+        """Decoding arguments for model.generate shared by single and batched calls"""
+        generate_kwargs = {"max_new_tokens": max_new_tokens}
+        if temperature > 0:
+            generate_kwargs.update(do_sample=True, temperature=temperature, top_p=top_p)
+        else:
+            generate_kwargs["do_sample"] = False
+        if deadline is not None:
+            generate_kwargs["stopping_criteria"] = deadline.stopping_criteria()
+        return generate_kwargs
+    
+    def generate_batch(self, prompts: List[str], call_site: str = "default", temperature: float = 0.0,
+                       top_p: float = 1.0, max_new_tokens: int = None,
+                       deadline: Deadline = None) -> List[str]:
+        """
+        Run the language model on several prompts in one batched generate call
+        
+        Cached outputs are served first; the remaining prompts are left-padded
+        and decoded together. Speculative decoding is not used, since the
+        draft-assisted decoder only handles one sequence at a time.
+        
+        Args:
+            prompts: Prompt texts
+            call_site: Name of the calling stage
+            temperature: Sampling temperature (0 for greedy decoding)
+            top_p: Nucleus sampling probability mass
+            max_new_tokens: Generation length limit (Config.MAX_NEW_TOKENS if omitted)
+            deadline: Request deadline; generation stops at the next token once it expires
+            
+        Returns:
+            Generated text of each prompt, without the prompt, in prompt order
+            
+        Raises:
+            DeadlineExceeded: If the deadline expired before or during generation
+        """
+        if deadline is not None:
+            deadline.check(f"start of batched {call_site} generation")
+        
+        params = {"temperature": temperature, "top_p": top_p,
+                  "max_new_tokens": max_new_tokens or self.config.MAX_NEW_TOKENS}
+        outputs: List[Optional[str]] = [None] * len(prompts)
+        if self.cache is not None:
+            outputs = [self.cache.get(call_site, prompt, params) for prompt in prompts]
+        
+        pending = [i for i, text in enumerate(outputs) if text is None]
+        token_counts = [(0, 0)] * len(prompts)
+        if pending:
+            self._local.token_counts = [(0, 0)] * len(pending)
+            texts = self._generate_batch([prompts[i] for i in pending], call_site, deadline=deadline, **params)
+            for i, text, counts in zip(pending, texts, self._local.token_counts):
+                outputs[i] = text
+                token_counts[i] = counts
+                if self.cache is not None:
+                    self.cache.put(call_site, prompts[i], params, text)
+        self._local.token_counts = token_counts
+        return outputs
+    
+    def _generate_batch(self, prompts: List[str], call_site: str, temperature: float, top_p: float,
+                        max_new_tokens: int, deadline: Deadline = None) -> List[str]:
+        """Run the text model on left-padded prompts in one generate call"""
+        self._total_llm_calls += 1
+        self._local.calls = getattr(self._local, "calls", 0) + 1
+        
+        with self.lifecycle.hold(
+            "text", lambda: (self._tokenizer, self._text_model, self._engine)
+        ) as (tokenizer, model, engine):
+            if engine is not None:
+                return self._engine_generate_batch(engine, tokenizer, prompts, call_site, temperature, top_p,
+                                                   max_new_tokens, deadline)
+            pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+            
+            encoded = [self.encode(prompt)[0] for prompt in prompts]
+            length = max(len(ids) for ids in encoded)
+            input_ids = torch.full((len(encoded), length), pad_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(encoded), length), dtype=torch.long)
+            for row, ids in enumerate(encoded):
+                input_ids[row, length - len(ids):] = ids
+                attention_mask[row, length - len(ids):] = 1
+                self._record_prompt_tokens(call_site, len(ids))
+            
+            output, forwards, elapsed = self.run_on("text", lambda: self._counted_generate(
+                model,
+                input_ids=input_ids.to(model.device),
+                attention_mask=attention_mask.to(model.device),
+                pad_token_id=pad_id,
+                **self._generate_kwargs(temperature, top_p, max_new_tokens, deadline),
+            ))
+            
+            new_tokens = output[:, length:]
+            self._record_generation("standard", int((new_tokens != pad_id).sum()), elapsed, forwards)
+            self._local.token_counts = [(len(ids), int((tokens != pad_id).sum()))
+                                        for ids, tokens in zip(encoded, new_tokens)]
+            
+            if deadline is not None:
+                deadline.check(f"end of batched {call_site} generation")
+            
+            return [tokenizer.decode(tokens, skip_special_tokens=True) for tokens in new_tokens]
+    
+    def _engine_generate_batch(self, engine: GenerationEngine, tokenizer, prompts: List[str], call_site: str,
+                               temperature: float, top_p: float, max_new_tokens: int,
+                               deadline: Deadline = None) -> List[str]:
+        """Submit every prompt to the continuous batching engine and wait for all of them"""
+        futures, prompt_tokens = [], []
+        for prompt in prompts:
+            input_ids = self.encode(prompt)
+            self._record_prompt_tokens(call_site, input_ids.shape[1])
+            prompt_tokens.append(input_ids.shape[1])
+            futures.append(engine.submit(input_ids, max_new_tokens, temperature, top_p, deadline))
+        start = time.perf_counter()
+        results = [future.result() for future in futures]
+        self._record_generation("continuous", sum(len(r["tokens"]) for r in results), time.perf_counter() - start,
+                                {"target_forwards": max(r["forwards"] for r in results), "draft_forwards": 0})
+        self._local.token_counts = [(n, len(r["tokens"])) for n, r in zip(prompt_tokens, results)]
+        
+        if deadline is not None:
+            deadline.check(f"end of batched {call_site} generation")
+        
+        return [tokenizer.decode(result["tokens"], skip_special_tokens=True) for result in results]
+    
+    def engine_stats(self) -> dict:
+        """
+        Get continuous batching engine statistics
+        
+        Returns:
+            GenerationEngine.stats(), or an empty dict when the engine is off or the model is unloaded
+        """
+        engine = self._engine
+        return engine.stats() if engine is not None else {}
+    
+    def encode(self, text: str) -> torch.Tensor:
+        """
+        Tokenize text for the text model, reusing earlier results
+        
+        Prompts are counted while they are assembled and then generated from,
+        often several times, so their token ids are kept in an LRU cache.
+        
+        Args:
+            text: Text to tokenize
+            
+        Returns:
+            Token ids of shape (1, length)
+        """
+        with self._encodings_lock:
+            if text in self._encodings:
+                self._encodings.move_to_end(text)
+                return self._encodings[text]
+        
+        input_ids = self.tokenizer(text, return_tensors="pt")["input_ids"]
+        
+        with self._encodings_lock:
+            self._encodings[text] = input_ids
+            while len(self._encodings) > self.config.PROMPT_TOKEN_CACHE_SIZE:
+                self._encodings.popitem(last=False)
+        return input_ids
+    
+    def _record_prompt_tokens(self, call_site: str, tokens: int):
+        """Accumulate per-call-site prompt lengths"""
+        with self._stats_lock:
+            stats = self._prompt_token_stats.setdefault(call_site, {"calls": 0, "tokens": 0, "max": 0})
+            stats["calls"] += 1
+            stats["tokens"] += tokens
+            stats["max"] = max(stats["max"], tokens)
+    
+    def prompt_token_stats(self) -> dict:
+        """
+        Get prompt length statistics
+        
+        Returns:
+            Dict keyed by call site with calls, mean and max prompt tokens
+        """
+        with self._stats_lock:
+            return {
+                site: {"calls": stats["calls"], "mean": stats["tokens"] / stats["calls"], "max": stats["max"]}
+                for site, stats in self._prompt_token_stats.items()
+            }
+    
+    def _record_generation(self, mode: str, new_tokens: int, seconds: float, forwards: dict):
+        """Accumulate throughput and draft acceptance counters"""
+        with self._stats_lock:
+            stats = self._generation_stats[mode]
+            stats["calls"] += 1
+            stats["new_tokens"] += new_tokens
+            stats["seconds"] += seconds
+            stats["target_forwards"] += forwards["target_forwards"]
+            stats["draft_forwards"] += forwards["draft_forwards"]
+    
+    def reset_generation_stats(self):
+        """Clear the text generation throughput counters"""
+        with self._stats_lock:
+            for stats in self._generation_stats.values():
+                for key in stats:
+                    stats[key] = 0
+            self._prompt_token_stats.clear()
+    
+    def generation_stats(self) -> dict:
+        """
+        Get text generation throughput statistics
+        
+        Every verification pass of the target model yields one token of its
+        own plus the draft tokens it accepted, so accepted draft tokens are
+        new_tokens - target_forwards.
+        
+        Returns:
+            Dict keyed by decoding mode with calls, new_tokens, tokens_per_sec
+            and (for speculative decoding) acceptance_rate
+        """
+        with self._stats_lock:
+            report = {mode: dict(stats) for mode, stats in self._generation_stats.items()}
+        for mode, stats in report.items():
+            stats["tokens_per_sec"] = stats["new_tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+            if mode == "speculative":
+                accepted = max(stats["new_tokens"] - stats["target_forwards"], 0)
+                stats["acceptance_rate"] = accepted / stats["draft_forwards"] if stats["draft_forwards"] else 0.0
+        return report
+    
+    @property
+    def llm_calls(self) -> int:
+        """Number of LLM generations issued from the current thread"""
+        return getattr(self._local, "calls", 0)
+    
+    @property
+    def last_token_counts(self) -> List[Tuple[int, int]]:
+        """
+        (prompt, generated) token counts per prompt of the current thread's last
+        generate or generate_batch call, taken from the ids the model ran on;
+        (0, 0) where the output came from the LLM cache or a coalesced call
+        """
+        return getattr(self._local, "token_counts", [])
+    
+    @property
+    def total_llm_calls(self) -> int:
+        """Number of LLM generations issued from all threads"""
+        return self._total_llm_calls
+    
+    def save_snapshot(self, path: str):
+        """
+        Write the prepared models to a local snapshot for fast restarts
+        
+        Args:
+            path: Snapshot directory (point Config.MODEL_SNAPSHOT_DIR at it to use it)
+        """
+        self.initialize()
+        ModelSnapshot(path).save(
+            self._tokenizer, self._text_model, self._blip_processor, self._blip_model, self._draft_model
+        )
+        logger.info("Model snapshot saved to %s", path)
+    
+    def share_memory(self):
+        """
+        Move the loaded CPU weights into shared memory
+
+        Forked worker processes then map the same pages instead of each
+        holding a private copy of the weights.
+        """
+        self.initialize()
+        self._text_model.share_memory()
+        self._blip_model.share_memory()
+        if self._draft_model is not None:
+            self._draft_model.share_memory()
     
     @property
     def llm(self):
         """Get the language model"""
-        if not self._is_initialized:
-            self.initialize()
-        return self._llm
+        return self.lifecycle.use("text", lambda: self._llm)
+    
+    @property
+    def tokenizer(self):
+        """Get the text model tokenizer"""
+        return self.lifecycle.use("text", lambda: self._tokenizer)
     
     @property
     def blip_processor(self):
         """Get the BLIP processor"""
-        if not self._is_initialized:
-            self.initialize()
-        return self._blip_processor
+        return self.lifecycle.use("blip", lambda: self._blip_processor)
     
     @property
     def blip_model(self):
         """Get the BLIP model"""
-        if not self._is_initialized:
-            self.initialize()
-        return self._blip_model 
\ No newline at end of file
+        return self.lifecycle.use("blip", lambda: self._blip_model) 
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Token-budget-aware prompt assembly
+"""
+import re
+import textwrap
+import threading
+from typing import Dict, List, Optional
+from .config import Config
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def compact_prompt(text: str) -> str:
+    """
+    Remove the indentation and surrounding blank lines of a prompt literal
+
+    Args:
+        text: Prompt text, typically an indented triple-quoted string
+
+    Returns:
+        Prompt with each line stripped and runs of blank lines collapsed
+    """
+    lines = [line.strip() for line in textwrap.dedent(text).strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class PromptBuilder:
+    """Fills prompt templates, trimming one field so the prompt fits a token budget"""
+
+    def __init__(self, model_manager, token_budget: Optional[int] = None):
+        """
+        Args:
+            model_manager: ModelManager whose tokenizer (and token cache) is used for counting
+            token_budget: Maximum prompt length in tokens (Config.PROMPT_TOKEN_BUDGET if omitted;
+                None disables trimming)
+        """
+        self.model_manager = model_manager
+        self.config = Config()
+        self.token_budget = token_budget if token_budget is not None else self.config.PROMPT_TOKEN_BUDGET
+        self._lock = threading.Lock()
+        self._stats = {"built": 0, "trimmed": 0, "prompt_tokens": 0, "tokens_dropped": 0}
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens the text model sees for the text"""
+        return self.model_manager.encode(text).shape[-1]
+
+    def build(self, template: str, trim_field: str, **fields) -> str:
+        """
+        Fill a prompt template within the token budget
+
+        Args:
+            template: Compact prompt template with str.format placeholders
+            trim_field: Field shortened (by whole sentences where possible) when over budget
+            **fields: Values of the placeholders
+
+        Returns:
+            Filled prompt
+        """
+        prompt = template.format(**fields)
+        if self.token_budget is None:
+            self._record(self.count_tokens(prompt), 0)
+            return prompt
+
+        original_tokens = self.count_tokens(prompt)
+        prompt_tokens = original_tokens
+        if prompt_tokens > self.token_budget:
+            fixed_tokens = self.count_tokens(template.format(**dict(fields, **{trim_field: ""})))
+            allowed = self.token_budget - fixed_tokens
+            # Token counts of the parts do not add up exactly, so shrink until the whole fits
+            for _ in range(3):
+                trimmed = self.truncate(fields[trim_field], max(allowed, 0))
+                prompt = template.format(**dict(fields, **{trim_field: trimmed}))
+                prompt_tokens = self.count_tokens(prompt)
+                if prompt_tokens <= self.token_budget or allowed <= 0:
+                    break
+                allowed -= prompt_tokens - self.token_budget
+
+        self._record(prompt_tokens, original_tokens - prompt_tokens)
+        return prompt
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Shorten text to at most max_tokens, keeping whole sentences where possible
+
+        Args:
+            text: Text to shorten
+            max_tokens: Token limit
+
+        Returns:
+            The leading sentences that fit; if not even the first one does,
+            its first max_tokens tokens cut back to a word boundary
+        """
+        sentences = [s for s in _SENTENCE_END.split(text.strip()) if s]
+        kept: List[str] = []
+        used = 0
+        for sentence in sentences:
+            tokens = self.count_tokens(sentence)
+            if used + tokens > max_tokens:
+                break
+            kept.append(sentence)
+            used += tokens
+        if kept:
+            return " ".join(kept)
+        if not sentences or max_tokens <= 0:
+            return ""
+
+        ids = self.model_manager.encode(sentences[0])[0, :max_tokens]
+        partial = self.model_manager.tokenizer.decode(ids, skip_special_tokens=True)
+        return partial.rsplit(" ", 1)[0] if " " in partial else partial
+
+    def _record(self, prompt_tokens: int, dropped: int):
+        with self._lock:
+            self._stats["built"] += 1
+            self._stats["prompt_tokens"] += prompt_tokens
+            if dropped > 0:
+                self._stats["trimmed"] += 1
+                self._stats["tokens_dropped"] += dropped
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get prompt assembly statistics
+
+        Returns:
+            Dict with built, trimmed, tokens_dropped and mean_prompt_tokens
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mean_prompt_tokens"] = stats.pop("prompt_tokens") / stats["built"] if stats["built"] else 0.0
+        return stats
@@ -0,0 +1,119 @@
+"""
+Single-flight coalescing of identical in-flight work
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+from .config import Config
+from .deadline import Deadline, DeadlineExceeded
+
+
+class _Call:
+    """One in-flight computation and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs a computation once per key while it is in flight
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key before it finishes wait for and share its
+    result or exception instead of repeating the work. Nothing is kept once
+    the call completes, so this only suits idempotent work whose results
+    are cached elsewhere (or cheap enough to redo later).
+
+    A waiter stops waiting when its own deadline expires. If the leader was
+    stopped by its deadline, waiters with time left retry and one of them
+    becomes the new leader.
+    """
+
+    def __init__(self, name: str, enabled: Optional[bool] = None):
+        """
+        Args:
+            name: Stage name used in statistics
+            enabled: Coalesce calls (Config.SINGLE_FLIGHT_ENABLED if omitted); every call runs fn when False
+        """
+        self.name = name
+        self.enabled = Config.SINGLE_FLIGHT_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], deadline: Optional[Deadline] = None) -> Any:
+        """
+        Run fn, or wait for the identical call already in flight
+
+        Args:
+            key: Identity of the work (template id, URL, prompt, ...)
+            fn: Function computing the result
+            deadline: Request deadline bounding the wait for another caller's result
+
+        Returns:
+            Result of fn, possibly computed by another caller
+
+        Raises:
+            DeadlineExceeded: If the deadline expires while waiting
+        """
+        if not self.enabled:
+            with self._lock:
+                self._executed += 1
+            return fn()
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._executed += 1
+                else:
+                    self._coalesced += 1
+
+            if leader:
+                try:
+                    call.result = fn()
+                    return call.result
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+
+            self._wait(call, deadline)
+            if isinstance(call.error, DeadlineExceeded):
+                # The leader ran out of its own time; ours may still allow a retry
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    @staticmethod
+    def _wait(call: _Call, deadline: Optional[Deadline]):
+        """Wait for a leader, checking the waiter's deadline and cancellation"""
+        if deadline is None:
+            call.done.wait()
+            return
+        while not call.done.wait(0.05):
+            deadline.check("wait for shared in-flight work")
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get coalescing statistics
+
+        Returns:
+            Dict with executed and coalesced call counts and the coalesced share of all calls
+        """
+        with self._lock:
+            calls = self._executed + self._coalesced
+            return {
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+                "coalesced_rate": self._coalesced / calls if calls else 0.0,
+            }
@@ -0,0 +1,180 @@
+"""
+Structured logging with a background writer thread
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Dict, Optional
+from .config import Config
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_settings: Dict = {}
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fixed fraction of DEBUG records, per message template
+
+    Sampling is deterministic (the first record of a template is always
+    kept, then every 1/rate-th), so a rare message is never lost to chance.
+    Records at INFO and above always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count == 0 or int(count * self.rate) != int((count - 1) * self.rate)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the writer falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now so the queued record holds no references to caller objects;
+        # exc_info stays for the formatters behind the queue
+        record.msg = record.getMessage()
+        record.args = None
+        record.message = record.msg
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(verbose: bool = False, level: Optional[str] = None, fmt: Optional[str] = None,
+                      json_path: Optional[str] = None, sample_rate: Optional[float] = None):
+    """
+    Route the package's log records through a queue to a background writer
+
+    Callers only pay for a level check and, for kept records, merging the
+    message and a non-blocking queue put; JSON encoding and terminal or
+    file I/O happen on the writer thread. Calling it again replaces the
+    previous setup.
+
+    Args:
+        verbose: Log DEBUG records (model outputs, raw scores, captions)
+        level: Level name when not verbose (Config.LOG_LEVEL if omitted)
+        fmt: "text" or "json" console output (Config.LOG_FORMAT if omitted)
+        json_path: Also append every record as JSON lines to this file (Config.LOG_JSON_PATH if omitted)
+        sample_rate: Fraction of DEBUG records kept (Config.LOG_DEBUG_SAMPLE_RATE if omitted)
+    """
+    global _listener, _queue_handler
+    settings = {
+        "verbose": verbose,
+        "level": level or Config.LOG_LEVEL,
+        "fmt": fmt or Config.LOG_FORMAT,
+        "json_path": json_path if json_path is not None else Config.LOG_JSON_PATH,
+        "sample_rate": Config.LOG_DEBUG_SAMPLE_RATE if sample_rate is None else sample_rate,
+    }
+    if settings["fmt"] not in ("text", "json"):
+        raise ValueError(f"Unknown log format: {settings['fmt']}")
+
+    with _lock:
+        _stop()
+        _settings.clear()
+        _settings.update(settings)
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(JsonFormatter() if settings["fmt"] == "json" else logging.Formatter("%(message)s"))
+        handlers = [console]
+        if settings["json_path"]:
+            directory = os.path.dirname(settings["json_path"])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            json_file = logging.FileHandler(settings["json_path"], encoding="utf-8")
+            json_file.setFormatter(JsonFormatter())
+            handlers.append(json_file)
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(Config.LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter(settings["sample_rate"]))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers)
+        _listener.start()
+
+        package = logging.getLogger(__package__)
+        for handler in list(package.handlers):
+            package.removeHandler(handler)
+        package.addHandler(_queue_handler)
+        package.setLevel(logging.DEBUG if verbose else settings["level"])
+        package.propagate = False
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    with _lock:
+        _stop()
+
+
+def dropped_records() -> int:
+    """Records dropped because the writer queue was full"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _restart_in_child():
+    """Forked workers inherit the queue but not the writer thread, so give them their own"""
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        configure_logging(**_settings)
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
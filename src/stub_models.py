@@ -0,0 +1,190 @@
+"""
+Stand-in models with fixed latencies, for load and soak tests without model weights
+"""
+import time
+import random
+import threading
+from typing import List, Optional
+import numpy as np
+import torch
+from PIL import Image
+from .deadline import Deadline
+from .models import ModelManager
+from .image_processor import ImageProcessor
+from .meme_agent import MemeAgent
+
+_WORDS = [
+    "boss", "deadline", "coffee", "weekend", "printer", "meeting", "cat", "laptop", "wifi", "pizza",
+    "alarm", "email", "standup", "bug", "deploy", "rain", "traffic", "diet", "gym", "nap",
+]
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with a growing vocabulary, enough for prompt budgeting"""
+
+    pad_token_id = 0
+    eos_token_id = 0
+
+    def __init__(self):
+        self._ids = {}
+        self._words = [""]
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str, return_tensors: str = "pt"):
+        with self._lock:
+            ids = []
+            for word in text.split():
+                if word not in self._ids:
+                    self._ids[word] = len(self._words)
+                    self._words.append(word)
+                ids.append(self._ids[word])
+        return {"input_ids": torch.tensor([ids], dtype=torch.long)}
+
+    def decode(self, ids, skip_special_tokens: bool = True) -> str:
+        return " ".join(self._words[int(i)] for i in ids if int(i) != 0)
+
+
+class StubVisionEncoder:
+    """Returns image embeddings of the BLIP base model's shape; the stub's time is spent in decoding"""
+
+    def reset(self):
+        pass
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return torch.zeros(pixel_values.shape[0], 577, 768)
+
+
+class StubModelManager(ModelManager):
+    """
+    ModelManager whose models only take time
+
+    Text generation and BLIP calls hold one of `slots` model slots for a
+    fixed latency, like a CPU-bound model serving that many requests at
+    once, and return plausible outputs: two-line captions, humor scores
+    that pass the threshold at `accept_rate`, and scene descriptions.
+    Everything around the models (caching, single-flight, deadlines,
+    prompt budgeting, statistics) is the real code.
+    """
+
+    def __init__(self, llm_latency: float = 0.05, blip_latency: float = 0.05, slots: int = 1,
+                 accept_rate: float = 0.5, seed: Optional[int] = None):
+        """
+        Args:
+            llm_latency: Seconds per text generation call
+            blip_latency: Seconds per BLIP encode-and-decode
+            slots: Model calls that can run at the same time
+            accept_rate: Share of humor scores at or above Config.HUMOR_SCORE_THRESHOLD
+            seed: Seed for the generated outputs
+        """
+        super().__init__()
+        self.llm_latency = llm_latency
+        self.blip_latency = blip_latency
+        self.accept_rate = accept_rate
+        self._slots = threading.Semaphore(slots)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.blip_vision = StubVisionEncoder()
+
+    def _initialize_text_model(self):
+        self._tokenizer = StubTokenizer()
+
+    def _initialize_blip_model(self):
+        pass
+
+    def occupy(self, seconds: float, stage: str, deadline: Optional[Deadline] = None):
+        """Hold a model slot for the given time, stopping early once the deadline expires"""
+        with self._slots:
+            end = time.monotonic() + seconds
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    break
+                if deadline is not None and deadline.expired:
+                    break
+                time.sleep(min(remaining, 0.01))
+        if deadline is not None:
+            deadline.check(f"end of {stage}")
+
+    def _text(self, call_site: str) -> str:
+        with self._rng_lock:
+            words = self._rng.sample(_WORDS, 6)
+            accepted = self._rng.random() < self.accept_rate
+            threshold = self.config.HUMOR_SCORE_THRESHOLD
+            score = self._rng.randint(threshold, 10) if accepted else self._rng.randint(1, max(threshold - 1, 1))
+        if call_site == "caption":
+            return (f"\nTop text: When the {words[0]} meets the {words[1]} {words[2]}"
+                    f"\nBottom text: And the {words[3]} takes the {words[4]} {words[5]}")
+        if call_site == "scoring":
+            return f" {score}"
+        return f" A person with a {words[0]} stands next to a {words[1]} in a busy {words[2]}."
+
+    def _generate(self, prompt: str, call_site: str, temperature: float, top_p: float,
+                  max_new_tokens: int, deadline: Deadline = None) -> str:
+        self._total_llm_calls += 1
+        self._local.calls = getattr(self._local, "calls", 0) + 1
+        self._record_prompt_tokens(call_site, self.encode(prompt).shape[1])
+        start = time.perf_counter()
+        self.run_on("text", lambda: self.occupy(self.llm_latency, f"{call_site} generation", deadline))
+        text = self._text(call_site)
+        self._record_generation("standard", len(text.split()), time.perf_counter() - start,
+                                {"target_forwards": 0, "draft_forwards": 0})
+        self._local.token_counts = [(self.encode(prompt).shape[1], len(text.split()))]
+        return text
+
+    def _generate_batch(self, prompts: List[str], call_site: str, temperature: float, top_p: float,
+                        max_new_tokens: int, deadline: Deadline = None) -> List[str]:
+        self._total_llm_calls += 1
+        self._local.calls = getattr(self._local, "calls", 0) + 1
+        for prompt in prompts:
+            self._record_prompt_tokens(call_site, self.encode(prompt).shape[1])
+        start = time.perf_counter()
+        self.run_on("text", lambda: self.occupy(self.llm_latency, f"batched {call_site} generation", deadline))
+        texts = [self._text(call_site) for _ in prompts]
+        self._record_generation("standard", sum(len(t.split()) for t in texts), time.perf_counter() - start,
+                                {"target_forwards": 0, "draft_forwards": 0})
+        self._local.token_counts = [(self.encode(p).shape[1], len(t.split())) for p, t in zip(prompts, texts)]
+        return texts
+
+
+class StubImageProcessor(ImageProcessor):
+    """
+    ImageProcessor that downloads, decodes and tensorizes images for real but stubs BLIP
+
+    Used with StubModelManager, whose BLIP slot supplies the latency.
+    """
+
+    @property
+    def blip_image_size(self) -> int:
+        return 384
+
+    def _pixel_values(self, img: Image.Image) -> torch.Tensor:
+        size = self.blip_image_size
+        if img.size != (size, size):
+            img = img.resize((size, size), Image.BICUBIC)
+        array = np.asarray(img, dtype=np.float32) / 255.0
+        return torch.from_numpy(array).permute(2, 0, 1).unsqueeze(0)
+
+    def _decode_captions(self, image_embeds: torch.Tensor, prefixes: List[str],
+                         deadline: Optional[Deadline] = None) -> List[str]:
+        self.model_manager.occupy(self.model_manager.blip_latency, "image captioning", deadline)
+        return [f"{prefix} a person standing in a room".strip() for prefix in prefixes]
+
+
+def build_stub_agent(llm_latency: float = 0.05, blip_latency: float = 0.05, slots: int = 1,
+                     accept_rate: float = 0.5, seed: Optional[int] = None) -> MemeAgent:
+    """
+    MemeAgent running on stub models
+
+    Args:
+        llm_latency: Seconds per text generation call
+        blip_latency: Seconds per BLIP caption
+        slots: Model calls that can run at the same time
+        accept_rate: Share of humor scores that pass the threshold
+        seed: Seed for the generated outputs
+
+    Returns:
+        MemeAgent with StubModelManager and StubImageProcessor (Imgflip calls go to Config.IMGFLIP_API_URL)
+    """
+    agent = MemeAgent(StubModelManager(llm_latency, blip_latency, slots, accept_rate, seed))
+    agent.image_processor = StubImageProcessor(agent.model_manager)
+    return agent
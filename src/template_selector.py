@@ -0,0 +1,272 @@
+"""
+Adaptive meme template selection based on past humor scores
+"""
+import logging
+import os
+import re
+import json
+import math
+import atexit
+import random
+import threading
+from typing import Dict, List, Optional
+from .config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def keyword_cluster(keyword: str) -> str:
+    """
+    Map a keyword to its cluster key
+
+    Keywords that only differ in case, punctuation, word order or a plural
+    "s" share their statistics ("Cats", "cat" and "CAT!" all map to "cat").
+
+    Args:
+        keyword: Keyword as given by the user
+
+    Returns:
+        Normalized cluster key
+    """
+    tokens = re.findall(r"[a-z0-9]+", keyword.lower())
+    tokens = [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+    return " ".join(sorted(tokens))
+
+
+class TemplateStatsStore:
+    """
+    Persistent per-template and per-keyword-cluster acceptance statistics
+
+    Outcomes are counted in memory and saved every
+    TEMPLATE_STATS_SAVE_EVERY records and at exit. A save locks the file,
+    re-reads it and adds the outcomes recorded since the last save, so
+    worker processes and concurrent runs sharing the file merge their
+    counts instead of overwriting each other's.
+    """
+
+    def __init__(self, path: Optional[str] = None, save_every: Optional[int] = None):
+        """
+        Args:
+            path: JSON file to persist statistics to (in-memory only if None)
+            save_every: Records between saves (Config.TEMPLATE_STATS_SAVE_EVERY if omitted)
+        """
+        self.path = path
+        self.save_every = save_every or Config.TEMPLATE_STATS_SAVE_EVERY
+        self._lock = threading.Lock()
+        self._data = self._new_data()
+        # Outcomes recorded since the last save, merged into the file by the next one
+        self._unsaved = self._new_data()
+        self._unsaved_records = 0
+        self._pid = os.getpid()
+        if path:
+            if os.path.exists(path):
+                self._data = self._read()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _new_data() -> Dict:
+        return {"templates": {}, "clusters": {}}
+
+    def _read(self) -> Dict:
+        """Statistics in the file (empty if it is missing or unreadable)"""
+        data = self._new_data()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            data["templates"] = saved.get("templates", {})
+            data["clusters"] = saved.get("clusters", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Error loading template stats: %s", e)
+        return data
+
+    @staticmethod
+    def _merge(data: Dict, delta: Dict):
+        """Add the counts of delta into data"""
+        for template_id, stats in delta["templates"].items():
+            totals = data["templates"].setdefault(template_id, TemplateStatsStore._empty())
+            for field, count in stats.items():
+                totals[field] = totals.get(field, 0) + count
+        for cluster, templates in delta["clusters"].items():
+            cluster_data = data["clusters"].setdefault(cluster, {})
+            for template_id, stats in templates.items():
+                totals = cluster_data.setdefault(template_id, TemplateStatsStore._empty())
+                for field, count in stats.items():
+                    totals[field] = totals.get(field, 0) + count
+
+    def _save_locked(self):
+        """Merge the unsaved outcomes into the file under an exclusive file lock"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = self._read()
+            self._merge(data, self._unsaved)
+            # Unique per process and thread, so a crashed save never leaves a name another one reuses
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        # Other processes' outcomes now show up in this one's selections too
+        self._data = data
+        self._unsaved = self._new_data()
+        self._unsaved_records = 0
+
+    def flush(self):
+        """Save outcomes recorded since the last save"""
+        with self._lock:
+            if self._pid != os.getpid() or not self.path or not self._unsaved_records:
+                return
+            try:
+                self._save_locked()
+            except OSError as e:
+                logger.warning("Error saving template stats: %s", e)
+
+    @staticmethod
+    def _empty() -> Dict[str, int]:
+        return {"accepted": 0, "rejected": 0, "llm_calls": 0}
+
+    def record(self, keyword: str, template_id: str, accepted: bool, llm_calls: int):
+        """
+        Record the outcome of one attempt with a template
+
+        Args:
+            keyword: Keyword the meme was generated for
+            template_id: Imgflip template ID
+            accepted: Whether the meme reached the humor threshold
+            llm_calls: LLM generations spent on the attempt
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker inherits the parent's unsaved outcomes, which the parent saves itself
+                self._unsaved, self._unsaved_records, self._pid = self._new_data(), 0, os.getpid()
+            cluster = keyword_cluster(keyword)
+            for data in (self._data, self._unsaved):
+                for stats in (data["templates"].setdefault(template_id, self._empty()),
+                              data["clusters"].setdefault(cluster, {}).setdefault(template_id, self._empty())):
+                    stats["accepted" if accepted else "rejected"] += 1
+                    stats["llm_calls"] += llm_calls
+            self._unsaved_records += 1
+
+            if self.path and self._unsaved_records >= self.save_every:
+                try:
+                    self._save_locked()
+                except OSError as e:
+                    logger.warning("Error saving template stats: %s", e)
+
+    def get(self, template_id: str, keyword: Optional[str] = None) -> Dict[str, int]:
+        """
+        Get the statistics of a template
+
+        Args:
+            template_id: Imgflip template ID
+            keyword: If given, return the statistics for the keyword's cluster
+
+        Returns:
+            Dict with accepted, rejected and llm_calls counts
+        """
+        with self._lock:
+            if keyword is None:
+                stats = self._data["templates"].get(template_id)
+            else:
+                stats = self._data["clusters"].get(keyword_cluster(keyword), {}).get(template_id)
+            return dict(stats) if stats else self._empty()
+
+
+class TemplateSelector:
+    """Multi-armed bandit over candidate templates minimizing LLM calls per accepted meme"""
+
+    def __init__(self, store: Optional[TemplateStatsStore] = None, strategy: Optional[str] = None,
+                 rng: Optional[random.Random] = None):
+        """
+        Args:
+            store: Statistics store (Config.TEMPLATE_STATS_PATH if omitted)
+            strategy: "thompson" or "ucb" (Config.TEMPLATE_SELECTION_STRATEGY if omitted)
+            rng: Random generator, for reproducible selection
+        """
+        self.config = Config()
+        self.store = store if store is not None else TemplateStatsStore(self.config.TEMPLATE_STATS_PATH)
+        self.strategy = strategy or self.config.TEMPLATE_SELECTION_STRATEGY
+        self.rng = rng or random.Random()
+
+        if self.strategy not in ("thompson", "ucb"):
+            raise ValueError(f"Unknown template selection strategy: {self.strategy}")
+
+    def _posterior(self, template_id: str, keyword: str):
+        """Beta posterior on acceptance and mean LLM calls per attempt for a template"""
+        cluster = self.store.get(template_id, keyword)
+        overall = self.store.get(template_id)
+        weight = self.config.TEMPLATE_GLOBAL_PRIOR_WEIGHT
+
+        # Cluster statistics dominate; the template's overall record acts as a prior
+        alpha = 1 + cluster["accepted"] + weight * (overall["accepted"] - cluster["accepted"])
+        beta = 1 + cluster["rejected"] + weight * (overall["rejected"] - cluster["rejected"])
+
+        attempts = overall["accepted"] + overall["rejected"]
+        mean_calls = overall["llm_calls"] / attempts if attempts else 1.0
+        return alpha, beta, max(mean_calls, 1.0)
+
+    def _values(self, keyword: str, candidates: List[Dict]) -> List[float]:
+        """Score each candidate by (sampled or optimistic) acceptance per LLM call"""
+        posteriors = [self._posterior(t["id"], keyword) for t in candidates]
+
+        if self.strategy == "thompson":
+            return [self.rng.betavariate(a, b) / calls for a, b, calls in posteriors]
+
+        total = sum(a + b - 2 for a, b, _ in posteriors) + 1
+        return [
+            (a / (a + b) + math.sqrt(2 * math.log(total) / (a + b - 1))) / calls
+            for a, b, calls in posteriors
+        ]
+
+    def select(self, keyword: str, candidates: List[Dict]) -> Dict:
+        """
+        Pick a template for the keyword
+
+        Args:
+            keyword: Main keyword for the meme
+            candidates: Templates matching the keyword
+
+        Returns:
+            Selected template dict
+        """
+        if len(candidates) == 1:
+            return candidates[0]
+        return self.select_many(keyword, candidates, 1)[0]
+
+    def select_many(self, keyword: str, candidates: List[Dict], k: int) -> List[Dict]:
+        """
+        Pick the k most promising distinct templates for the keyword
+
+        Args:
+            keyword: Main keyword for the meme
+            candidates: Templates matching the keyword
+            k: Number of templates to pick
+
+        Returns:
+            Up to k template dicts, best first
+        """
+        values = self._values(keyword, candidates)
+        # Ties (e.g. no data yet) keep the search order, so the first match wins
+        order = sorted(range(len(candidates)), key=lambda i: (-values[i], i))
+        return [candidates[i] for i in order[:k]]
+
+    def record(self, keyword: str, template: Dict, accepted: bool, llm_calls: int):
+        """
+        Feed an attempt's outcome back into the statistics
+
+        Args:
+            keyword: Keyword the meme was generated for
+            template: Template used for the attempt
+            accepted: Whether the meme reached the humor threshold
+            llm_calls: LLM generations spent on the attempt
+        """
+        self.store.record(keyword, template["id"], accepted, llm_calls)
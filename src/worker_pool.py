@@ -0,0 +1,120 @@
+"""
+Multi-process execution mode sharing one copy of the model weights
+"""
+import logging
+import os
+import multiprocessing as mp
+from typing import Iterable, Iterator, List, Optional, Tuple
+from .config import Config
+from .meme_agent import MemeAgent
+from .dedup import CaptionDeduplicator
+
+logger = logging.getLogger(__name__)
+
+# Agent inherited by forked workers. It is set in the parent right before the
+# pool is created, so children see the already-loaded weights copy-on-write.
+_worker_agent: Optional[MemeAgent] = None
+# Keyword and caption index of this worker's current keyword. Workers do not see
+# each other's captions, so near-duplicates are only rejected within one worker.
+_worker_dedup: Optional[Tuple[str, CaptionDeduplicator]] = None
+
+
+def _init_worker(torch_threads: int, counter, pin_cores: bool):
+    """Pin the worker to its own slice of cores and size torch's thread pool"""
+    import torch
+
+    with counter.get_lock():
+        worker_index = counter.value
+        counter.value += 1
+
+    if pin_cores and hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        start = (worker_index * torch_threads) % len(cores)
+        os.sched_setaffinity(0, cores[start:start + torch_threads] or cores)
+
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _run_keyword(job: Tuple[str, int]) -> Tuple[str, Optional[str]]:
+    """Generate one meme inside a worker process"""
+    global _worker_dedup
+
+    keyword, retry_limit = job
+    # The index covers one keyword's batch, like generate_multiple_memes, so it does not grow for the pool's life
+    if _worker_dedup is None or _worker_dedup[0] != keyword:
+        _worker_dedup = (keyword, CaptionDeduplicator())
+    try:
+        return keyword, _worker_agent.generate_meme(keyword, retry_limit, dedup_index=_worker_dedup[1])
+    finally:
+        # Pool workers exit without running atexit handlers, so save template outcomes per meme
+        if _worker_agent.template_selector is not None:
+            _worker_agent.template_selector.store.flush()
+
+
+class WorkerPool:
+    """Fork-based process pool whose workers share the parent's loaded models"""
+
+    def __init__(self, num_workers: Optional[int] = None, torch_threads: Optional[int] = None,
+                 agent: Optional[MemeAgent] = None):
+        """
+        Args:
+            num_workers: Number of worker processes (Config.WORKER_PROCESSES if omitted)
+            torch_threads: Intra-op threads per worker (cores split evenly if omitted)
+            agent: Already-initialized agent to share with the workers
+        """
+        self.config = Config()
+        self.num_workers = num_workers or self.config.WORKER_PROCESSES
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        self.torch_threads = torch_threads or self.config.WORKER_TORCH_THREADS or max(1, cores // self.num_workers)
+        self.agent = agent or MemeAgent()
+
+    def imap(self, keywords: Iterable[str], retry_limit: int = 3) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Generate one meme per keyword across the worker processes
+
+        Keywords are handed out one at a time, so a worker stuck on a slow
+        keyword does not hold back the others. Each worker keeps its own
+        caption index for its current keyword, so a caption is only rejected
+        as a near-duplicate of captions from the same worker for the same
+        keyword; two workers can still return similar memes.
+
+        Args:
+            keywords: Keywords to generate memes for
+            retry_limit: Maximum number of retry attempts per meme
+
+        Returns:
+            Iterator of (keyword, meme_url) pairs in completion order
+        """
+        global _worker_agent
+
+        # Weights must live in shared pages before fork so workers never copy them
+        if self.config.WORKER_SHARE_MEMORY:
+            self.agent.model_manager.share_memory()
+        _worker_agent = self.agent
+
+        ctx = mp.get_context("fork")
+        counter = ctx.Value("i", 0)
+        jobs = ((keyword, retry_limit) for keyword in keywords)
+
+        logger.info("Starting %d workers with %d torch threads each", self.num_workers, self.torch_threads)
+        logger.info("Near-duplicate captions are rejected per worker, not across the %d workers", self.num_workers)
+        with ctx.Pool(
+            self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.torch_threads, counter, self.config.WORKER_PIN_CORES),
+        ) as pool:
+            yield from pool.imap_unordered(_run_keyword, jobs, chunksize=1)
+
+    def generate_memes(self, keywords: Iterable[str], retry_limit: int = 3) -> List[Tuple[str, Optional[str]]]:
+        """
+        Generate one meme per keyword and collect the results
+
+        Args:
+            keywords: Keywords to generate memes for
+            retry_limit: Maximum number of retry attempts per meme
+
+        Returns:
+            List of (keyword, meme_url) pairs
+        """
+        return list(self.imap(keywords, retry_limit))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Train the humor pre-filter classifier from logged LLM scores
+
+Set HUMOR_SCORE_LOG_PATH while generating memes to collect scores, then:
+    python train_prefilter.py --log scores.jsonl --output prefilter.npz
+    export PREFILTER_CLASSIFIER_PATH=prefilter.npz
+"""
+
+import argparse
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import numpy as np
+
+from src.config import Config
+from src.humor_filter import CaptionClassifier, CaptionEmbedder, load_score_log
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Train the humor pre-filter classifier")
+    parser.add_argument("--log", required=True, help="JSONL humor score log")
+    parser.add_argument("--output", required=True, help="Where to save the classifier (.npz)")
+    parser.add_argument(
+        "--embedding-model",
+        default=Config.PREFILTER_EMBEDDING_MODEL,
+        help="sentence-transformers model name, or 'hashing' (default: %(default)s)"
+    )
+    parser.add_argument("--epochs", type=int, default=300, help="Training epochs (default: 300)")
+    args = parser.parse_args()
+
+    records = load_score_log(args.log)
+    print(f"Loaded {len(records)} scored captions")
+
+    embedder = CaptionEmbedder(args.embedding_model)
+    classifier = CaptionClassifier.train(records, embedder, epochs=args.epochs)
+    classifier.save(args.output)
+
+    # Report how many training captions the cascade would settle without the LLM
+    probs = np.array([classifier.predict_proba(embedder.embed(r["top_text"], r["bottom_text"])) for r in records])
+    labels = np.array([r["score"] >= Config.HUMOR_SCORE_THRESHOLD for r in records])
+    settled = (probs < Config.PREFILTER_REJECT_BELOW) | (probs > Config.PREFILTER_ACCEPT_ABOVE)
+    correct = (probs > 0.5) == labels
+
+    print(f"Training accuracy: {correct.mean():.1%}")
+    print(f"Settled without the LLM: {settled.mean():.1%} (accuracy {correct[settled].mean() if settled.any() else 0:.1%})")
+    print(f"Classifier saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()